@@ -0,0 +1,114 @@
+import numpy as np
+from parser.ibsen_parser import get_mean_column
+from parser.ibsen_spectrum import working_dtype
+"""
+Calibration kernel (level 0 to level 1)
+
+The nonlinearity curve is resampled onto a uniform DN grid, a lookup is an
+index computation plus one linear step instead of a binary search per
+element. For the uniform curves written by extract_nonlinearity the lookup
+reproduces np.interp(dn, DN, correction). The response factors are
+resampled once per instrument wavelength grid.
+
+apply: tdata = (tdata - dark) / nonlinearity(tdata - dark) / (IntTime * response)
+    mean, data_sample_std over the calibrated scans (set_calibrated_statistics), the
+    same fit inputs as parsing the level 1 file written by level0to1.write_to_file
+
+Usage:
+    kernel = CalibrationKernel.from_files('nonlinearity_correction.txt', 'response.txt')
+    kernel.save('kernel.npz')
+    cal_dict = CalibrationKernel.load('kernel.npz').apply(parse_ibsen_file(meas), parse_ibsen_file(dark))
+"""
+
+
+def set_calibrated_statistics(cal_dict):
+    """ 'mean' and 'data_sample_std' of the calibrated scans, as parse_ibsen_file returns them for level 1 files """
+    cal_dict['mean'] = np.mean(cal_dict['tdata'], axis=0, dtype=np.float64)
+    cal_dict['data_sample_std'] = np.std(cal_dict['tdata'], axis=0, ddof=1, dtype=np.float64)
+    return cal_dict
+
+
+class CalibrationKernel(object):
+
+    def __init__(self, DN, correction, wave, response, dn_step=None, instrument_wave=None):
+        """
+        Args:
+            DN, correction: nonlinearity curve (DN strictly increasing, ValueError otherwise)
+            wave, response: response factors
+            dn_step: step of the uniform DN grid, default the smallest step of DN
+        """
+        DN = np.asarray(DN, dtype=np.float64)
+        if DN.size < 2 or not np.all(np.diff(DN) > 0):
+            raise ValueError('Nonlinearity curve needs at least two strictly increasing DN values')
+        if dn_step is not None and dn_step <= 0:
+            raise ValueError('dn_step has to be positive, got %s' % dn_step)
+        self.dn_step = float(dn_step or np.diff(DN).min())
+        self.dn_start = float(DN[0])
+        grid = self.dn_start + self.dn_step * np.arange(int(np.ceil((DN[-1] - DN[0]) / self.dn_step)) + 1)
+        self.lut = np.interp(grid, DN, correction)
+        self.slope = np.append(np.diff(self.lut), 0.)
+        self.wave = np.asarray(wave, dtype=np.float64)
+        self.response = np.asarray(response, dtype=np.float64)
+        self.instrument_wave = None
+        self.instrument_response = None
+        if instrument_wave is not None:
+            self.response_on(instrument_wave)
+
+    @classmethod
+    def from_files(cls, nonlinear_correction_file, response_file, dn_step=None, instrument_wave=None):
+        non_linear = np.genfromtxt(nonlinear_correction_file, skip_header=1, delimiter=',')
+        response = np.genfromtxt(response_file, skip_header=1, delimiter=',')
+        return cls(non_linear[:, 0], non_linear[:, 1], response[:, 0], response[:, 1], dn_step, instrument_wave)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as npz:
+            kernel = cls.__new__(cls)
+            for key in ['lut', 'slope', 'wave', 'response']:
+                setattr(kernel, key, npz[key])
+            kernel.dn_start, kernel.dn_step = [float(value) for value in npz['dn_grid']]
+            kernel.instrument_wave = npz['instrument_wave'] if npz['instrument_wave'].size else None
+            kernel.instrument_response = npz['instrument_response'] if npz['instrument_response'].size else None
+        return kernel
+
+    def save(self, filename):
+        empty = np.array([])
+        np.savez(filename, lut=self.lut, slope=self.slope, wave=self.wave, response=self.response,
+                 dn_grid=np.array([self.dn_start, self.dn_step]),
+                 instrument_wave=empty if self.instrument_wave is None else self.instrument_wave,
+                 instrument_response=empty if self.instrument_response is None else self.instrument_response)
+
+    def nonlinearity(self, dn):
+        """ np.interp(dn, DN, correction) by direct index into the uniform grid """
+        position = (np.asarray(dn) - self.dn_start) * (1. / self.dn_step)
+        np.clip(position, 0, len(self.lut) - 1, out=position)
+        index = np.minimum(position.astype(np.intp), len(self.lut) - 2)
+        position -= index
+        return self.lut[index] + position * self.slope[index]
+
+    def response_on(self, wave):
+        """ Response factors on the instrument grid, resampled once per grid """
+        if self.instrument_wave is None or not np.array_equal(self.instrument_wave, wave):
+            self.instrument_wave = np.array(wave, dtype=np.float64)
+            self.instrument_response = np.interp(self.instrument_wave, self.wave, self.response)
+        return self.instrument_response
+
+    def apply(self, data_dict, dark_dict=None):
+        """
+        Calibrate a parsed raw measurement in one pass over the scans
+        Args:
+            dark_dict: parsed darkcurrent, None if data_dict is already darkcurrent corrected
+        Return:
+            data_dict with calibrated 'tdata', 'data', 'mean', 'data_sample_std' (same as level0to1.calibrate_meas)
+        """
+        dtype = working_dtype(data_dict['tdata'])
+        tdata = np.array(data_dict['tdata'], dtype=dtype)
+        if not data_dict['darkcurrent_corrected']:
+            assert dark_dict['Type'] == 'darkcurrent', 'Second parameter has to be darkcurrent'
+            tdata -= get_mean_column(dark_dict).astype(dtype)
+        tdata /= self.nonlinearity(tdata)
+        tdata *= (1. / (data_dict['IntTime'] * self.response_on(data_dict['wave']))).astype(dtype)
+        data_dict['tdata'] = tdata
+        data_dict['data'] = np.transpose(tdata)
+        data_dict['darkcurrent_corrected'] = True
+        return set_calibrated_statistics(data_dict)
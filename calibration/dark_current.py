@@ -0,0 +1,196 @@
+import glob
+import logging
+import numpy as np
+from parser.ibsen_parser import parse_ibsen_file
+from parser.ibsen_loader import parse_files
+"""
+Dark current / offset regression
+
+Per channel linear model dark = offset + rate * IntTime, solved for all
+channels at once with the closed form weighted least squares solution.
+The integration time axis is centered before solving to keep the normal
+equations well conditioned.
+
+fit_dict:
+    {'offset': array([..]) shape(..., channels), bias [DN],
+     'rate': array([..]) shape(..., channels), dark rate [DN/ms],
+     'residual': array([..]) shape(..., channels), weighted rms of the residuals [DN],
+     'offset_std': array([..]) shape(..., channels),
+     'rate_std': array([..]) shape(..., channels)}
+
+DarkModel: persisted per instrument fit, synthesizes the dark frame for any
+IntTime (and temperature, if fitted from series at several temperatures)
+where no darkcurrent file was measured.
+
+Usage:
+    python dark_current.py -d /path/to/dark/series/ -o dark_model.npz
+"""
+
+
+def fit_dark_current(int_times, dark, weights=None):
+    """
+    Args:
+        int_times: shape(..., IntTimes), leading axes are independent series
+        dark: shape(..., IntTimes, channels), dark signal (mean over scans)
+        weights: None, shape(..., IntTimes) or shape(..., IntTimes, channels), inverse variance
+    Return:
+        fit_dict, std from the residual variance like np.polyfit(cov=True), nan with only two IntTimes
+    """
+    x = np.asarray(int_times, dtype=np.float64)[..., np.newaxis]
+    dark = np.asarray(dark, dtype=np.float64)
+    if weights is None:
+        weights = np.ones_like(x)
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim == x.ndim - 1:
+            weights = weights[..., np.newaxis]
+    weights = np.broadcast_to(weights, np.broadcast(x, dark).shape)
+    sum_w = weights.sum(axis=-2)
+    x_mean = (weights * x).sum(axis=-2) / sum_w
+    dx = x - x_mean[..., np.newaxis, :]
+    sxx = (weights * dx ** 2).sum(axis=-2)
+    rate = (weights * dx * dark).sum(axis=-2) / sxx
+    offset = (weights * dark).sum(axis=-2) / sum_w - rate * x_mean
+
+    residual = dark - offset[..., np.newaxis, :] - rate[..., np.newaxis, :] * x
+    rss = (weights * residual ** 2).sum(axis=-2)
+    dof = dark.shape[-2] - 2
+    variance = rss / dof if dof > 0 else np.full_like(rss, np.nan)
+    return {'offset': offset,
+            'rate': rate,
+            'residual': np.sqrt(rss / sum_w),
+            'offset_std': np.sqrt(variance * (1. / sum_w + x_mean ** 2 / sxx)),
+            'rate_std': np.sqrt(variance / sxx)}
+
+
+def stack_dark(cal_dict, key='darkcurrent'):
+    """ Return: IntTimes shape(IntTimes,), dark mean shape(IntTimes, channels) of sort_ibsen_by_int output """
+    int_times = np.array(sorted(cal_dict.keys()))
+    return int_times, np.array([cal_dict[int_time][key]['mean'] for int_time in int_times])
+
+
+class DarkModel(object):
+    """
+    dark = offset + rate * IntTime
+           + (temperature_offset + temperature_rate * IntTime) * (temperature - reference_temperature)
+    """
+    KEYS = ['offset', 'rate', 'residual', 'wave', 'temperature_offset', 'temperature_rate']
+
+    def __init__(self, offset, rate, residual=None, wave=None, temperature_offset=None, temperature_rate=None,
+                 reference_temperature=None):
+        self.offset = np.asarray(offset, dtype=np.float64)
+        self.rate = np.asarray(rate, dtype=np.float64)
+        self.residual = np.zeros_like(self.offset) if residual is None else np.asarray(residual, dtype=np.float64)
+        self.wave = None if wave is None else np.asarray(wave, dtype=np.float64)
+        self.temperature_offset = None if temperature_offset is None else np.asarray(temperature_offset, dtype=np.float64)
+        self.temperature_rate = None if temperature_rate is None else np.asarray(temperature_rate, dtype=np.float64)
+        self.reference_temperature = reference_temperature
+
+    @classmethod
+    def from_fit(cls, fit_dict, wave=None):
+        return cls(fit_dict['offset'], fit_dict['rate'], fit_dict['residual'], wave)
+
+    @classmethod
+    def from_spectra(cls, spectra, temperatures=None):
+        """
+        Args:
+            spectra: parsed darkcurrent files, several IntTimes (means of equal IntTimes are averaged)
+            temperatures: optional temperature per spectrum, fits the temperature terms (two temperatures at least)
+        """
+        temperatures = [None] * len(spectra) if temperatures is None else list(temperatures)
+        series = dict()
+        for spectrum, temperature in zip(spectra, temperatures):
+            series.setdefault(temperature, dict()).setdefault(spectrum['IntTime'], []).append(spectrum['mean'])
+        wave = spectra[0]['wave']
+        fits = []
+        for temperature in sorted(series.keys()):
+            int_times = np.array(sorted(series[temperature].keys()))
+            dark = np.array([np.mean(series[temperature][int_time], axis=0) for int_time in int_times])
+            fits.append(fit_dark_current(int_times, dark))
+        if len(fits) == 1:
+            return cls.from_fit(fits[0], wave)
+        temperatures = np.array(sorted(series.keys()), dtype=np.float64)
+        reference_temperature = temperatures.mean()
+        offsets = fit_dark_current(temperatures - reference_temperature, np.array([fit['offset'] for fit in fits]))
+        rates = fit_dark_current(temperatures - reference_temperature, np.array([fit['rate'] for fit in fits]))
+        residual = np.sqrt(np.mean([fit['residual'] ** 2 for fit in fits], axis=0))
+        return cls(offsets['offset'], rates['offset'], residual, wave, offsets['rate'], rates['rate'], reference_temperature)
+
+    @classmethod
+    def from_files(cls, files, temperatures=None):
+        return cls.from_spectra(parse_files(files), temperatures)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as npz:
+            items = dict((key, npz[key] if npz[key].size else None) for key in cls.KEYS)
+            reference_temperature = float(npz['reference_temperature'])
+        return cls(reference_temperature=None if np.isnan(reference_temperature) else reference_temperature, **items)
+
+    def save(self, filename):
+        empty = np.array([])
+        items = dict((key, empty if getattr(self, key) is None else getattr(self, key)) for key in self.KEYS)
+        reference_temperature = np.nan if self.reference_temperature is None else self.reference_temperature
+        np.savez(filename, reference_temperature=reference_temperature, **items)
+
+    def dark(self, int_time, temperature=None):
+        """
+        Return: dark mean shape(channels,) for the IntTime [ms]
+        A temperature fitted model without temperature is evaluated at the reference temperature (warning)
+        """
+        dark = self.offset + self.rate * int_time
+        if self.temperature_offset is None:
+            return dark
+        if temperature is None:
+            logging.warning('Dark model fitted over temperature, no temperature given: using %.2f'
+                            % self.reference_temperature)
+            return dark
+        return dark + (self.temperature_offset + self.temperature_rate * int_time) * (temperature - self.reference_temperature)
+
+    def check_wave(self, wave):
+        """ Raise ValueError unless the model channels are the channels of wave """
+        wave = np.asarray(wave, dtype=np.float64)
+        if wave.shape != self.offset.shape[-1:]:
+            raise ValueError('Dark model of %s channels, measurement of %s' % (self.offset.shape[-1], len(wave)))
+        if self.wave is not None and not np.allclose(self.wave, wave, atol=1e-3):
+            raise ValueError('Dark model wavelengths differ from the measurement')
+
+    def dark_dict(self, int_time, temperature=None, wave=None):
+        """ Synthetic darkcurrent ibsen_dict, one scan equal to the model mean, checked against wave if given """
+        if wave is not None:
+            self.check_wave(wave)
+        mean = self.dark(int_time, temperature)
+        return {'Type': 'darkcurrent', 'IntTime': int_time, 'wave': self.wave, 'mean': mean,
+                'tdata': mean[np.newaxis], 'data': mean[:, np.newaxis], 'num_of_meas': 1,
+                'darkcurrent_corrected': False, 'UTCTime': None}
+
+    def deviation(self, dark_dict, temperature=None):
+        """ Return: median over channels of |measured - model| / fit residual """
+        difference = np.abs(np.mean(dark_dict['tdata'], axis=0) - self.dark(dark_dict['IntTime'], temperature))
+        return np.median(difference / np.maximum(self.residual, 1e-6))
+
+
+def get_dark(dark_file, int_time, dark_model=None, temperature=None, tolerance=10.):
+    """
+    Dark for a measurement: the darkcurrent file if there is one (checked against the model),
+    otherwise the dark synthesized by dark_model for int_time
+    """
+    if dark_file is None:
+        if dark_model is None:
+            raise IOError('Neither darkcurrent file nor dark model for IntTime %s' % int_time)
+        return dark_model.dark_dict(int_time, temperature)
+    dark_dict = parse_ibsen_file(dark_file)
+    if dark_model is not None and dark_model.deviation(dark_dict, temperature) > tolerance:
+        logging.warning('%s deviates from the dark model' % dark_file)
+    return dark_dict
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--directory', help='Directory with darkcurrent files of several integration times')
+    parser.add_argument('-o', '--output', default='dark_model.npz', help='Dark model file')
+    args = parser.parse_args()
+    model = DarkModel.from_files(sorted(glob.glob('%sdarkcurrent*.asc' % args.directory)))
+    model.save(args.output)
+    print('Dark model of %s channels, median residual %.3f DN' % (len(model.offset), np.median(model.residual)))
@@ -3,7 +3,6 @@ import pandas as pd
 import matplotlib.gridspec as gridspec
 import scipy.interpolate as inter
 import matplotlib.pyplot as plt
-from numpy.testing import assert_array_equal
 from matplotlib.font_manager import FontProperties
 
 FONTSTYLE = 'serif'
@@ -14,63 +13,133 @@ fontP.set_family(FONTSTYLE)
 fontP.set_size('small')
 
 
-def generate_nonlinear_correction(cal_dict, nonlinear_config, noise_dict):
+def generate_nonlinear_correction(cal_dict, nonlinear_config, noise_dict, output_file='nonlinearity_correction.txt', plot=True):
     nonlinear_correction_dict = dict()
-    DN, nonlinear_correction = calculate_nonlinearity_factors(cal_dict, nonlinear_config, noise_dict)
+    DN, nonlinear_correction = calculate_nonlinearity_factors(cal_dict, nonlinear_config, noise_dict, plot=plot)
     nonlinear_correction_dict['DN'] = DN
     nonlinear_correction_dict['nonlinear']= nonlinear_correction
     frame = pd.DataFrame(np.transpose([DN, nonlinear_correction]), columns=['DN', 'nonlinear_correction'])
-    frame.to_csv('nonlinearity_correction.txt', index=False)
+    frame.to_csv(output_file, index=False)
     return nonlinear_correction_dict
 
 
-def calculate_nonlinearity_factors(cal_dict, nonlinear_config, noise_dict):
+def get_dn_matrix(cal_dict, noise_dict, out=None):
+    """
+    Args:
+        out: optional preallocated array shape(channels, IntTimes)
+    Return:
+        DN matrix shape(channels, IntTimes), offset corrected reference means, IntTimes sorted
+    """
+    intTimes_sorted = sorted(cal_dict.keys())
+    if out is None:
+        out = np.empty((len(noise_dict['noise']), len(intTimes_sorted)))
+    for column, intTime in enumerate(intTimes_sorted):
+        np.subtract(cal_dict[intTime]['reference']['mean'], noise_dict['noise'], out=out[:, column])
+    return out
+
+
+def interp_rows(x, xp, fp):
+    """ np.interp(x, xp[i], fp) for every row i of xp (rows increasing), clipped like np.interp """
+    upper = np.clip((xp <= x).sum(axis=1), 1, xp.shape[1] - 1)
+    lower = upper - 1
+    rows = np.arange(xp.shape[0])
+    x0, x1 = xp[rows, lower], xp[rows, upper]
+    result = fp[lower] + (x - x0) * (fp[upper] - fp[lower]) / (x1 - x0)
+    result = np.where(x <= xp[:, 0], fp[0], result)
+    return np.where(x >= xp[:, -1], fp[-1], result)
+
+
+def kernel_smooth(x, y, grid, sigma, bin_width=None, truncate=8.):
+    """
+    Gaussian Nadaraya-Watson estimate sum(K(x - g) * y) / sum(K(x - g)) on the uniform grid.
+    x and y are linearly binned onto bins of bin_width (default min(grid step, sigma / 20))
+    aligned with the grid and convolved with the kernel truncated at truncate * sigma,
+    O(bins * kernel) instead of O(len(x) * len(grid)).
+    Tolerance against the direct evaluation: relative deviation below 1e-5 for
+    bin_width <= sigma / 20, the linear binning conserves the first moment and leaves
+    an error of order (bin_width / sigma) ** 2. Grid points in DN gaps, where the truncated
+    kernel holds (almost) no weight, are evaluated directly with weights relative to the
+    nearest sample, the estimate there tends to the nearest sample value instead of NaN.
+    """
+    step = grid[1] - grid[0] if len(grid) > 1 else sigma
+    oversample = int(np.ceil(step / (bin_width or min(step, sigma / 20.))))
+    bin_width = step / oversample
+    position = (np.asarray(x, dtype=np.float64) - grid[0]) / bin_width
+    lower = np.floor(position).astype(int)
+    fraction = position - lower
+    shift = max(0, -lower.min())  # samples below the first grid point
+    lower += shift
+    size = max(lower.max() + 2, shift + (len(grid) - 1) * oversample + 1)
+    weight_bins = np.bincount(lower, 1 - fraction, size) + np.bincount(lower + 1, fraction, size)
+    value_bins = np.bincount(lower, (1 - fraction) * y, size) + np.bincount(lower + 1, fraction * y, size)
+
+    radius = int(np.ceil(truncate * sigma / bin_width))
+    kernel = np.exp(-(np.arange(-radius, radius + 1) * bin_width) ** 2 / (2 * sigma ** 2))
+    index = shift + radius + np.arange(len(grid)) * oversample
+    numerator = np.convolve(value_bins, kernel, mode='full')[index]
+    denominator = np.convolve(weight_bins, kernel, mode='full')[index]
+    sparse = np.where(denominator < np.exp(-0.5 * (truncate - 2) ** 2))[0]
+    for start in range(0, len(sparse), 256):
+        points = sparse[start:start + 256]
+        distance = (np.asarray(x, dtype=np.float64) - grid[points, np.newaxis]) ** 2
+        weights = np.exp(-(distance - distance.min(axis=1)[:, np.newaxis]) / (2 * sigma ** 2))
+        numerator[points] = np.dot(weights, y)
+        denominator[points] = weights.sum(axis=1)
+    return numerator / denominator
+
+
+def calculate_nonlinearity_factors(cal_dict, nonlinear_config, noise_dict, DN_matrix=None, plot=True):
+    """
+    Args:
+        DN_matrix: optional preallocated array shape(channels, IntTimes) filled by get_dn_matrix
+        plot: False for headless runs (nonlinearity_sweep)
+        nonlinear_config: optional 'bin_width' of the kernel smoothing, see kernel_smooth
+    """
     max_lowest_int_time = nonlinear_config['max_lowest_int_time'] # pick value manually. Needs to be slightly above the hightest value of the lowest integration time, WTF?
     sigma = nonlinear_config['sigma']
     index_start_spline_fit = nonlinear_config['index_start_spline_fit']
     gaussian_mean_steps = nonlinear_config['gaussian_mean_steps']
 
-    intTimes_sorted = sorted(cal_dict.keys())
-    dn_Matrix_intTimeperrow = cal_dict[intTimes_sorted[0]]['reference']['mean'] - noise_dict['noise']
-
-    for intTime in intTimes_sorted[1:]:
-        noise_corrected = cal_dict[intTime]['reference']['mean'] - noise_dict['noise']
-        dn_Matrix_intTimeperrow = np.vstack((dn_Matrix_intTimeperrow, noise_corrected))
-    DN_Matrix_intTimepercolumn = np.transpose(dn_Matrix_intTimeperrow)
-    assert_array_equal(DN_Matrix_intTimepercolumn[:,4], cal_dict[intTimes_sorted[4]]['reference']['mean'] - noise_dict['noise'])
+    intTimes_sorted = np.array(sorted(cal_dict.keys()), dtype=np.float64)
+    DN_Matrix_intTimepercolumn = get_dn_matrix(cal_dict, noise_dict, DN_matrix)
 
-    values = np.array([max(x) for x in DN_Matrix_intTimepercolumn])
+    values = DN_Matrix_intTimepercolumn.max(axis=1)
     index = np.where(values > max_lowest_int_time)[0]
     data = DN_Matrix_intTimepercolumn[index[0]:max(index)]
-    DN_nonlin = np.array([])
-    all_DN = np.array([])
-    for DN_values in data:
-        interpol = np.interp(max_lowest_int_time, DN_values, intTimes_sorted)
-        result = np.divide(DN_values, intTimes_sorted) * interpol / max_lowest_int_time  # Expected DN normalized to 1050 DN
-        DN_nonlin = np.append(DN_nonlin, result)
-        all_DN = np.append(all_DN, DN_values)
+    interpol = interp_rows(max_lowest_int_time, data, intTimes_sorted)
+    # Expected DN normalized to 1050 DN
+    DN_nonlin = (data / intTimes_sorted * (interpol / max_lowest_int_time)[:, np.newaxis]).ravel()
+    all_DN = data.ravel()
     sort_indx = all_DN.argsort()
     DN = all_DN[sort_indx]
     DN_non = DN_nonlin[sort_indx]
-    def kernel(x, shift, sigma):
-        return np.exp(-((x - shift) ** 2 / (2 * sigma ** 2)))
 
     averaging_DN = np.arange(min(DN), max(DN), gaussian_mean_steps)
-    weighted_data = []
-    for i in averaging_DN:
-        weighted_data.append(np.sum(kernel(DN, i, sigma) * DN_non)/ np.sum(kernel(DN, i, sigma)))
-    result = np.array(weighted_data)
+    result = kernel_smooth(DN, DN_non, averaging_DN, sigma, nonlinear_config.get('bin_width'))
     s3 = inter.UnivariateSpline(averaging_DN[index_start_spline_fit:], result[index_start_spline_fit:])
     nonlinear_factors = np.concatenate((result[0:index_start_spline_fit], s3(averaging_DN[index_start_spline_fit:])))
 
-    plt.plot(DN, DN_non, '+')
-    plt.plot(averaging_DN, nonlinear_factors, 'y')
-    plt.xlabel('Signal [DN]', **hfont)
-    plt.ylabel('Deviation from linearity', **hfont)
-    plt.show()
+    if plot:
+        plt.plot(DN, DN_non, '+')
+        plt.plot(averaging_DN, nonlinear_factors, 'y')
+        plt.xlabel('Signal [DN]', **hfont)
+        plt.ylabel('Deviation from linearity', **hfont)
+        plt.show()
     return averaging_DN, nonlinear_factors
 
 
+def nonlinearity_spread(cal_dict, correction_dict, keys=None):
+    """
+    Spread across integration times as plotted by check_nonlinearity
+    Return:
+        std / mean * 100 per channel of the nonlinearity corrected, dark subtracted reference divided by IntTime
+    """
+    keys = keys or sorted(cal_dict.keys())
+    corrected = np.array([(cal_dict[key]['reference']['mean'] / np.interp(cal_dict[key]['reference']['mean'], correction_dict['DN'], correction_dict['nonlinear'])
+                           - cal_dict[key]['darkcurrent']['mean']) / key for key in keys])
+    return np.std(corrected, axis=0) / np.mean(corrected, axis=0) * 100
+
+
 def check_nonlinearity(cal_dict, correction_dict=None, min=0, max=0, step=1):
     import matplotlib.pyplot as plt
     sorted_keys = sorted(cal_dict.keys())
@@ -1,6 +1,8 @@
+import os
 import numpy as np
 import pandas as pd
 from matplotlib.font_manager import FontProperties
+from calibration_kernel import CalibrationKernel
 
 
 FONTSTYLE = 'serif'
@@ -11,53 +13,131 @@ fontP.set_family(FONTSTYLE)
 fontP.set_size('small')
 
 
-def get_halogen_spectra(reference_file):
-    d = np.genfromtxt(reference_file, delimiter=',')
-    wavelength = d[:, 0]
-    intensity_mW = d[:, 1] * 10 ** -6  #[W/(m3sr) into mW/(nmm2sr)]
-    relative_error = d[:, 2]
-    return wavelength, intensity_mW, relative_error
+_halogen_cache = dict()
 
 
-def calc_scaling_factors(waveibs, ref, reference_file):
-    wave, intensity, r_err = get_halogen_spectra(reference_file)
+def get_halogen_spectra(reference_file):
+    """ Lamp file (wavelength, intensity, relative_error), read once per file and modification time """
+    key = (os.path.abspath(reference_file), os.path.getmtime(reference_file))
+    if key not in _halogen_cache:
+        d = np.genfromtxt(reference_file, delimiter=',')
+        wavelength = d[:, 0]
+        intensity_mW = d[:, 1] * 10 ** -6  #[W/(m3sr) into mW/(nmm2sr)]
+        relative_error = d[:, 2]
+        _halogen_cache[key] = (wavelength, intensity_mW, relative_error)
+    return _halogen_cache[key]
+
 
+def get_lamp_window(waveibs, wave):
+    """ Return: slice of the instrument channels strictly inside the lamp wavelength range """
     start_ind = np.where(waveibs > wave[0])[0][0]
     end_ind = np.where(waveibs < wave[-1])[0][-1]
+    return slice(start_ind, end_ind)
+
 
-    mod_waves = waveibs[start_ind:end_ind]
-    mod_intensity = ref[start_ind:end_ind]
+def calc_scaling_factors(waveibs, ref, reference_file):
+    wave, intensity, r_err = get_halogen_spectra(reference_file)
+    window = get_lamp_window(waveibs, wave)
+
+    mod_waves = waveibs[window]
+    mod_intensity = ref[window]
     assert len(mod_waves) == len(mod_intensity)
-    assert ref[start_ind] == mod_intensity[0]
 
     map_holgen_intensities = np.interp(mod_waves, wave, intensity)
     scale_factor = mod_intensity / map_holgen_intensities
     return scale_factor, mod_intensity, map_holgen_intensities, mod_waves
 
 
-def generate_response_factors(cal_dict, halogen_file):
-    store_to_file = 'response.txt'
-    spectras = np.array([])
-    for integration, spectra in cal_dict.items():
-        assert spectra['reference']['darkcurrent_corrected'] == True
-        try:
-            spectras = np.vstack((spectras, spectra['reference']['mean']))
-        except ValueError:
-            wave = spectra['reference']['wave']
-            spectras = spectra['reference']['mean']
-
-    mean_spectra = np.mean(spectras, axis=0)
-    scale_factor, mod_intensity, map_holgen_intensities, mod_waves = calc_scaling_factors(wave, mean_spectra, halogen_file)
-    response_dict = {'scale_factors': scale_factor, 'wave': mod_waves, 'halogen':map_holgen_intensities, 'intensity': mod_intensity}
-
-    frame = pd.DataFrame(np.transpose([mod_waves, scale_factor, mod_intensity, map_holgen_intensities]),
-                         columns=['Wavelength', 'ScaleFactor', 'Intensity', 'HalogenIntensity'])
-    frame.to_csv(store_to_file, index=False)
-    import matplotlib.pyplot as plt
-    plt.plot(mod_waves, scale_factor)
-    plt.ylabel(r'Radiance $DN / \frac{mW}{nm m^2 sr}$', **hfont)
-    plt.xlabel(r'Wavelength $\lambda$ [nm]', **hfont)
-    plt.show()
+def stack_sessions(cal_dicts, key='reference'):
+    """
+    Args:
+        cal_dicts: sort_ibsen_by_int outputs of several sessions, key means dark, nonlinearity and IntTime corrected
+    Return:
+        wave, IntTimes, cube shape(sessions, IntTimes, channels), NaN where a session lacks an IntTime
+    """
+    int_times = sorted(set(int_time for cal_dict in cal_dicts for int_time in cal_dict))
+    wave = list(cal_dicts[0].values())[0][key]['wave']
+    cube = np.full((len(cal_dicts), len(int_times), len(wave)), np.nan)
+    for session, cal_dict in enumerate(cal_dicts):
+        for column, int_time in enumerate(int_times):
+            if int_time in cal_dict:
+                assert cal_dict[int_time][key]['darkcurrent_corrected'] == True
+                cube[session, column] = cal_dict[int_time][key]['mean']
+    return wave, np.array(int_times), cube
 
-    return cal_dict, response_dict
 
+def build_response(wave, cube, lamp_files, output_file=None):
+    """
+    Response factors of one or several calibration sessions in one pass
+    Args:
+        wave: instrument wavelengths shape(channels,)
+        cube: shape(sessions, IntTimes, channels) corrected signal per ms, NaN for missing IntTimes
+        lamp_files: lamp reference file per session (or one for all)
+    Return:
+        response_dict {'wave', 'scale_factors', 'uncertainty', 'intensity', 'halogen'}
+        scale_factors: inverse variance weighted mean over the sessions of signal / lamp,
+        uncertainty: absolute, statistical part (IntTime scatter per session) and lamp relative_error
+        in quadrature, the lamp part averaged over the distinct lamps
+    """
+    cube = np.asarray(cube, dtype=np.float64)
+    if isinstance(lamp_files, str):
+        lamp_files = [lamp_files] * cube.shape[0]
+    lamps = dict((lamp_file, get_halogen_spectra(lamp_file)) for lamp_file in set(lamp_files))
+    window = get_lamp_window(wave, (max(lamp[0][0] for lamp in lamps.values()), min(lamp[0][-1] for lamp in lamps.values())))
+    mod_waves = wave[window]
+    counts = cube[:, :, window]
+
+    intensity = np.nanmean(counts, axis=1)
+    count = np.sum(np.isfinite(counts), axis=1)
+    halogen = np.array([np.interp(mod_waves, lamps[lamp_file][0], lamps[lamp_file][1]) for lamp_file in lamp_files])
+    scale_factors = intensity / halogen
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        statistical = np.nanstd(counts, axis=1) / intensity / np.sqrt(count)
+        valid = np.isfinite(statistical) & (statistical > 0)
+        weights = np.where(valid, 1. / statistical ** 2, np.inf)
+    # Sessions without scatter estimate (single IntTime) weigh like the least certain session
+    least = np.min(weights, axis=0)
+    weights = np.where(valid, weights, np.where(np.isfinite(least), least, 1.))
+    statistical = np.where(valid, statistical, 0.)
+    scale_factor = np.sum(weights * scale_factors, axis=0) / np.sum(weights, axis=0)
+    relative_statistical = np.sqrt(np.sum(weights ** 2 * statistical ** 2, axis=0)) / np.sum(weights, axis=0)
+
+    lamp_error = np.array([np.interp(mod_waves, lamp[0], lamp[2]) for lamp in lamps.values()])
+    relative_lamp = np.sqrt(np.sum(lamp_error ** 2, axis=0)) / len(lamps)
+    uncertainty = scale_factor * np.sqrt(relative_statistical ** 2 + relative_lamp ** 2)
+
+    response_dict = {'scale_factors': scale_factor, 'wave': mod_waves, 'uncertainty': uncertainty,
+                     'intensity': np.mean(intensity, axis=0), 'halogen': np.mean(halogen, axis=0)}
+    if output_file:
+        write_response(response_dict, output_file)
+    return response_dict
+
+
+def write_response(response_dict, output_file='response.txt'):
+    columns = ['Wavelength', 'ScaleFactor', 'Intensity', 'HalogenIntensity']
+    values = [response_dict['wave'], response_dict['scale_factors'], response_dict['intensity'], response_dict['halogen']]
+    if 'uncertainty' in response_dict:
+        columns.append('Uncertainty')
+        values.append(response_dict['uncertainty'])
+    frame = pd.DataFrame(np.transpose(values), columns=columns)
+    frame.to_csv(output_file, index=False)
+
+
+def compile_kernel(nonlinear_correction_dict, response_dict):
+    """ CalibrationKernel from in memory products (generate_nonlinear_correction, build_response) """
+    return CalibrationKernel(nonlinear_correction_dict['DN'], nonlinear_correction_dict['nonlinear'],
+                             response_dict['wave'], response_dict['scale_factors'])
+
+
+def generate_response_factors(cal_dict, halogen_file, store_to_file='response.txt', plot=True):
+    wave, int_times, cube = stack_sessions([cal_dict])
+    response_dict = build_response(wave, cube, halogen_file, store_to_file)
+    if plot:
+        import matplotlib.pyplot as plt
+        plt.plot(response_dict['wave'], response_dict['scale_factors'])
+        plt.ylabel(r'Radiance $DN / \frac{mW}{nm m^2 sr}$', **hfont)
+        plt.xlabel(r'Wavelength $\lambda$ [nm]', **hfont)
+        plt.show()
+
+    return cal_dict, response_dict
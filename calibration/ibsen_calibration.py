@@ -1,12 +1,16 @@
 import os
-import copy
 import glob
 import re
 import numpy as np
 import pandas as pd
 import parser.ibsen_parser as ip
+from parser.ibsen_loader import parse_files
+from parser.ibsen_dn_archive import archive_paths
+from parser.ibsen_spectrum import working_dtype
+from dark_current import fit_dark_current, stack_dark
 from extract_nonlinearity import generate_nonlinear_correction, check_nonlinearity
-from extract_response import generate_response_factors
+from extract_response import generate_response_factors, stack_sessions, build_response, compile_kernel
+from nonlinearity_sweep import sweep_nonlinearity, best_config
 from matplotlib.font_manager import FontProperties
 
 
@@ -29,9 +33,13 @@ def sort_ibsen_by_int(dirname):
                                'wave', 'UTCTime', 'darkcurrent_corrected', 'tdata', 'IntTime', 'Type']
     """
     cal_dict = {}
-    for file_ in glob.iglob('%s*.asc' % dirname):
-        print(file_)
-        ibsen_dict = ip.parse_ibsen_file(file_)
+    if os.path.isfile(dirname):
+        # DN archive (see ibsen_dn_archive)
+        files = archive_paths(dirname)
+        dirname += ip.ARCHIVE_SEPARATOR
+    else:
+        files = sorted(glob.glob('%s*.asc' % dirname))
+    for file_, ibsen_dict in zip(files, parse_files(files)):
         # Skip saturated pixel
         ibsen_dict['wave'] = ibsen_dict['wave'][50:]
         ibsen_dict['mean'] = ibsen_dict['mean'][50:]
@@ -47,15 +55,18 @@ def sort_ibsen_by_int(dirname):
     return cal_dict
 
 
+def copy_cal_dict(cal_dict):
+    """ Copy-on-write copy, the scan matrices are shared and never duplicated """
+    return {int_time: {key: spectra.copy() for key, spectra in item.items()} for int_time, item in cal_dict.items()}
+
+
 def subtract_dark_from_mean(darkcurrent, spectra):
-    dd = copy.deepcopy(darkcurrent)
-    assert dd['Type'] == 'darkcurrent', 'First parameter has to be darkcurrent'
-    dd['mean'] = ip.get_mean_column(dd)
+    assert darkcurrent['Type'] == 'darkcurrent', 'First parameter has to be darkcurrent'
+    dark_mean = ip.get_mean_column(darkcurrent)
     if spectra['darkcurrent_corrected'] == False:
-        spectra['mean'] = ip.get_mean_column(spectra)
-        spectra['tdata'] -= dd['mean']
+        spectra['mean'] = ip.get_mean_column(spectra) - dark_mean
+        spectra['tdata'] = (spectra['tdata'] - dark_mean).astype(working_dtype(spectra['tdata']), copy=False)
         spectra['data'] = np.transpose(spectra['tdata'])
-        spectra['mean'] -= dd['mean']
         spectra['darkcurrent_corrected'] = True
 
 
@@ -75,20 +86,13 @@ def read_file(offset_file, cal_dict=None):
 
 
 def calc_offset(offset_file, cal_dict):
-    noise_dict = dict()
-    sorted_keys = sorted(cal_dict.keys())
-    tmp_channels = range(len(cal_dict[sorted_keys[0]]['darkcurrent']['wave']))
-    IntTimes = np.array(sorted_keys)
-    noise = np.array([])
-    for channel in tmp_channels:
-        noise_dict[channel] = dict()
-        dark = np.array([cal_dict[key]['darkcurrent']['mean'][channel] for key in sorted_keys])
-        noise_dict[channel]['dark'] = dark
-        coeffs_dark = np.polyfit(sorted_keys, dark, deg=1)
-        noise = np.append(noise, coeffs_dark[1])
-    noise_dict['noise'] = noise
+    IntTimes, dark = stack_dark(cal_dict)
+    tmp_channels = range(dark.shape[1])
+    noise_dict = dict((channel, {'dark': dark[:, channel]}) for channel in tmp_channels)
+    noise_dict['fit'] = fit_dark_current(IntTimes, dark)
+    noise_dict['noise'] = noise_dict['fit']['offset']
     noise_dict['channel'] = tmp_channels
-    frame = pd.DataFrame(np.transpose([tmp_channels, noise]), columns=['ch', 'bias'])
+    frame = pd.DataFrame(np.transpose([tmp_channels, noise_dict['noise']]), columns=['ch', 'bias'])
     frame.to_csv(offset_file, index=False)
     return noise_dict
 
@@ -100,10 +104,43 @@ def get_noise(flag):
         return calc_offset
 
 
+def read_nonlinear_correction(nonlinear_correction_file):
+    """ {'DN', 'nonlinear'} of a nonlinearity_correction.txt (generate_nonlinear_correction output) """
+    data = np.genfromtxt(nonlinear_correction_file, skip_header=1, delimiter=',')
+    return {'DN': data[:, 0], 'nonlinear': data[:, 1]}
+
+
+def correct_reference(cal_dict, nonlinear_correction_dict):
+    """ Nonlinearity and IntTime corrected reference means of a darkcurrent corrected cal_dict """
+    for integration, spectra in cal_dict.items():
+        spectra['reference']['mean'] = spectra['reference']['mean'] / np.interp(spectra['reference']['mean'], nonlinear_correction_dict['DN'], nonlinear_correction_dict['nonlinear'])
+        spectra['reference']['mean'] = spectra['reference']['mean'] / integration
+    return cal_dict
+
+
+def generate_calibration_kernel(directories, reference_files, nonlinear_correction_file, output_dir='.'):
+    """
+    Response of several sessions in one pass (build_response) and the CalibrationKernel of it,
+    writes response.txt and calibration_kernel.npz to output_dir
+    Args:
+        reference_files: halogen lamp file per session, or one for all sessions
+    """
+    nonlinear_correction_dict = read_nonlinear_correction(nonlinear_correction_file)
+    cal_dicts = [correct_reference(subtract_dark(sort_ibsen_by_int(directory)), nonlinear_correction_dict)
+                 for directory in directories]
+    if len(reference_files) == 1:
+        reference_files = list(reference_files) * len(cal_dicts)
+    wave, int_times, cube = stack_sessions(cal_dicts)
+    response_dict = build_response(wave, cube, reference_files, os.path.join(output_dir, 'response.txt'))
+    kernel = compile_kernel(nonlinear_correction_dict, response_dict)
+    kernel.save(os.path.join(output_dir, 'calibration_kernel.npz'))
+    return kernel
+
+
 def generate_ibsen_calibration_files(directory, reference):
     # Extract Rasta specific raw data
     cal_dict = sort_ibsen_by_int(directory)
-    cal_dict_tmp = copy.deepcopy(cal_dict)
+    cal_dict_tmp = copy_cal_dict(cal_dict)
     bias_file = directory + 'assumed_bias/' + 'bias.txt'
     flag = os.path.exists(bias_file)
     noise_dict = get_noise(flag)(bias_file, cal_dict)
@@ -124,9 +161,7 @@ def generate_ibsen_calibration_files(directory, reference):
         check_nonlinearity(cal_dict, nonlinear_correction_dict)
 
     #Nonlinear correction for ibsen response
-    for integration, spectra in cal_dict.items():
-        spectra['reference']['mean'] = spectra['reference']['mean'] / np.interp(spectra['reference']['mean'], nonlinear_correction_dict['DN'], nonlinear_correction_dict['nonlinear'])
-        spectra['reference']['mean'] = spectra['reference']['mean'] / integration
+    cal_dict = correct_reference(cal_dict, nonlinear_correction_dict)
     # Generate ibsen response factors for physical units
     cal_dict, response_dict = generate_response_factors(cal_dict, reference)
     import matplotlib.pyplot as plt
@@ -159,6 +194,19 @@ def generate_ibsen_calibration_files(directory, reference):
     plt.show()
 
 
+def sweep_nonlinear_correction(directory, grid=None, processes=None, output_dir='.'):
+    """ Headless nonlinear_config tuning, writes nonlinearity_sweep.csv and the best nonlinearity_correction.txt """
+    cal_dict = sort_ibsen_by_int(directory)
+    bias_file = directory + 'assumed_bias/' + 'bias.txt'
+    noise_dict = get_noise(os.path.exists(bias_file))(bias_file, cal_dict)
+    frame = sweep_nonlinearity(cal_dict, noise_dict, grid, processes)
+    frame.to_csv(os.path.join(output_dir, 'nonlinearity_sweep.csv'), index=False)
+    nonlinear_config = best_config(frame)
+    print('Best nonlinear_config %s, spread %.4f %%' % (nonlinear_config, frame['score'][0]))
+    return generate_nonlinear_correction(cal_dict, nonlinear_config, noise_dict,
+                                         os.path.join(output_dir, 'nonlinearity_correction.txt'), plot=False)
+
+
 if __name__ == "__main__":
     """Usage:
         python ibsen_calibration.py -d /home/jana_jo/DLR/Codes/calibration/Ibsen_0109_5313264/EOC/Optiklabor/
@@ -166,8 +214,23 @@ if __name__ == "__main__":
 
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument('-d', '--directory', default='/home/joanna/DLR/Codes/calibration/Ibsen_0109_5313264/EOC/Optiklabor/', help="Add directory with raw data measured by Rasta")
-    parser.add_argument('-r', '--reference_file', default='/home/joanna/DLR/Codes/calibration/GS1032_1m.txt',help="Reference file for halogen lamp")
+    parser.add_argument('-d', '--directory', nargs='+', default=['/home/joanna/DLR/Codes/calibration/Ibsen_0109_5313264/EOC/Optiklabor/'], help="Add directory with raw data measured by Rasta (several sessions with --kernel)")
+    parser.add_argument('-r', '--reference_file', nargs='+', default=['/home/joanna/DLR/Codes/calibration/GS1032_1m.txt'], help="Reference file for halogen lamp (one per session or one for all with --kernel)")
+    parser.add_argument('--sweep', default=False, action='store_true', help='Headless grid search of the nonlinearity settings')
+    parser.add_argument('--kernel', default=None, metavar='NONLINEAR_FILE',
+                        help='Headless response of all sessions with this nonlinearity correction file, saves response.txt and calibration_kernel.npz')
+    parser.add_argument('-p', '--processes', default=None, type=int, help='Worker processes of the sweep, default cpu count')
+    parser.add_argument('-o', '--output_dir', default='.', help='Output directory of the sweep and the kernel')
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32', 'uint16'], help='Storage dtype of the raw scans')
+    parser.add_argument('--cache', default=None, const='', nargs='?', help='Cache parsed spectra (optional cache directory)')
     args = parser.parse_args()
-    print(args.reference_file)
-    generate_ibsen_calibration_files(args.directory, args.reference_file)
+    if args.cache is not None:
+        ip.enable_cache(args.cache or None)
+    ip.set_storage_dtype(args.dtype)
+    if args.sweep:
+        sweep_nonlinear_correction(args.directory[0], processes=args.processes, output_dir=args.output_dir)
+    elif args.kernel:
+        generate_calibration_kernel(args.directory, args.reference_file, args.kernel, args.output_dir)
+    else:
+        print(args.reference_file[0])
+        generate_ibsen_calibration_files(args.directory[0], args.reference_file[0])
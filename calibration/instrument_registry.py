@@ -0,0 +1,140 @@
+import os
+import re
+import logging
+from parser.ibsen_parser import parse_ibsen_header
+from calibration_kernel import CalibrationKernel
+from dark_current import DarkModel
+try:
+    from ConfigParser import ConfigParser
+except ImportError:
+    from configparser import ConfigParser
+"""
+Registry of the calibration products per instrument
+
+Product sets are discovered as Ibsen_<unit>_<serial>_calibration_files
+directories holding a nonlinearity and a response file. Units without a
+known serial (Serialnumber_missing) are identified by Model/Detector, given
+by an optional instrument.ini inside the product directory:
+    [Instrument]
+    Model = Freedom VIS FSV-305
+    Detector = S10420-1006-01
+    Serial = 5313264
+
+identify() picks the product set for a file header: serial first, then the
+unique Model/Detector match. An unknown serial or an unmatched Model/Detector
+raises ValueError, only headers without Serial, Model and Detector get the
+default set (DEFAULT_PRODUCTS, the products the scripts used before the registry
+existed). The shipped product sets have no instrument.ini, they match by serial
+only. Kernels (and the optional dark_model.npz, see
+dark_current) are loaded on first use and kept per process (get_registry).
+"""
+CALIBRATION_DIR = os.path.dirname(os.path.realpath(__file__))
+PRODUCT_DIR = re.compile(r'^Ibsen_(?P<unit>[0-9]+)_(?P<serial>.+)_calibration_files$')
+MISSING_SERIAL = 'Serialnumber_missing'
+NONLINEAR_FILES = ['nonlinearity_correction.txt', 'nonlinearity_correstion.txt']
+RESPONSE_FILE = 'response.txt'
+DARK_MODEL_FILE = 'dark_model.npz'
+INSTRUMENT_FILE = 'instrument.ini'
+DEFAULT_PRODUCTS = 'Ibsen_0109_5313264_calibration_files'
+_registry = None
+
+
+def read_instrument_file(directory):
+    instrument = {'Model': '', 'Detector': '', 'Serial': ''}
+    config = ConfigParser()
+    if config.read(os.path.join(directory, INSTRUMENT_FILE)) and config.has_section('Instrument'):
+        for key in instrument:
+            if config.has_option('Instrument', key):
+                instrument[key] = config.get('Instrument', key).strip()
+    return instrument
+
+
+def discover(directory=CALIBRATION_DIR):
+    """ Return: {name: {'unit', 'Serial', 'Model', 'Detector', 'nonlinear', 'response', 'dark_model'}} """
+    instruments = dict()
+    for name in sorted(os.listdir(directory)):
+        match = PRODUCT_DIR.match(name)
+        path = os.path.join(directory, name)
+        if not match or not os.path.isdir(path):
+            continue
+        nonlinear = [os.path.join(path, file_) for file_ in NONLINEAR_FILES if os.path.exists(os.path.join(path, file_))]
+        if not nonlinear or not os.path.exists(os.path.join(path, RESPONSE_FILE)):
+            logging.warning('Incomplete calibration products in %s' % path)
+            continue
+        instrument = read_instrument_file(path)
+        if not instrument['Serial'] and match.group('serial') != MISSING_SERIAL:
+            instrument['Serial'] = match.group('serial')
+        dark_model = os.path.join(path, DARK_MODEL_FILE)
+        instrument.update({'unit': match.group('unit'), 'nonlinear': nonlinear[0],
+                           'response': os.path.join(path, RESPONSE_FILE),
+                           'dark_model': dark_model if os.path.exists(dark_model) else None})
+        instruments[name] = instrument
+    return instruments
+
+
+class InstrumentRegistry(object):
+
+    def __init__(self, directory=CALIBRATION_DIR, default=DEFAULT_PRODUCTS):
+        """ default: product set for headers without Serial, Model and Detector, None raises ValueError instead """
+        self.instruments = discover(directory)
+        self.default = default
+        self.kernels = dict()
+        self.dark_models = dict()
+
+    def register(self, name, nonlinear_file, response_file, serial='', model='', detector='', unit='', dark_model_file=None):
+        self.instruments[name] = {'unit': unit, 'Serial': serial, 'Model': model, 'Detector': detector,
+                                  'nonlinear': nonlinear_file, 'response': response_file, 'dark_model': dark_model_file}
+        self.kernels.pop(name, None)
+        self.dark_models.pop(name, None)
+
+    def identify(self, header):
+        """
+        Args:
+            header: parse_ibsen_header output or file name
+        Return:
+            name of the product set, ValueError if the instrument is unknown
+        """
+        if not isinstance(header, dict):
+            header = parse_ibsen_header(header)
+        serial = header.get('Serial', '')
+        if serial:
+            for name, instrument in sorted(self.instruments.items()):
+                if instrument['Serial'] == serial:
+                    return name
+            raise ValueError('No calibration products for Serial %r' % serial)
+        candidates = [name for name, instrument in sorted(self.instruments.items())
+                      if (instrument['Model'] or instrument['Detector'])
+                      and instrument['Model'] in ('', header.get('Model', ''))
+                      and instrument['Detector'] in ('', header.get('Detector', ''))]
+        if len(candidates) == 1:
+            return candidates[0]
+        if not (header.get('Model') or header.get('Detector')) and self.default in self.instruments:
+            logging.warning('No instrument in the header, using %s' % self.default)
+            return self.default
+        raise ValueError('No unique calibration products for Serial %r, Model %r, Detector %r (candidates %s)'
+                         % (serial, header.get('Model', ''), header.get('Detector', ''), candidates))
+
+    def kernel(self, name):
+        """ CalibrationKernel of the product set, compiled once """
+        if name not in self.kernels:
+            instrument = self.instruments[name]
+            self.kernels[name] = CalibrationKernel.from_files(instrument['nonlinear'], instrument['response'])
+        return self.kernels[name]
+
+    def dark_model(self, name):
+        """ DarkModel of the product set (dark_model.npz), None if there is none """
+        if name not in self.dark_models:
+            dark_model_file = self.instruments[name].get('dark_model')
+            self.dark_models[name] = DarkModel.load(dark_model_file) if dark_model_file else None
+        return self.dark_models[name]
+
+    def kernel_for(self, filename):
+        return self.kernel(self.identify(filename))
+
+
+def get_registry():
+    """ Process wide registry of the products shipped in calibration/ """
+    global _registry
+    if _registry is None:
+        _registry = InstrumentRegistry()
+    return _registry
@@ -1,6 +1,13 @@
+import os
+import logging
 import numpy as np
-import ibsen_calibration as ic
-from parser.ibsen_parser import parse_ibsen_file
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+from parser.ibsen_parser import parse_ibsen_file, parse_ibsen_header, enable_cache, set_storage_dtype
+from parser.ibsen_index import build_index, group_by_number
+from calibration_kernel import CalibrationKernel
+from instrument_registry import get_registry
+from dark_current import DarkModel, get_dark
 "This module will be deleted"
 
 
@@ -11,73 +18,152 @@ def read_nonlinear_correction_file(_file):
     return DN, correction_values
 
 
-def calibrate_meas(data_file, dark_file, nonlinear_correction_file, response_file):
-    import matplotlib.pyplot as plt
-    DN, correction_values = read_nonlinear_correction_file(nonlinear_correction_file)
-
-    response = np.genfromtxt(response_file, skip_header=1, delimiter=',')
-    wave = response[:,0]
-    scale_factors = response[:,1]
-
+def calibrate_meas(data_file, dark_file, nonlinear_correction_file=None, response_file=None, kernel=None, dark_dict=None,
+                   dark_model=None, temperature=None):
+    """
+    Args:
+        kernel: CalibrationKernel, built from the correction files if None
+        dark_dict: parsed dark_file, parsed if None
+        dark_model: DarkModel, synthesizes the dark if dark_file is None
+        temperature: of the measurement for a temperature fitted dark_model, read from the header if None
+    """
+    if kernel is None:
+        kernel = CalibrationKernel.from_files(nonlinear_correction_file, response_file)
     data_dict = parse_ibsen_file(data_file)
-    dark_dict = parse_ibsen_file(dark_file)
-    ic.subtract_dark_from_mean(dark_dict, data_dict)
-    assert data_dict['darkcurrent_corrected'] == True
-    data_dict['tdata'] = data_dict['tdata'] / np.interp(data_dict['tdata'], DN, correction_values)
-    data_dict['data'] = np.transpose(data_dict['tdata'])
-    data_dict['tdata'] = data_dict['tdata'] / data_dict['IntTime']
-    data_dict['mean'] = data_dict['mean'] / np.interp(data_dict['mean'], DN, correction_values)
-    data_dict['mean'] = data_dict['mean'] / data_dict['IntTime']
-    data_dict['data'] = np.transpose(data_dict['tdata'])
-    data_dict['tdata']= np.divide(data_dict['tdata'] , np.interp(data_dict['wave'], wave, scale_factors))
-    data_dict['data'] = np.transpose(data_dict['tdata'])
-    return data_dict
-
-
-def process_level0to1(meas_files, dark_file, nonlinear_correction_file, response_file):
-
+    if dark_file is None and dark_model is not None:
+        dark_model.check_wave(data_dict['wave'])
+    if dark_dict is None:
+        if temperature is None and dark_model is not None:
+            temperature = parse_ibsen_header(data_file)['Temperature']
+        dark_dict = get_dark(dark_file, data_dict['IntTime'], dark_model, temperature)
+    return kernel.apply(data_dict, dark_dict)
+
+
+def process_level0to1(meas_files, dark_file, nonlinear_correction_file=None, response_file=None, kernel=None, dark_model=None):
+    """
+    Calibrate meas_files against one dark, the dark is parsed once for all of them.
+    dark_file None: darks synthesized by dark_model, cached per IntTime and header temperature
+    """
+    if kernel is None:
+        kernel = CalibrationKernel.from_files(nonlinear_correction_file, response_file)
+    dark_dict = get_dark(dark_file, None, dark_model) if dark_file else None
+    model_darks = dict()
     for meas_file in meas_files:
         print('File to calibrate %s \n' % meas_file.split('/')[-1])
-        print('\t with Dark %s \n' % dark_file.split('/')[-1])
-        cal_dict = calibrate_meas(meas_file, dark_file, nonlinear_correction_file, response_file)
+        print('\t with Dark %s \n' % (dark_file.split('/')[-1] if dark_file else 'model'))
+        if dark_file is None:
+            header = parse_ibsen_header(meas_file)
+            key = (header['IntTime'], header['Temperature'])
+            if key not in model_darks:
+                model_darks[key] = dark_model.dark_dict(*key)
+            dark_dict = model_darks[key]
+        cal_dict = calibrate_meas(meas_file, dark_file, kernel=kernel, dark_dict=dark_dict,
+                                  dark_model=None if dark_file else dark_model)
         write_to_file(cal_dict, meas_file)
 
 
+def process_group(task):
+    """
+    Pool worker, task: (meas_files, dark_file, kernel, dark_model),
+    kernel/dark_model None: taken from the instrument registry, groups of unknown instruments are skipped
+    """
+    meas_files, dark_file, kernel, dark_model = task
+    if kernel is None or (dark_file is None and dark_model is None):
+        registry = get_registry()
+        try:
+            name = registry.identify(meas_files[0])
+        except ValueError as e:
+            logging.error('Skipping %s: %s' % (meas_files, e))
+            return []
+        kernel = kernel or registry.kernel(name)
+        dark_model = dark_model or registry.dark_model(name)
+    process_level0to1(meas_files, dark_file, kernel=kernel, dark_model=dark_model)
+    return meas_files
+
+
 def write_to_file(cal_dict, filename):
 
     assert cal_dict['darkcurrent_corrected'] == True
     file_list = np.insert(filename.split('/'), -1, 'calibrated')
     file_ = '/'.join(file_list)
     print(file_)
-    data = np.transpose(np.vstack((cal_dict['wave'], cal_dict['data_mean'], cal_dict['data_std'],cal_dict['tdata'])))
+    data = np.column_stack((cal_dict['wave'], cal_dict['data_mean'], cal_dict['data_std'], cal_dict['data']))
     with open(filename, 'r') as fr, open(file_, 'w') as fp:
-        old = fr.readlines()
+        old = list(islice(fr, cal_dict['start_data_index']))
         old[cal_dict['start_data_index'] - 1 ] = '[DataCalibrated]\n'
-        fp.writelines(old[:cal_dict['start_data_index']])
-        for dat in data:
-            dat.tofile(fp, sep='\t', format="%.4f")
-            fp.write('\n')
-
-
-def start_level0to1(directory, nonlinear_correction_file, response_file):
-    import glob
+        fp.writelines(old)
+        np.savetxt(fp, data, fmt='%.4f', delimiter='\t')
+
+
+def load_kernel(nonlinear_correction_file, response_file, kernel_file=None):
+    """
+    CalibrationKernel from kernel_file, built from the correction files and saved to kernel_file if missing.
+    None without any file: products are chosen per file header (instrument_registry)
+    """
+    if kernel_file and os.path.exists(kernel_file):
+        return CalibrationKernel.load(kernel_file)
+    if nonlinear_correction_file is None and response_file is None:
+        return None
+    kernel = CalibrationKernel.from_files(nonlinear_correction_file, response_file)
+    if kernel_file:
+        kernel.save(kernel_file)
+    return kernel
+
+
+def start_level0to1(directory, nonlinear_correction_file, response_file, processes=None, kernel_file=None,
+                    dark_model_file=None, model_only=False):
+    """
+    One task per index group (darkcurrent + siblings), groups are calibrated in a process pool.
+    Groups without darkcurrent use the dark model (dark_model_file or instrument registry),
+    model_only skips the darkcurrent files entirely
+    """
     file_prefixes = ['darkcurrent', 'reference', 'target']
-    files = [file_ for file_ in glob.iglob(directory + '%s*' % file_prefixes[0])]
-
-    for file_ in sorted(files):
-        index = file_.split(file_prefixes[0])[-1]
-        files = [f for f in glob.iglob(directory + '*%s' % index) if file_prefixes[0] not in f]
-        process_level0to1(files, file_, nonlinear_correction_file, response_file)
+    groups = group_by_number(directory, build_index(directory))
+    kernel = load_kernel(nonlinear_correction_file, response_file, kernel_file)
+    dark_model = DarkModel.load(dark_model_file) if dark_model_file else None
+
+    tasks = []
+    for number, group in sorted(groups.items()):
+        files = [path for key, path in sorted(group.items()) if key != file_prefixes[0]]
+        if not files:
+            continue  # darkcurrent only, nothing to calibrate
+        dark_file = None if model_only else group.get(file_prefixes[0])
+        group_model = dark_model
+        if dark_file is None and group_model is None:
+            try:
+                group_model = get_registry().dark_model(get_registry().identify(files[0]))
+            except ValueError:
+                group_model = None
+        if dark_file is None and group_model is None:
+            continue
+        tasks.append((files, dark_file, kernel, group_model))
+    processes = min(processes or cpu_count(), len(tasks))
+    if processes <= 1:
+        return [process_group(task) for task in tasks]
+    pool = Pool(processes)
+    try:
+        return pool.map(process_group, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
 
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--directory', default='/home/jana_jo/DLR/Codes/measurements/Roof_DLR/2016_09_13RoofDLR/test/', help='Define measurement directory to sweep through')
-    parser.add_argument('-n', '--nonlinear',
-                        default='/home/jana_jo/DLR/Codes/evaluation/calibration/Ibsen_0109_5313264_calibration_files/nonlinearity_correction.txt',
-                        help='Nonlinear correction file for corresponding ibsen')
-    parser.add_argument('-r', '--response', default='/home/jana_jo/DLR/Codes/evaluation/calibration/Ibsen_0109_5313264_calibration_files/response.txt',
-                        help='Response file for corresponding ibsen')
+    parser.add_argument('-n', '--nonlinear', default=None,
+                        help='Nonlinear correction file for corresponding ibsen, default chosen per file header (instrument_registry)')
+    parser.add_argument('-r', '--response', default=None,
+                        help='Response file for corresponding ibsen, default chosen per file header (instrument_registry)')
+    parser.add_argument('-k', '--kernel', default=None, help='Calibration kernel (.npz), created from -n and -r if missing')
+    parser.add_argument('--dark_model', default=None, help='Dark model (.npz, see dark_current) for groups without darkcurrent')
+    parser.add_argument('--model_only', default=False, action='store_true', help='Synthesize all darks from the dark model')
+    parser.add_argument('-p', '--processes', default=None, type=int, help='Worker processes, default cpu count')
+    parser.add_argument('--dtype', default='float64', choices=['float64', 'float32', 'uint16'], help='Storage dtype of the raw scans')
+    parser.add_argument('--cache', default=None, const='', nargs='?', help='Cache parsed spectra (optional cache directory)')
     args = parser.parse_args()
-    start_level0to1(args.directory, args.nonlinear, args.response)
+    if args.cache is not None:
+        enable_cache(args.cache or None)
+    set_storage_dtype(args.dtype)
+    start_level0to1(args.directory, args.nonlinear, args.response, args.processes, args.kernel, args.dark_model, args.model_only)
@@ -0,0 +1,89 @@
+import itertools
+import numpy as np
+import pandas as pd
+from multiprocessing import Pool, cpu_count
+from extract_nonlinearity import calculate_nonlinearity_factors, nonlinearity_spread, get_dn_matrix
+"""
+Headless sweep over nonlinear_config
+
+Every combination of the grid is scored by the median over the channels of
+nonlinearity_spread (std / mean * 100 across the integration times, the
+quantity check_nonlinearity plots), the lowest score wins. Settings that
+fail (no channel above max_lowest_int_time, spline start beyond the DN
+range) score inf. max_lowest_int_time defaults to a few values slightly
+above the highest DN of the lowest integration time.
+"""
+DEFAULT_GRID = {'sigma': [25, 50, 100, 200],
+                'index_start_spline_fit': [1000, 1400, 1500, 2000],
+                'gaussian_mean_steps': [2, 4, 8]}
+LOWEST_INT_TIME_FACTORS = [1.01, 1.05, 1.1, 1.2]
+_shared = dict()
+
+
+def reduce_cal_dict(cal_dict):
+    """ Only the means are needed by the workers, keeps the pickled payload small """
+    return dict((key, dict((meas, {'mean': np.asarray(item[meas]['mean'])}) for meas in ['reference', 'darkcurrent']))
+                for key, item in cal_dict.items())
+
+
+def init_worker(cal_dict, noise_dict):
+    _shared['cal_dict'] = cal_dict
+    _shared['noise_dict'] = noise_dict
+    _shared['DN_matrix'] = np.empty((len(noise_dict['noise']), len(cal_dict)))
+
+
+def score_config(nonlinear_config):
+    cal_dict = _shared['cal_dict']
+    try:
+        DN, factors = calculate_nonlinearity_factors(cal_dict, nonlinear_config, _shared['noise_dict'],
+                                                     _shared['DN_matrix'], plot=False)
+        spread = nonlinearity_spread(cal_dict, {'DN': DN, 'nonlinear': factors})
+    except Exception:  # fitpack errors included, a failing setting just loses
+        return np.inf
+    score = np.nanmedian(np.abs(spread))
+    return score if np.isfinite(score) else np.inf
+
+
+def get_configs(cal_dict, noise_dict, grid=None):
+    grid = dict(DEFAULT_GRID, **(grid or dict()))
+    if 'max_lowest_int_time' not in grid:
+        lowest = get_dn_matrix(cal_dict, noise_dict)[:, 0].max()
+        grid['max_lowest_int_time'] = [int(np.ceil(lowest * factor)) for factor in LOWEST_INT_TIME_FACTORS]
+    keys = sorted(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+
+
+def sweep_nonlinearity(cal_dict, noise_dict, grid=None, processes=None):
+    """
+    Args:
+        grid: {nonlinear_config key: [values]}, missing keys from DEFAULT_GRID
+    Return:
+        DataFrame of the settings and their 'score', best first
+    """
+    configs = get_configs(cal_dict, noise_dict, grid)
+    cal_dict = reduce_cal_dict(cal_dict)
+    noise_dict = {'noise': np.asarray(noise_dict['noise'])}
+    processes = min(processes or cpu_count(), len(configs))
+    if processes <= 1:
+        init_worker(cal_dict, noise_dict)
+        scores = [score_config(config) for config in configs]
+    else:
+        pool = Pool(processes, initializer=init_worker, initargs=(cal_dict, noise_dict))
+        try:
+            scores = pool.map(score_config, configs)
+        finally:
+            pool.close()
+            pool.join()
+    order = np.argsort(scores, kind='mergesort')
+    frame = pd.DataFrame([configs[idx] for idx in order], columns=sorted(configs[0].keys()))
+    frame['score'] = np.array(scores)[order]
+    return frame
+
+
+def best_config(frame):
+    """ Return: nonlinear_config of the best row, with python int/float values """
+    row = frame.iloc[0]
+    if not np.isfinite(row['score']):
+        raise ValueError('No valid nonlinearity setting in the sweep')
+    return dict((key, int(row[key]) if float(row[key]).is_integer() else float(row[key]))
+                for key in frame.columns if key != 'score')
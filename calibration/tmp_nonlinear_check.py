@@ -3,11 +3,13 @@ import glob
 import re
 import numpy as np
 import parser.ibsen_parser as ip
+from parser.ibsen_loader import parse_files
 import matplotlib.gridspec as gridspec
 import matplotlib.pyplot as plt
 from extract_nonlinearity import generate_nonlinear_correction, check_nonlinearity
 from extract_response import generate_response_factors
 from level0to1 import read_nonlinear_correction_file
+from dark_current import fit_dark_current, stack_dark
 from ibsen_calibration import sort_ibsen_by_int
 from matplotlib.font_manager import FontProperties
 
@@ -38,28 +40,19 @@ def darkcurrent_channel_analyse(directory):
     plt.ylabel(r'Signal [DN]', **hfont)
     plt.show()
 
-    sorted_keys = sorted(cal_dict.keys()) #[4:-4]
-    tmp_channels = range(len(cal_dict[sorted_keys[0]]['darkcurrent']['wave']))
-    noise_dict = dict()
+    IntTimes, dark = stack_dark(cal_dict)
+    tmp_channels = range(dark.shape[1])
     #tmp_channels = np.delete(tmp_channels, [187, 258, 265, 811])794
     gs = gridspec.GridSpec(2, 2)
     ax1 = plt.subplot(gs[0, :])
     ax2 = plt.subplot(gs[1, :])
-    IntTimes = np.array(sorted_keys)
-    noise = np.array([])
 
     dark_tmp = cal_dict[110]['darkcurrent']['mean']
     #ax1.plot( dark_tmp, '+')
     print(np.where(dark_tmp > 2361 ))
 
-    for channel in tmp_channels:
-        noise_dict[channel] = dict()
-        dark = np.array([cal_dict[key]['darkcurrent']['mean'][channel] for key in sorted_keys])
-        noise_dict[channel]['dark'] = dark
-        coeffs_dark = np.polyfit(sorted_keys, dark, deg=1)
-
-        noise = np.append(noise, coeffs_dark[1])
-        ax1.plot(IntTimes, dark, '+')
+    noise = fit_dark_current(IntTimes, dark)['offset']
+    ax1.plot(IntTimes, dark, '+')
 
     #ax1.plot(IntTimes, noise_dict[258]['dark'])
     ax2.plot(tmp_channels, noise)
@@ -88,15 +81,11 @@ def temperature():
     files_winter = sorted([file_ for file_ in glob.iglob(winter + '%s*' % file_prefixes[0])])[5:7]
     files_summer = sorted([file_ for file_ in glob.iglob(summer + '%s*' % file_prefixes[0])])[3:5]
     files_winter = [files_winter[0]]
-    for win in files_winter:
-        print(win)
-        win_dict = ip.parse_ibsen_file(win)
+    for win_dict in parse_files(files_winter):
         ax1.plot(win_dict['wave'][50:], win_dict['mean'][50:],color='darkblue', label='-3 $^{\circ}$C' % win_dict['IntTime'])
 
     files_summer = [files_summer[0]]
-    for sum in files_summer:
-        print(sum)
-        sum_dict = ip.parse_ibsen_file(sum)
+    for sum_dict in parse_files(files_summer):
         ax1.plot(sum_dict['wave'][50:], sum_dict['mean'][50:],color='sandybrown', label='30 $^{\circ}$C' % sum_dict['IntTime'])
     assert win_dict['IntTime'] == sum_dict['IntTime']
     ax1.set_ylabel('Signal [DN]', **hfont)
@@ -7,7 +7,8 @@ from datetime import datetime
 from ast import literal_eval
 from processing.model_factory import WeatherAtmosphereParameter
 from processing.spectrum_analyser import Aerosol_Retrievel
-from parser.ibsen_parser import parse_ibsen_file
+from parser.ibsen_parser import parse_ibsen_file, enable_cache
+from parser.ibsen_index import build_index, pair_files
 from utils.plotting import plot_meas, plot_used_irradiance_and_reflectance, plot_fitted_reflectance
 from processing.ProcessFactory import DataProcess
 import lmfit
@@ -55,7 +56,12 @@ def create_logger(log_config):
 def evaluate_spectra(config, logger=logging):
     ref = parse_ibsen_file(config['Data']['reference'])
     tar = parse_ibsen_file(config['Data']['target'])
+    logger.info("Files\n \t ref: %s  \n \t tar: %s \n" %(config['Data']['reference'], config['Data']['target']))
+    return evaluate_parsed(ref, tar, config, logger)
+
 
+def evaluate_parsed(ref, tar, config, logger=logging, plot=True):
+    """ Retrieval on parsed (or in memory calibrated) spectra, plot=False for headless runs """
     if tar['UTCTime']:
         logger.warning("Config UTCTime: %s. New UTCTime %s from IbsenFile." % (config['Processing']['utc_time'], tar['UTCTime']))
         config['Processing']['utc_time'] = dict()
@@ -64,31 +70,38 @@ def evaluate_spectra(config, logger=logging):
     logger.info("Tar Date: %s " % config['Processing']['utc_time']['tar'])
     logger.info("Ref Date: %s " % config['Processing']['utc_time']['ref'])
     logger.info("GPS coords (lat, lon) %s %s" % (config['Processing']['gps_coords'][0], config['Processing']['gps_coords'][1]))
-    logger.info("Files\n \t ref: %s  \n \t tar: %s \n" %(config['Data']['reference'], config['Data']['target']))
-
 
     Data = DataProcess(config['Fitting']['model'], logger)()
     data_dict = Data.process(ref, tar)
-    plot_meas(tar, ref)
-    if config['Processing']['logging_level'] == 'DEBUG':
+    if plot:
+        plot_meas(tar, ref)
+    if plot and config['Processing']['logging_level'] == 'DEBUG':
         plot_used_irradiance_and_reflectance(tar, ref, data_dict)
-        WeatherParams = WeatherAtmosphereParameter(logger, config, ref['wave'])
+    WeatherParams = WeatherAtmosphereParameter(logger, config, ref['wave'])
 
     aero = Aerosol_Retrievel(WeatherParams, config['Fitting'], data_dict, logger)
     result, param_dict = aero.getParams()
     logger.info("%s \n" % result.fit_report())
     logger.info("%s \n" % result.success)
 
-    if config['Processing']['logging_level'] == 'DEBUG':
+    if plot and config['Processing']['logging_level'] == 'DEBUG':
         plot_fitted_reflectance(result, param_dict, data_dict)
     return param_dict, result
 
 
+def result_row(params, config, file_):
+    """ One timeline row of an evaluate_parsed result """
+    row = {'utc_times': config['Processing']['utc_time']['tar'], 'sun_zenith': params['sun_zenith'], 'file': file_}
+    for key, item in params['variables'].items():
+        row[key] = item['value']
+        row['%s_stderr' % key] = item['stderr']
+    return row
+
+
 def evaluate_measurements(directory, config, logger=logging, output_file='RENAME_ME.csv'):
-    import glob
     import pandas as pd
     file_prefixes = ['target', 'reference']
-    files = [file_ for file_ in glob.iglob(directory + '%s*' % file_prefixes[0])]
+    pairs = pair_files(directory, build_index(directory), file_prefixes[0], file_prefixes[1:])
 
     result_timeline = dict()
     for param in config['Fitting']['params']:
@@ -97,10 +110,13 @@ def evaluate_measurements(directory, config, logger=logging, output_file='RENAME
     result_timeline['sun_zenith'] = np.array([])
     result_timeline['utc_times'] = np.array([])
 
-    for file_ in sorted(files):
-        for key in file_prefixes:
-            config['Data'][key] = file_.replace(file_prefixes[0], key)
+    for pair in pairs:
+        file_ = pair[file_prefixes[0]]
         try:
+            for key in file_prefixes:
+                if pair[key] is None:
+                    raise IOError('No %s for %s' % (key, file_))
+                config['Data'][key] = pair[key]
             pass
             logger.info("Evaluating file: %s \n" % file_)
             params, result = evaluate_spectra(config, logger)
@@ -132,7 +148,10 @@ if __name__ == "__main__":
     parser.add_argument('-c', '--config', default='config.ini', help='Pass ini-file for processing configurations')
     parser.add_argument('-m', '--measurement_directory', help='Define measurement directory to sweep through')
     parser.add_argument('-o', '--output_file', help='Write timeline results into output file')
+    parser.add_argument('--cache', default=None, const='', nargs='?', help='Cache parsed spectra (optional cache directory)')
     args = parser.parse_args()
+    if args.cache is not None:
+        enable_cache(args.cache or None)
     config = parse_ini_config(args.config)
     logger = create_logger(config['Processing'])
 
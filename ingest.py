@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+import os
+import time
+import logging
+import threading
+import pandas as pd
+from collections import OrderedDict
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+from evaluation import parse_ini_config, create_logger, evaluate_parsed, result_row
+from parser.ibsen_parser import parse_ibsen_file, parse_ibsen_header, enable_cache
+from parser.ibsen_index import split_file_name
+from calibration.level0to1 import calibrate_meas
+from calibration.calibration_kernel import CalibrationKernel
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+"""
+Watch-folder ingestion for live field campaigns
+
+New files are grouped by their file number (target003.asc, reference003.asc,
+darkcurrent003.asc). A set is handed to the bounded work queue once it has a
+target and a reference and none of its files changed for `settle` seconds.
+Raw sets are calibrated in memory (level0to1.calibrate_meas) against the
+darkcurrent of the set, without calibration products (-n, -r) they are
+rejected. Incomplete sets are dropped after PENDING_TIMEOUT seconds.
+If the workers fall behind the queue fills up and the scheduler blocks
+(backpressure), the sets wait on disk. Every result is appended to the
+output file immediately.
+
+Usage:
+    python ingest.py -m /path/to/measurements/ -o results.csv [-n nonlinearity_correction.txt -r response.txt]
+"""
+DONE_SIZE = 4096  # processed set numbers remembered against late events
+PENDING_TIMEOUT = 3600.  # seconds until an incomplete set is dropped
+REQUIRED = ('target', 'reference')
+
+
+class SetCollector(FileSystemEventHandler):
+    """ Collects created/modified .asc files per file number """
+
+    def __init__(self, types=('target', 'reference')):
+        FileSystemEventHandler.__init__(self)
+        self.types = types
+        self.lock = threading.Lock()
+        self.pending = dict()   # number -> {Type: path}
+        self.changed = dict()   # number -> time of last event
+        self.done = OrderedDict()  # bounded, oldest numbers dropped first
+
+    def add(self, path):
+        meas_type, number = split_file_name(path)
+        if meas_type not in self.types:
+            return
+        with self.lock:
+            if number in self.done:
+                return
+            self.pending.setdefault(number, dict())[meas_type] = path
+            self.changed[number] = time.time()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.add(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.add(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.add(event.dest_path)
+
+    def pop_ready(self, settle, required):
+        """ Return: complete sets without change for settle seconds, sorted by number """
+        now = time.time()
+        ready = []
+        with self.lock:
+            for number, files in sorted(self.pending.items()):
+                if now - self.changed[number] < settle or not set(required).issubset(files.keys()):
+                    continue
+                ready.append((number, self.pending.pop(number)))
+                del self.changed[number]
+                self.done[number] = True
+                if len(self.done) > DONE_SIZE:
+                    self.done.popitem(last=False)
+        return ready
+
+    def pop_stale(self, timeout):
+        """ Return: sets without change for timeout seconds, dropped from pending """
+        now = time.time()
+        with self.lock:
+            stale = [number for number, changed in sorted(self.changed.items()) if now - changed >= timeout]
+            for number in stale:
+                del self.changed[number]
+            return [(number, self.pending.pop(number)) for number in stale]
+
+
+class IngestionService:
+
+    def __init__(self, directory, config, output_file, logger=logging, nonlinear_file=None, response_file=None,
+                 queue_size=4, workers=1, settle=5.0, poll=1.0, timeout=PENDING_TIMEOUT):
+        self.directory = directory
+        self.config = config
+        self.output_file = output_file
+        self.logger = logger
+        self.nonlinear_file = nonlinear_file
+        self.response_file = response_file
+        self.settle = settle
+        self.poll = poll
+        self.timeout = timeout
+        self.calibrate = nonlinear_file is not None and response_file is not None
+        self.kernel = CalibrationKernel.from_files(nonlinear_file, response_file) if self.calibrate else None
+        if not self.calibrate:
+            self.logger.warning('No calibration products (-n, -r), only [DataCalibrated] sets are processed')
+        self.collector = SetCollector(['target', 'reference', 'darkcurrent'])
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = [threading.Thread(target=self._work) for _ in range(workers)]
+        self.scheduler = threading.Thread(target=self._schedule)
+        self.observer = Observer()
+        self.observer.schedule(self.collector, directory, recursive=False)
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self, existing=False):
+        if existing:
+            for name in sorted(os.listdir(self.directory)):
+                self.collector.add(os.path.join(self.directory, name))
+        self.observer.start()
+        for thread in self.workers + [self.scheduler]:
+            thread.daemon = True
+            thread.start()
+        self.logger.info("Watching %s" % self.directory)
+
+    def stop(self):
+        self.stopped.set()
+        self.observer.stop()
+        self.observer.join()
+        self.scheduler.join()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def run_forever(self, existing=False):
+        self.start(existing)
+        try:
+            while True:
+                time.sleep(self.poll)
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _schedule(self):
+        while not self.stopped.is_set():
+            for number, files in self.collector.pop_ready(self.settle, REQUIRED):
+                self.logger.info("Set %s complete, %s sets queued" % (number, self.queue.qsize()))
+                self.queue.put((number, files))  # blocks while the workers are busy
+            for number, files in self.collector.pop_stale(self.timeout):
+                self.logger.warning("Set %s incomplete after %s s, dropped: %s" % (number, self.timeout, sorted(files.values())))
+            self.stopped.wait(self.poll)
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            number, files = item
+            try:
+                self.append_result(self.process(files))
+            except Exception as e:
+                self.logger.error("Set %s failed: %s" % (number, e))
+            finally:
+                self.queue.task_done()
+
+    def load(self, files, key, dark_dict=None):
+        """ Level 1 spectrum, raw files calibrated against dark_dict """
+        if dark_dict is None:
+            return parse_ibsen_file(files[key])
+        return calibrate_meas(files[key], files['darkcurrent'], kernel=self.kernel, dark_dict=dark_dict)
+
+    def process(self, files):
+        config = dict(self.config)
+        config['Processing'] = dict(self.config['Processing'])
+        config['Fitting'] = dict(self.config['Fitting'])
+        config['Fitting']['independent'] = dict(self.config['Fitting']['independent'])
+        config['Data'] = {'target': files['target'], 'reference': files['reference']}
+        raw = [key for key in REQUIRED if not parse_ibsen_header(files[key])['darkcurrent_corrected']]
+        dark_dict = None
+        if raw:
+            if not self.calibrate:
+                raise ValueError('%s not calibrated, raw sets need the calibration products (-n, -r)' % ', '.join(raw))
+            if 'darkcurrent' not in files:
+                raise ValueError('%s not calibrated and the set has no darkcurrent' % ', '.join(raw))
+            dark_dict = parse_ibsen_file(files['darkcurrent'])  # once for both
+        ref = self.load(files, 'reference', dark_dict if 'reference' in raw else None)
+        tar = self.load(files, 'target', dark_dict if 'target' in raw else None)
+        self.logger.info("Evaluating file: %s \n" % files['target'])
+        params, result = evaluate_parsed(ref, tar, config, self.logger, plot=False)
+        return result_row(params, config, files['target'])
+
+    def append_result(self, row):
+        with self.write_lock:
+            header = not os.path.exists(self.output_file)
+            pd.DataFrame([row], columns=sorted(row.keys())).to_csv(self.output_file, mode='a', header=header, index=False)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', default='config.ini', help='Pass ini-file for processing configurations')
+    parser.add_argument('-m', '--measurement_directory', help='Directory to watch')
+    parser.add_argument('-o', '--output_file', default='ingest_results.csv', help='Results are appended to this file')
+    parser.add_argument('-n', '--nonlinear', default=None, help='Nonlinear correction file, calibrate raw sets in memory')
+    parser.add_argument('-r', '--response', default=None, help='Response file, calibrate raw sets in memory')
+    parser.add_argument('-q', '--queue_size', default=4, type=int, help='Maximum of queued sets')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='Retrieval worker threads')
+    parser.add_argument('-s', '--settle', default=5.0, type=float, help='Seconds without change before a set is processed')
+    parser.add_argument('-t', '--timeout', default=PENDING_TIMEOUT, type=float, help='Seconds until an incomplete set is dropped')
+    parser.add_argument('--existing', default=False, action='store_true', help='Process sets already in the directory')
+    parser.add_argument('--cache', default=None, const='', nargs='?', help='Cache parsed spectra (optional cache directory)')
+    args = parser.parse_args()
+    if args.cache is not None:
+        enable_cache(args.cache or None)
+    config = parse_ini_config(args.config)
+    logger = create_logger(config['Processing'])
+    service = IngestionService(args.measurement_directory, config, args.output_file, logger, args.nonlinear, args.response,
+                               args.queue_size, args.workers, args.settle, timeout=args.timeout)
+    service.run_forever(args.existing)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import os
+import glob
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from numpy.testing import assert_array_equal
+from ibsen_parser import parse_ibsen_file, flag_dict
+"""
+Benchmark of the single pass parser against the former two pass parser
+(pd.read_csv header + np.genfromtxt data block).
+
+Usage:
+    python benchmark_parser.py                      # 1000 synthetic files
+    python benchmark_parser.py -d /path/to/campaign/
+"""
+
+
+HEADER = '[Measurement] \n\
+Date    2016-05-25 \n\
+UTCTime 11:30:%02d \n\
+Project Benchmark \n\
+Testsite    RASTA \n\
+Station  \n\
+MeasurementType %s \n\
+NumSamples  %s\n\
+Comment Synthetic file for parser benchmark\n\
+\n\
+[SpectrometerHeader]\n\
+Manufacturer    Ibsen\n\
+Model   Freedom VIS FSV-305\n\
+Detector    S10420-1006-01\n\
+\n\
+[IntTime]\n\
+%s\n\
+\n\
+[DataRaw]\n'
+
+
+def legacy_parse_ibsen_file(filename, maxrows=50):
+    data_dict = dict()
+    header = pd.read_csv(filename, nrows=maxrows, skip_blank_lines=False).values
+    header = np.insert(header, 0, '[Measurement]')
+    data_dict['Type'] = header[np.where(np.array([str(s).find('Meas')
+                               for s in header]) == 0)[0][0]].split()[-1]
+    try:
+        date =  header[np.where(np.array([str(s).find('Date') for s in header]) == 0)[0][0]].split()[-1]
+        time =  header[np.where(np.array([str(s).find('UTCTime') for s in header]) == 0)[0][0]].split()[-1]
+        data_dict['UTCTime'] = datetime.strptime(date + ' ' + time, '%Y-%m-%d %H:%M:%S')
+    except IndexError:
+        data_dict['UTCTime'] = None
+    int_time = header[np.where(header == '[IntTime]')[0][0] + 1]
+    data_dict['IntTime'] = np.array([float(inter) for inter in int_time.split()])
+    data_dict['num_of_meas'] = len(data_dict['IntTime'])
+    data_dict['IntTime'] = data_dict['IntTime'][0]
+    data_dict['start_data_index'] = np.where((header == '[DataRaw]') | (header == '[DataCalibrated]'))[0][0] + 1
+    data_dict['darkcurrent_corrected'] = flag_dict[header[data_dict['start_data_index'] - 1]]
+    data = np.genfromtxt(filename, skip_header=data_dict['start_data_index'])
+    data_dict['wave'] = data[:, 0]
+    data_dict['data_mean'] = data[:, 1]
+    data_dict['data_std'] = data[:, 2]
+    data_dict['data_sample_std'] = np.std(data[:,3:], axis=1, ddof=1)
+    data_dict['data'] = data[:, 3:]
+    data_dict['tdata'] = np.transpose(data_dict['data'])
+    data_dict['mean'] = np.mean(data_dict['tdata'], axis=0)
+    return data_dict
+
+
+def create_synthetic_directory(directory, num_files=1000, channels=1024, num_of_meas=30):
+    wave = np.linspace(305., 905., channels)
+    for idx in range(num_files):
+        meas_type = ['darkcurrent', 'reference', 'target'][idx % 3]
+        scans = np.random.randint(1500, 3000, size=(channels, num_of_meas))
+        data = np.column_stack((wave, scans.mean(axis=1), scans.std(axis=1), scans))
+        with open(os.path.join(directory, '%s%04d.asc' % (meas_type, idx)), 'w') as fp:
+            fp.write(HEADER % (idx % 60, meas_type, num_of_meas, '  '.join(['40'] * num_of_meas)))
+            np.savetxt(fp, data, fmt='%.2f', delimiter='\t')
+
+
+def time_parser(parse, files):
+    start = time.time()
+    for file_ in files:
+        parse(file_)
+    return time.time() - start
+
+
+def check_equal(files):
+    for file_ in files:
+        new = parse_ibsen_file(file_)
+        old = legacy_parse_ibsen_file(file_)
+        for key, value in old.items():
+            assert_array_equal(new[key], value, err_msg='%s differs in %s' % (key, file_))
+
+
+def main(directory, num_files):
+    tmp_dir = None
+    if directory is None:
+        tmp_dir = tempfile.mkdtemp()
+        directory = tmp_dir + '/'
+        print('Creating %s synthetic files in %s' % (num_files, directory))
+        create_synthetic_directory(directory, num_files)
+    try:
+        files = sorted(glob.glob(directory + '*.asc'))
+        check_equal(files[:10])
+        legacy = time_parser(legacy_parse_ibsen_file, files)
+        single = time_parser(parse_ibsen_file, files)
+        print('Files: %s' % len(files))
+        print('Two pass parser:    %.2f s (%.2f ms/file)' % (legacy, legacy / len(files) * 1e3))
+        print('Single pass parser: %.2f s (%.2f ms/file)' % (single, single / len(files) * 1e3))
+        print('Speedup: %.1f' % (legacy / single))
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--directory', default=None, help='Measurement directory, synthetic files if not given')
+    parser.add_argument('-n', '--num_files', default=1000, type=int, help='Number of synthetic files')
+    args = parser.parse_args()
+    main(args.directory, args.num_files)
@@ -0,0 +1,200 @@
+import os
+import glob
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from ibsen_spectrum import IbsenSpectrum
+from ibsen_loader import parse_files
+"""
+Memory-mapped append-only archive of Ibsen spectra
+
+Layout of one archive file:
+    header      HEADER_DTYPE (magic, version, channels, max_scans, scan dtype)
+    wave        float64 shape(channels,), shared wavelength axis
+    padding     up to a multiple of ALIGNMENT
+    records     record_dtype(channels, max_scans, scan_dtype), fixed stride
+
+Every record holds the metadata (name, Type, UTCTime, IntTime, num_of_meas),
+data_mean, data_std and the scans (zero padded to max_scans). Appending
+writes records at the end only, readers np.memmap the record array and
+get zero-copy access by index or UTC time window.
+
+Usage:
+    python ibsen_archive.py -d /path/to/campaign/ -a campaign.ibsa
+"""
+MAGIC = b'IBSENARC'
+VERSION = 1
+ALIGNMENT = 64
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('channels', '<u4'), ('max_scans', '<u4'), ('scan_dtype', 'S4')])
+EPOCH = datetime(1970, 1, 1)
+
+
+def record_dtype(channels, max_scans, scan_dtype='<f4'):
+    return np.dtype([('name', 'S64'), ('Type', 'S16'), ('UTCTime', '<f8'), ('IntTime', '<f8'),
+                     ('num_of_meas', '<i4'), ('darkcurrent_corrected', '?'),
+                     ('data_mean', '<f8', (channels,)), ('data_std', '<f8', (channels,)),
+                     ('scans', scan_dtype, (max_scans, channels))])
+
+
+def data_offset(channels):
+    size = HEADER_DTYPE.itemsize + 8 * channels
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def to_seconds(utc_time):
+    return (utc_time - EPOCH).total_seconds() if utc_time else np.nan
+
+
+def to_datetime(seconds):
+    return None if np.isnan(seconds) else EPOCH + timedelta(seconds=float(seconds))
+
+
+def create_archive(archive_file, wave, max_scans, scan_dtype='<f4'):
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['channels'] = len(wave)
+    header['max_scans'] = max_scans
+    header['scan_dtype'] = np.dtype(scan_dtype).str.encode('ascii')
+    with open(archive_file, 'wb') as fp:
+        fp.write(header.tobytes())
+        fp.write(np.asarray(wave, dtype='<f8').tobytes())
+        fp.write(b'\0' * (data_offset(len(wave)) - fp.tell()))
+
+
+def read_header(archive_file):
+    with open(archive_file, 'rb') as fp:
+        header = np.frombuffer(fp.read(HEADER_DTYPE.itemsize), dtype=HEADER_DTYPE)[0]
+        if header['magic'] != MAGIC or header['version'] != VERSION:
+            raise IOError('%s is no Ibsen archive (version %s)' % (archive_file, VERSION))
+        wave = np.frombuffer(fp.read(8 * int(header['channels'])), dtype='<f8')
+    return header, wave
+
+
+def to_field(value, dtype, field, name):
+    """ Encoded string field of a record, too long values are rejected instead of cut """
+    encoded = value.encode('utf-8')
+    if len(encoded) > dtype[field].itemsize:
+        raise ValueError('%s %s of %s is longer than %s bytes' % (field, value, name, dtype[field].itemsize))
+    return encoded
+
+
+def check_scans(scans, scan_dtype, name):
+    """ Integer scan dtypes only for raw integer DN inside the range of the dtype (see ibsen_spectrum.to_storage) """
+    scan_dtype = np.dtype(scan_dtype)
+    if np.issubdtype(scan_dtype, np.integer):
+        info = np.iinfo(scan_dtype)
+        if not (np.all(scans >= info.min) and np.all(scans <= info.max) and np.all(scans == np.round(scans))):
+            raise ValueError('%s storage of %s needs raw integer DN in [%s, %s], use <f4' % (scan_dtype, name, info.min, info.max))
+
+
+def drop_torn_tail(archive_file, record_size):
+    """ Truncate a partially written last record, appends stay aligned to the record stride """
+    offset = data_offset(len(read_header(archive_file)[1]))
+    size = os.path.getsize(archive_file)
+    tail = (size - offset) % record_size
+    if tail:
+        logging.warning('Dropping %s bytes of a torn record at the end of %s' % (tail, archive_file))
+        with open(archive_file, 'r+b') as fp:
+            fp.truncate(size - tail)
+
+
+def append_spectra(archive_file, spectra, names, max_scans=None, scan_dtype='<f4'):
+    """ Append parsed spectra (IbsenSpectrum or ibsen_dict), the archive is created on first use """
+    if not os.path.exists(archive_file):
+        max_scans = max_scans or max(spectrum['tdata'].shape[0] for spectrum in spectra)
+        create_archive(archive_file, spectra[0]['wave'], max_scans, scan_dtype)
+    header, wave = read_header(archive_file)
+    dtype = record_dtype(len(wave), int(header['max_scans']), header['scan_dtype'].decode('ascii'))
+    records = np.zeros(len(spectra), dtype=dtype)
+    for record, spectrum, name in zip(records, spectra, names):
+        if not np.array_equal(spectrum['wave'], wave):
+            raise ValueError('Wavelength axis of %s differs from the archive' % name)
+        scans = spectrum['tdata']
+        if scans.shape[0] > header['max_scans']:
+            raise ValueError('%s has %s scans, archive stride is %s' % (name, scans.shape[0], header['max_scans']))
+        check_scans(scans, dtype['scans'].base, name)
+        record['name'] = to_field(os.path.basename(name), dtype, 'name', name)
+        record['Type'] = to_field(spectrum['Type'], dtype, 'Type', name)
+        record['UTCTime'] = to_seconds(spectrum['UTCTime'])
+        record['IntTime'] = spectrum['IntTime']
+        record['num_of_meas'] = scans.shape[0]
+        record['darkcurrent_corrected'] = spectrum['darkcurrent_corrected']
+        record['data_mean'] = spectrum['data_mean']
+        record['data_std'] = spectrum['data_std']
+        record['scans'][:scans.shape[0]] = scans
+    drop_torn_tail(archive_file, dtype.itemsize)
+    with open(archive_file, 'ab') as fp:
+        fp.write(records.tobytes())
+
+
+def convert_directory(directory, archive_file, pattern='*.asc', batch=256, processes=None, max_scans=None, scan_dtype='<f4'):
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+    for start in range(0, len(files), batch):
+        names = files[start:start + batch]
+        append_spectra(archive_file, parse_files(names, processes), names, max_scans, scan_dtype)
+    return IbsenArchive(archive_file)
+
+
+class IbsenArchive:
+
+    def __init__(self, archive_file):
+        self.archive_file = archive_file
+        header, self.wave = read_header(archive_file)
+        self.max_scans = int(header['max_scans'])
+        self.dtype = record_dtype(len(self.wave), self.max_scans, header['scan_dtype'].decode('ascii'))
+        offset = data_offset(len(self.wave))
+        count = (os.path.getsize(archive_file) - offset) // self.dtype.itemsize  # ignores a torn last append
+        self.records = np.memmap(archive_file, dtype=self.dtype, mode='r', offset=offset, shape=(count,)) if count else \
+            np.zeros(0, dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, idx):
+        return self.spectrum(idx)
+
+    def get_index(self):
+        return pd.DataFrame({'name': [name.decode('utf-8') for name in self.records['name']],
+                             'Type': [meas.decode('utf-8') for meas in self.records['Type']],
+                             'UTCTime': [to_datetime(seconds) for seconds in self.records['UTCTime']],
+                             'IntTime': np.array(self.records['IntTime']),
+                             'num_of_meas': np.array(self.records['num_of_meas'])},
+                            columns=['name', 'Type', 'UTCTime', 'IntTime', 'num_of_meas'])
+
+    def select_time(self, start, end=None, meas_type=None):
+        """ Return: indices of records with start <= UTCTime <= end """
+        seconds = np.asarray(self.records['UTCTime'])
+        mask = seconds >= to_seconds(start)
+        if end is not None:
+            mask &= seconds <= to_seconds(end)
+        if meas_type is not None:
+            mask &= np.asarray(self.records['Type']) == meas_type.encode('utf-8')
+        return np.where(mask)[0]
+
+    def spectrum(self, idx):
+        """ IbsenSpectrum, the scans are a read-only view into the memory map """
+        record = self.records[idx]
+        num_of_meas = int(record['num_of_meas'])
+        raw = np.column_stack((self.wave, record['data_mean'], record['data_std']))
+        return IbsenSpectrum(raw, np.transpose(record['scans'][:num_of_meas]),
+                             Type=record['Type'].decode('utf-8'), UTCTime=to_datetime(record['UTCTime']),
+                             IntTime=float(record['IntTime']), num_of_meas=num_of_meas,
+                             darkcurrent_corrected=bool(record['darkcurrent_corrected']), start_data_index=None)
+
+    def scans(self, indices):
+        """ Zero-copy slice shape(len(indices), max_scans, channels) for contiguous index ranges """
+        return self.records['scans'][indices]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--directory', help='Directory of .asc files')
+    parser.add_argument('-a', '--archive', help='Archive file, created or appended to')
+    parser.add_argument('--dtype', default='float32', choices=['float64', 'float32', 'uint16'], help='Scan dtype in the archive')
+    parser.add_argument('--max_scans', default=None, type=int, help='Scan stride, default the largest NumSamples of the first batch')
+    args = parser.parse_args()
+    archive = convert_directory(args.directory, args.archive, max_scans=args.max_scans, scan_dtype=np.dtype(args.dtype).str)
+    print('%s records in %s' % (len(archive), args.archive))
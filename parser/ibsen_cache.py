@@ -0,0 +1,100 @@
+import os
+import hashlib
+import logging
+import numpy as np
+from datetime import datetime
+from ibsen_spectrum import IbsenSpectrum
+"""
+Binary sidecar cache for parsed Ibsen spectra
+
+Each parsed file is stored as an uncompressed .npz inside one cache directory.
+The entry name is derived from (absolute path, size, mtime) of the .asc file,
+so a modified file never hits a stale entry. The directory is bounded in size,
+least recently used entries are evicted first (a hit touches the entry).
+"""
+UTC_FORMAT = '%Y-%m-%d %H:%M:%S'
+META_KEYS = ['Type', 'IntTime', 'num_of_meas', 'start_data_index', 'darkcurrent_corrected']
+
+
+class SpectraCache:
+
+    def __init__(self, directory, max_bytes=512 * 1024 ** 2):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def entry(self, filename, dtype=None):
+        stat = os.stat(filename)
+        key = '%s|%s|%s' % (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+        if dtype is not None:
+            key += '|%s' % np.dtype(dtype).name
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+    def load(self, filename, dtype=None):
+        entry = self.entry(filename, dtype)
+        try:
+            with np.load(entry) as npz:
+                raw = npz['raw']
+                scans = npz['scans'] if 'scans' in npz.files else None
+                data_dict = {key: npz[key].item() for key in META_KEYS}
+                utc_time = str(npz['UTCTime'])
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        os.utime(entry, None)  # LRU bookkeeping
+        data_dict['UTCTime'] = datetime.strptime(utc_time, UTC_FORMAT) if utc_time else None
+        return IbsenSpectrum(raw, scans, **data_dict)
+
+    def store(self, filename, data_dict, dtype=None):
+        """ data_dict: IbsenSpectrum as returned by read_ibsen_file """
+        entry = self.entry(filename, dtype)
+        arrays = {key: data_dict[key] for key in META_KEYS}
+        arrays['raw'] = data_dict.raw
+        if data_dict.separate_scans():
+            arrays['scans'] = data_dict.scans
+        arrays['UTCTime'] = data_dict['UTCTime'].strftime(UTC_FORMAT) if data_dict['UTCTime'] else ''
+        tmp_entry = '%s.%s.tmp' % (entry, os.getpid())
+        try:
+            with open(tmp_entry, 'wb') as fp:
+                np.savez(fp, **arrays)
+            os.rename(tmp_entry, entry)
+        except (IOError, OSError) as e:
+            logging.warning('Could not write cache entry for %s: %s' % (filename, e))
+            return
+        self._size = self.size() if self._size is None else self._size + os.path.getsize(entry)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(entry[1] for entry in self._entries())
+
+    def evict(self):
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+        self._size = size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            os.remove(path)
+        self._size = 0
@@ -0,0 +1,226 @@
+import os
+import glob
+import json
+import zlib
+import struct
+import numpy as np
+from ibsen_parser import ARCHIVE_SEPARATOR, tokenize_header, header_to_dict, parse_data_block, build_spectrum, flag_dict
+try:
+    import lzma
+except ImportError:
+    lzma = None
+"""
+Compressed lossless archive of raw Ibsen files (cold storage, site transfer)
+
+Layout:
+    MAGIC
+    chunks      compressed blobs of up to chunk_members files each
+    index       zlib compressed json {'chunks': [..], 'members': [..]}
+    footer      FOOTER (index offset, MAGIC)
+
+Member blob inside a decompressed chunk:
+    header text     lines in front of the numeric block, utf-8
+    columns         float64 shape(channels, 3), wave, data_mean, data_std
+    scans           integer DN: per-channel delta along the scans, smallest
+                    int dtype holding the deltas; otherwise float64 as is
+
+Single members are read via 'archive.ibsz::member.asc' paths, see
+parse_ibsen_file. Only the chunk holding the member is decompressed.
+
+Usage:
+    python ibsen_dn_archive.py -d /path/to/campaign/ -a campaign.ibsz
+"""
+MAGIC = b'IBSENDNZ'
+FOOTER = struct.Struct('<Q8s')
+COMPRESSORS = {'zlib': (lambda blob: zlib.compress(blob, 9), zlib.decompress)}
+if lzma is not None:
+    COMPRESSORS['lzma'] = (lzma.compress, lzma.decompress)
+_archives = dict()
+
+
+def delta_encode(scans):
+    """ Return: (encoded bytes, dtype str), dtype None if scans are not integer DN """
+    if scans.size == 0 or not np.array_equal(scans, np.round(scans)) or np.abs(scans).max() >= 2 ** 53:
+        return scans.astype('<f8').tobytes(), None
+    scans = scans.astype(np.int64)
+    delta = np.concatenate((scans[:, :1], np.diff(scans, axis=1)), axis=1)
+    dtype = np.promote_types(np.min_scalar_type(delta.min()), np.min_scalar_type(delta.max()))
+    dtype = np.promote_types(dtype, np.int8).newbyteorder('<')
+    return delta.astype(dtype).tobytes(), dtype.str
+
+
+def delta_decode(blob, dtype, channels, scans):
+    if dtype is None:
+        return np.frombuffer(blob, dtype='<f8').reshape(channels, scans)
+    delta = np.frombuffer(blob, dtype=dtype).reshape(channels, scans)
+    return np.cumsum(delta, axis=1, dtype=np.int64).astype(np.float64)
+
+
+def encode_file(filename, maxrows=50):
+    """ Return: (member blob, index entry) """
+    with open(filename, 'r') as fp:
+        lines = fp.read().splitlines()
+    header, start_data_index = tokenize_header(lines, maxrows)
+    meta = header_to_dict(header)
+    data = parse_data_block(lines[start_data_index:])
+    header_text = '\n'.join(lines[:start_data_index]).encode('utf-8')
+    scans, dtype = delta_encode(data[:, 3:])
+    entry = {'name': os.path.basename(filename), 'header': len(header_text), 'channels': data.shape[0],
+             'scans': data.shape[1] - 3, 'dtype': dtype, 'Type': meta['Type'], 'IntTime': meta['IntTime'],
+             'UTCTime': meta['UTCTime'].strftime('%Y-%m-%d %H:%M:%S') if meta['UTCTime'] else None}
+    return header_text + data[:, :3].astype('<f8').tobytes() + scans, entry
+
+
+def read_index(archive_file):
+    """ Return: (index dict, index offset) """
+    with open(archive_file, 'rb') as fp:
+        if fp.read(len(MAGIC)) != MAGIC:
+            raise IOError('%s is no Ibsen DN archive' % archive_file)
+        fp.seek(-FOOTER.size, os.SEEK_END)
+        offset, magic = FOOTER.unpack(fp.read(FOOTER.size))
+        if magic != MAGIC:
+            raise IOError('%s has no index (incomplete write)' % archive_file)
+        fp.seek(offset)
+        index = json.loads(zlib.decompress(fp.read()[:-FOOTER.size]).decode('utf-8'))
+    return index, offset
+
+
+def pack_files(files, archive_file, chunk_members=16, compression='zlib', maxrows=50):
+    """
+    Pack .asc files into archive_file, appends to an existing archive.
+    New chunks are written behind the current index and footer (which stays
+    as a few unused bytes), the new index is written last. Any error truncates the file back to its previous size,
+    so the archive keeps its old index and stays readable.
+    """
+    compress = COMPRESSORS[compression][0]
+    created = not os.path.exists(archive_file)
+    if created:
+        index = {'chunks': [], 'members': []}
+        with open(archive_file, 'wb') as fp:
+            fp.write(MAGIC)
+    else:
+        index, _ = read_index(archive_file)
+    names = set(member['name'] for member in index['members'])
+    for filename in files:
+        name = os.path.basename(filename)
+        if name in names:
+            raise ValueError('%s is already part of %s' % (name, archive_file))
+        names.add(name)
+    size = os.path.getsize(archive_file)
+    try:
+        with open(archive_file, 'r+b') as fp:
+            fp.seek(size)
+            for start in range(0, len(files), chunk_members):
+                blobs = []
+                chunk_size = 0
+                for filename in files[start:start + chunk_members]:
+                    blob, entry = encode_file(filename, maxrows)
+                    entry['chunk'] = len(index['chunks'])
+                    entry['offset'] = chunk_size
+                    entry['length'] = len(blob)
+                    chunk_size += len(blob)
+                    blobs.append(blob)
+                    index['members'].append(entry)
+                compressed = compress(b''.join(blobs))
+                index['chunks'].append({'offset': fp.tell(), 'length': len(compressed), 'compression': compression})
+                fp.write(compressed)
+            offset = fp.tell()
+            fp.write(zlib.compress(json.dumps(index).encode('utf-8')))
+            fp.write(FOOTER.pack(offset, MAGIC))
+    except BaseException:
+        if created:
+            os.remove(archive_file)
+        else:
+            with open(archive_file, 'r+b') as fp:
+                fp.truncate(size)
+        raise
+    finally:
+        _archives.pop(os.path.abspath(archive_file), None)
+
+
+def pack_directory(directory, archive_file, pattern='*.asc', chunk_members=16, compression='zlib'):
+    pack_files(sorted(glob.glob(os.path.join(directory, pattern))), archive_file, chunk_members, compression)
+    return DNArchive(archive_file)
+
+
+class DNArchive:
+
+    def __init__(self, archive_file):
+        self.archive_file = archive_file
+        index, _ = read_index(archive_file)
+        self.chunks = index['chunks']
+        self.members = dict((member['name'], member) for member in index['members'])
+        self.names = [member['name'] for member in index['members']]
+        self._chunk = (None, None)  # last decompressed chunk, sequential reads decompress once
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def paths(self):
+        """ Return: 'archive::member' paths for parse_ibsen_file """
+        return ['%s%s%s' % (self.archive_file, ARCHIVE_SEPARATOR, name) for name in self.names]
+
+    def select_time(self, start, end):
+        """ Return: member names with start <= UTCTime <= end """
+        start, end = [time.strftime('%Y-%m-%d %H:%M:%S') for time in (start, end)]
+        return [name for name in self.names
+                if self.members[name]['UTCTime'] and start <= self.members[name]['UTCTime'] <= end]
+
+    def read_chunk(self, idx):
+        if self._chunk[0] != idx:
+            chunk = self.chunks[idx]
+            with open(self.archive_file, 'rb') as fp:
+                fp.seek(chunk['offset'])
+                blob = fp.read(chunk['length'])
+            self._chunk = (idx, COMPRESSORS[chunk['compression']][1](blob))
+        return self._chunk[1]
+
+    def read_raw(self, name):
+        """ Return: (header lines, data shape(channels, 3 + scans)) """
+        member = self.members[name]
+        blob = self.read_chunk(member['chunk'])[member['offset']:member['offset'] + member['length']]
+        channels, scans = member['channels'], member['scans']
+        split = member['header'] + 24 * channels
+        columns = np.frombuffer(blob[member['header']:split], dtype='<f8').reshape(channels, 3)
+        data = np.hstack((columns, delta_decode(blob[split:], member['dtype'], channels, scans)))
+        return blob[:member['header']].decode('utf-8').splitlines(), data
+
+    def read(self, name, dtype=None):
+        lines, data = self.read_raw(name)
+        header, start_data_index = tokenize_header(lines, len(lines))
+        data_dict = header_to_dict(header)
+        data_dict['start_data_index'] = start_data_index
+        data_dict['darkcurrent_corrected'] = flag_dict[header['data_section']]
+        return build_spectrum(data, dtype, **data_dict)
+
+
+def open_archive(archive_file):
+    """ Per process cache of opened archives, the index is read once """
+    key = os.path.abspath(archive_file)
+    if key not in _archives:
+        _archives[key] = DNArchive(archive_file)
+    return _archives[key]
+
+
+def read_member(path, dtype=None):
+    archive_file, name = path.rsplit(ARCHIVE_SEPARATOR, 1)
+    return open_archive(archive_file).read(name, dtype)
+
+
+def archive_paths(archive_file):
+    return open_archive(archive_file).paths()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--directory', help='Directory of raw .asc files')
+    parser.add_argument('-a', '--archive', help='Archive file, created or appended to')
+    parser.add_argument('-c', '--compression', default='zlib', choices=sorted(COMPRESSORS))
+    parser.add_argument('--chunk', default=16, type=int, help='Files per compressed chunk')
+    args = parser.parse_args()
+    archive = pack_directory(args.directory, args.archive, chunk_members=args.chunk, compression=args.compression)
+    print('%s files in %s (%s bytes)' % (len(archive), args.archive, os.path.getsize(args.archive)))
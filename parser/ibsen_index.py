@@ -0,0 +1,142 @@
+import os
+import re
+import glob
+import logging
+import pandas as pd
+from ibsen_parser import parse_ibsen_header
+"""
+Header only index of a measurement directory
+
+The index is persisted as INDEX_FILE inside the measurement directory and
+updated incrementally: only files that are new or changed (size, mtime)
+get their header read, removed files are dropped. Pairing of target,
+reference and darkcurrent files and time window selection run on the
+index without touching the spectral data. Files are paired by their file
+name (target003.asc, reference003.asc, darkcurrent003.asc), files without a
+file number are not paired.
+"""
+INDEX_FILE = '.ibsen_index.csv'
+COLUMNS = ['file', 'number', 'size', 'mtime', 'Type', 'UTCTime', 'IntTime', 'NumSamples', 'Model', 'Detector']
+file_number = re.compile(r'([0-9]{3,})\.asc$')
+file_name = re.compile(r'^([a-zA-Z_]+?)_?([0-9]{3,})\.asc$')
+
+
+def get_file_number(file_):
+    match = file_number.search(file_)
+    return match.group(1) if match else ''
+
+
+def split_file_name(file_):
+    """ 'target003.asc' -> ('target', '003'), (None, None) without file number """
+    match = file_name.match(os.path.basename(file_))
+    return match.groups() if match else (None, None)
+
+
+def read_index(directory):
+    try:
+        index = pd.read_csv(os.path.join(directory, INDEX_FILE), dtype={'number': str, 'Model': str, 'Detector': str},
+                            parse_dates=['UTCTime'], keep_default_na=False, na_values={'UTCTime': ['']})
+    except (IOError, OSError, ValueError):
+        return pd.DataFrame(columns=COLUMNS)
+    if list(index.columns) != COLUMNS:
+        return pd.DataFrame(columns=COLUMNS)
+    return index
+
+
+def write_index(directory, index):
+    index_file = os.path.join(directory, INDEX_FILE)
+    tmp_file = '%s.%s.tmp' % (index_file, os.getpid())
+    try:
+        index.to_csv(tmp_file, index=False, columns=COLUMNS, date_format='%Y-%m-%d %H:%M:%S')
+        os.rename(tmp_file, index_file)
+    except (IOError, OSError) as e:
+        logging.warning('Index of %s not persisted: %s' % (directory, e))
+
+
+def index_row(directory, file_, stat):
+    header = parse_ibsen_header(os.path.join(directory, file_))
+    return {'file': file_, 'number': get_file_number(file_), 'size': stat.st_size, 'mtime': stat.st_mtime,
+            'Type': header['Type'], 'UTCTime': header['UTCTime'], 'IntTime': header['IntTime'],
+            'NumSamples': header['NumSamples'], 'Model': header['Model'], 'Detector': header['Detector']}
+
+
+def build_index(directory, pattern='*.asc'):
+    """
+    Return:
+        index: pandas.DataFrame with COLUMNS, one row per file sorted by file name
+    """
+    old = read_index(directory)
+    known = {row['file']: row for row in old.to_dict('records')}
+    rows = []
+    changed = False
+    for path in glob.iglob(os.path.join(directory, pattern)):
+        file_ = os.path.basename(path)
+        stat = os.stat(path)
+        row = known.pop(file_, None)
+        if row is None or row['size'] != stat.st_size or row['mtime'] != stat.st_mtime:
+            try:
+                row = index_row(directory, file_, stat)
+            except (ValueError, KeyError, IndexError, AssertionError) as e:
+                logging.error('Skipping %s in index: %s' % (path, e))
+                continue
+            changed = True
+        rows.append(row)
+    changed = changed or len(known) > 0
+    index = pd.DataFrame(rows, columns=COLUMNS).sort_values('file').reset_index(drop=True)
+    index['UTCTime'] = pd.to_datetime(index['UTCTime'])
+    if changed:
+        write_index(directory, index)
+    return index
+
+
+def get_path(directory, index):
+    return [os.path.join(directory, file_) for file_ in index['file']]
+
+
+def filter_index(index, **conditions):
+    """ filter_index(index, Type='target', IntTime=40.0) """
+    mask = pd.Series(True, index=index.index)
+    for key, value in conditions.items():
+        mask &= index[key] == value
+    return index[mask]
+
+
+def select_time_window(index, start=None, end=None):
+    mask = pd.Series(True, index=index.index)
+    if start is not None:
+        mask &= index['UTCTime'] >= start
+    if end is not None:
+        mask &= index['UTCTime'] <= end
+    return index[mask]
+
+
+def pair_files(directory, index, primary='target', partners=('reference',)):
+    """
+    Pair every primary file with the partner files of the same file number
+    Return:
+        [{'target': path, 'reference': path or None}, ..] sorted by primary file name
+    """
+    pairs = []
+    for files in group_by_number(directory, index).values():
+        if primary not in files:
+            continue
+        pair = {primary: files[primary]}
+        for partner in partners:
+            pair[partner] = files.get(partner)
+        pairs.append(pair)
+    return sorted(pairs, key=lambda pair: pair[primary])
+
+
+def group_by_number(directory, index):
+    """
+    Group by file name prefix and file number, files without file number are skipped
+    Return:
+        {number: {prefix: path}} e.g. {'003': {'darkcurrent': .., 'reference': .., 'target': ..}}
+    """
+    groups = dict()
+    for file_ in index['file']:
+        prefix, number = split_file_name(file_)
+        if number is None:
+            continue
+        groups.setdefault(number, dict())[prefix] = os.path.join(directory, file_)
+    return groups
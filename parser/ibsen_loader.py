@@ -0,0 +1,63 @@
+import os
+import glob
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from ibsen_parser import parse_ibsen_file
+"""
+Parallel bulk loader
+
+cube_dict:
+    {'files': array([..]) shape(files,),
+     'wave': array([..]) shape(channels,),
+     'tdata': array([[[..]]]) shape(files, scans, channels), NaN padded if NumSamples differ,
+     'mean': array([[..]]) shape(files, channels),
+     'data_sample_std': array([[..]]) shape(files, channels),
+     'Type', 'UTCTime', 'IntTime', 'num_of_meas', 'darkcurrent_corrected': arrays shape(files,)}
+"""
+META_KEYS = ['Type', 'UTCTime', 'IntTime', 'num_of_meas', 'darkcurrent_corrected']
+
+
+def parse_files(files, processes=None):
+    """ parse_ibsen_file over a process pool, order of files is kept """
+    processes = processes or cpu_count()
+    if processes == 1 or len(files) < 2:
+        return [parse_ibsen_file(file_) for file_ in files]
+    pool = Pool(min(processes, len(files)))
+    try:
+        return pool.map(parse_ibsen_file, files, chunksize=max(1, len(files) // (4 * processes)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def stack_spectra(ibsen_dicts, files=None):
+    wave = ibsen_dicts[0]['wave']
+    for idx, ibsen_dict in enumerate(ibsen_dicts):
+        if not np.array_equal(ibsen_dict['wave'], wave):
+            raise ValueError('Wavelength axis of %s differs' % (files[idx] if files else idx))
+    max_scans = max(ibsen_dict['tdata'].shape[0] for ibsen_dict in ibsen_dicts)
+    cube = np.full((len(ibsen_dicts), max_scans, len(wave)), np.nan)
+    for idx, ibsen_dict in enumerate(ibsen_dicts):
+        cube[idx, :ibsen_dict['tdata'].shape[0]] = ibsen_dict['tdata']
+    cube_dict = {'files': np.array(files if files else []), 'wave': wave, 'tdata': cube,
+                 'mean': np.array([ibsen_dict['mean'] for ibsen_dict in ibsen_dicts]),
+                 'data_sample_std': np.array([ibsen_dict['data_sample_std'] for ibsen_dict in ibsen_dicts])}
+    for key in META_KEYS:
+        cube_dict[key] = np.array([ibsen_dict[key] for ibsen_dict in ibsen_dicts])
+    return cube_dict
+
+
+def load_files(files, processes=None):
+    return stack_spectra(parse_files(files, processes), files)
+
+
+def load_directory(directory, pattern='*.asc', processes=None):
+    files = sorted(glob.glob(os.path.join(directory, pattern)))
+    if not files:
+        raise IOError('No %s files in %s' % (pattern, directory))
+    return load_files(files, processes)
+
+
+def select(cube_dict, mask):
+    """ Subset of a cube_dict, e.g. select(cube, cube['Type'] == 'darkcurrent') """
+    return {key: value[mask] if key != 'wave' else value for key, value in cube_dict.items()}
@@ -1,15 +1,18 @@
+import os
 import numpy as np
-import pandas as pd
 import logging
-import copy
+from itertools import islice
 from datetime import datetime
+from ibsen_cache import SpectraCache
+from ibsen_spectrum import IbsenSpectrum, to_storage
+from utils.util import get_cache_directory
 """
 FREEDOM VIS - Ibsen
     360 to 830 nm wavelength range
     Numerical aperture of 0.16
     Minimum resolution of 1.3 nm (FWHM)
     Footprint of 25 mm x 48 mm
-ibsen_dict:
+ibsen_dict: IbsenSpectrum with dict access (see ibsen_spectrum)
     {'num_of_meas': <int>,
     'data_mean': array([..]),
     'tdata': array([[..],..,[..]]) shape(30, 1024),
@@ -20,50 +23,227 @@ ibsen_dict:
     'data': array([[..],..,[..]]) shape(1024, 30)}
 """
 flag_dict = {'[DataRaw]':False, '[DataCalibrated]':True}
+ARCHIVE_SEPARATOR = '::'
+SERIAL_KEYS = ['SerialNumber', 'SerialNo', 'Serial']
+TEMPERATURE_KEYS = ['Temperature', 'DetectorTemperature']
+_cache = None
+_storage_dtype = None
 
 
-def parse_ibsen_file(filename, maxrows=50):
+def enable_cache(directory=None, max_mb=512):
+    """ Route parse_ibsen_file through a binary sidecar cache (see ibsen_cache) """
+    global _cache
+    _cache = SpectraCache(directory or get_cache_directory('spectra'), max_mb * 1024 ** 2)
+    return _cache
+
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+
+def set_storage_dtype(dtype=None):
+    """ Default storage dtype of the scans (np.float32, np.uint16), None keeps float64 """
+    global _storage_dtype
+    _storage_dtype = None if dtype is None or np.dtype(dtype) == np.float64 else np.dtype(dtype)
+
+
+def parse_ibsen_file(filename, maxrows=50, stream=False, chunk_size=256, keep_every=None, dtype=None):
+    """
+    Args:
+        stream: fold the scans into running mean/std while reading (stream_ibsen_file),
+                for long acquisitions with thousands of scans. A cached full parse or an archive
+                member is thinned instead, streamed results are not cached (the scans are never held)
+        chunk_size, keep_every: see stream_ibsen_file
+        dtype: storage dtype of the scans, default set_storage_dtype (float64)
+    filename may point into a DN archive as 'archive.ibsz::member.asc' (see ibsen_dn_archive)
+    """
+    dtype = dtype or _storage_dtype
+    if ARCHIVE_SEPARATOR in filename:
+        from ibsen_dn_archive import read_member  # ibsen_dn_archive imports this module
+        spectrum = read_member(filename, dtype)
+        return thin_spectrum(spectrum, keep_every, dtype) if stream else spectrum
+    if stream:
+        cached = _cache.load(filename, dtype) if _cache is not None else None
+        if cached is not None:
+            return thin_spectrum(cached, keep_every, dtype)
+        return stream_ibsen_file(filename, maxrows, chunk_size, keep_every, dtype)
+    if _cache is not None:
+        data_dict = _cache.load(filename, dtype)
+        if data_dict is None:
+            data_dict = read_ibsen_file(filename, maxrows, dtype)
+            _cache.store(filename, data_dict, dtype)
+        return data_dict
+    return read_ibsen_file(filename, maxrows, dtype)
+
+
+def build_spectrum(data, dtype=None, **items):
+    if dtype is None or np.dtype(dtype) == np.float64:
+        return IbsenSpectrum(data, **items)
+    return IbsenSpectrum(np.array(data[:, :3]), to_storage(data[:, 3:], dtype), **items)
+
+
+def read_ibsen_file(filename, maxrows=50, dtype=None):
+    """
+    Single pass over the file: the header sections are tokenized line by line
+    until [DataRaw] or [DataCalibrated], the remaining lines are converted
+    as one numeric block.
+    """
+    with open(filename, 'r') as fp:
+        lines = fp.read().splitlines()
+    header, start_data_index = tokenize_header(lines, maxrows)
+    data_dict = header_to_dict(header)
+    data_dict['start_data_index'] = start_data_index
+    data_dict['darkcurrent_corrected'] = flag_dict[header['data_section']]
+    return build_spectrum(parse_data_block(lines[start_data_index:]), dtype, **data_dict)
+
+
+def stream_ibsen_file(filename, maxrows=50, chunk_size=256, keep_every=None, dtype=None):
+    """
+    Streaming parse: the data block is channel major (one line per channel,
+    one column per scan). chunk_size whole channel lines at a time are
+    converted as one numeric block and reduced to the mean/std of their
+    scans, memory stays O(chunk_size * scans) besides the optional thinned
+    scans instead of O(channels * scans).
+    Args:
+        keep_every: keep every n-th scan as 'data'/'tdata', None keeps no scans
+    Return:
+        IbsenSpectrum with 'mean' and 'data_sample_std' over all scans,
+        'num_of_meas' all scans, 'data' shape(channels, kept scans)
+    """
+    columns, mean, sample_std = [], [], []
+    width = None
+    with open(filename, 'r') as fp:
+        header, start_data_index = tokenize_header(fp, maxrows)
+        while True:
+            lines = list(islice(fp, chunk_size))
+            if not lines:
+                break
+            rows = [line for line in lines if line.strip()]
+            if not rows:
+                continue
+            width = width or len(rows[0].split())
+            block = np.fromstring(' '.join(rows), sep=' ')
+            if block.size != len(rows) * width:
+                raise ValueError('Ragged data block in %s' % filename)
+            block = block.reshape(len(rows), width)
+            mean.append(np.mean(block[:, 3:], axis=1))
+            sample_std.append(np.std(block[:, 3:], axis=1, ddof=1))
+            columns.append(np.concatenate((block[:, :3], block[:, 3::keep_every] if keep_every else block[:, 3:3]), axis=1))
+    data_dict = header_to_dict(header)
+    data_dict['start_data_index'] = start_data_index
+    data_dict['darkcurrent_corrected'] = flag_dict[header['data_section']]
+    data_dict['mean'] = np.concatenate(mean)
+    data_dict['data_sample_std'] = np.concatenate(sample_std)
+    data_dict['scan_step'] = keep_every
+    return build_spectrum(np.concatenate(columns), dtype, **data_dict)
+
+
+def thin_spectrum(spectrum, keep_every=None, dtype=None):
+    """ stream_ibsen_file result of a fully parsed spectrum (cache hit) """
+    scans = spectrum['data'][:, ::keep_every] if keep_every else spectrum['data'][:, :0]
+    data = np.concatenate((np.transpose([spectrum['wave'], spectrum['data_mean'], spectrum['data_std']]), scans), axis=1)
+    data_dict = dict((key, spectrum[key]) for key in ['Type', 'UTCTime', 'IntTime', 'num_of_meas', 'start_data_index',
+                                                      'darkcurrent_corrected', 'mean', 'data_sample_std'])
+    data_dict['scan_step'] = keep_every
+    return build_spectrum(data, dtype, **data_dict)
+
+
+def parse_ibsen_header(filename, maxrows=50):
+    """ Header metadata only, the numeric block is never read """
+    with open(filename, 'r') as fp:
+        header, start_data_index = tokenize_header(fp, maxrows)
+    data_dict = header_to_dict(header)
+    data_dict['start_data_index'] = start_data_index
+    data_dict['darkcurrent_corrected'] = flag_dict[header['data_section']]
+    data_dict['NumSamples'] = int(header['[Measurement]'].get('NumSamples', data_dict['num_of_meas']))
+    data_dict['Model'] = header.get('[SpectrometerHeader]', dict()).get('Model', '')
+    data_dict['Detector'] = header.get('[SpectrometerHeader]', dict()).get('Detector', '')
+    serials = [header.get('[SpectrometerHeader]', dict()).get(key) for key in SERIAL_KEYS]
+    data_dict['Serial'] = ([serial for serial in serials if serial] + [''])[0]
+    data_dict['Temperature'] = header_temperature(header)
+    return data_dict
+
+
+def header_temperature(header):
+    """ Temperature [degC] from [Measurement] or [SpectrometerHeader], None if not recorded """
+    for section in ['[Measurement]', '[SpectrometerHeader]']:
+        for key in TEMPERATURE_KEYS:
+            value = header.get(section, dict()).get(key)
+            if value:
+                try:
+                    return float(value.split()[0])
+                except ValueError:
+                    logging.warning('Unreadable %s %s in header' % (key, value))
+    return None
+
+
+def tokenize_header(lines, maxrows=50):
+    """
+    Args:
+        lines: list of lines or open file, only the header lines are consumed
+    Return:
+        header: {'[Section]': {key: value}, '[IntTime]': <first line>, 'data_section': '[DataRaw]'}
+        start_data_index: number of lines in front of the numeric block
+    """
+    header = dict()
+    section = '[Measurement]'
+    header[section] = dict()
+    for idx, line in enumerate(islice(lines, maxrows + 1)):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped in flag_dict:
+            header['data_section'] = stripped
+            return header, idx + 1
+        if stripped.startswith('['):
+            section = stripped
+            if section != '[IntTime]':
+                header.setdefault(section, dict())
+        elif section == '[IntTime]':
+            header.setdefault(section, stripped)
+        else:
+            key_value = stripped.split(None, 1)
+            header[section].setdefault(key_value[0], key_value[-1] if len(key_value) > 1 else '')
+    raise ValueError('No [DataRaw] or [DataCalibrated] section within %s header lines' % maxrows)
+
+
+def header_to_dict(header):
     data_dict = dict()
-    header = pd.read_csv(filename, nrows=maxrows, skip_blank_lines=False).values
-    header = np.insert(header, 0, '[Measurement]')
-    header_tmp = header.reshape(1, len(header))[0]
-    # TODO: Add comment
-    assert header.all() == header_tmp.all()
-    data_dict['Type'] = header[np.where(np.array([str(s).find('Meas')
-                               for s in header]) == 0)[0][0]].split()[-1]
+    measurement = header['[Measurement]']
+    data_dict['Type'] = measurement['MeasurementType'].split()[-1]
     try:
-        date =  header[np.where(np.array([str(s).find('Date') for s in header]) == 0)[0][0]].split()[-1]
-        time =  header[np.where(np.array([str(s).find('UTCTime') for s in header]) == 0)[0][0]].split()[-1]
+        date = measurement['Date'].split()[-1]
+        time = measurement['UTCTime'].split()[-1]
         data_dict['UTCTime'] = datetime.strptime(date + ' ' + time, '%Y-%m-%d %H:%M:%S')
-    except IndexError:
+    except KeyError:
         #logging.error("No [UTCTime] in measurments. Setting UTCTime to None")
         data_dict['UTCTime'] = None
 
-    int_time = header[np.where(header == '[IntTime]')[0][0] + 1]
-    data_dict['IntTime'] = np.array([float(inter) for inter in int_time.split()])
+    data_dict['IntTime'] = np.array([float(inter) for inter in header['[IntTime]'].split()])
     data_dict['num_of_meas'] = len(data_dict['IntTime'])
 
     assert (data_dict['IntTime'][0] == data_dict['IntTime']).all(), 'Different Integrationtimes in file'
     data_dict['IntTime'] = data_dict['IntTime'][0]
-
-    try:
-        data_dict['start_data_index'] = np.where((header == '[DataRaw]') | (header == '[DataCalibrated]'))[0][0] + 1
-        data_dict['darkcurrent_corrected'] = flag_dict[header[data_dict['start_data_index'] - 1]]
-    except IndexError:
-        logging.error('No [DataRaw] inside the header (TODO)')
-    data = np.genfromtxt(filename, skip_header=data_dict['start_data_index'])
-    data_dict['wave'] = data[:, 0]
-    data_dict['data_mean'] = data[:, 1]
-    data_dict['data_std'] = data[:, 2]
-    data_dict['data_sample_std'] = np.std(data[:,3:], axis=1, ddof=1)
-    data_dict['data'] = data[:, 3:]
-    data_dict['tdata'] = np.transpose(data_dict['data'])
-    data_dict['mean'] = get_mean_column(data_dict)
     return data_dict
 
 
+def parse_data_block(lines):
+    rows = [line for line in lines if line.strip()]
+    columns = len(rows[0].split())
+    data = np.fromstring(' '.join(rows), sep=' ')
+    if data.size != len(rows) * columns:
+        # Ragged or non numeric rows, let genfromtxt fill the gaps
+        return np.genfromtxt(rows)
+    return data.reshape(len(rows), columns)
+
+
 def get_mean_column(ibsen_dict):
     # get mean columnwise tdata
-    mean = np.mean(ibsen_dict['tdata'], axis=0)
+    mean = np.mean(ibsen_dict['tdata'], axis=0, dtype=np.float64)
     return mean
 
+
+if os.environ.get('IBSEN_CACHE_DIR'):
+    enable_cache()
+
@@ -0,0 +1,139 @@
+import numpy as np
+"""
+Compact spectrum type behind the parser dict contract
+
+raw: array shape(channels, 3 + num_of_meas) as written in the .asc data block
+     [wave, data_mean, data_std, scan_1, .., scan_n]
+
+'wave', 'data_mean', 'data_std', 'data' and 'tdata' are views into raw,
+'mean' and 'data_sample_std' are computed (in float64) on first access and kept.
+Assigning a key replaces the value for this spectrum only, like a dict.
+copy() (and copy.deepcopy) share raw and the assigned arrays, the copy hands
+out read-only arrays so that only rebinding a key
+(spectra['tdata'] = spectra['tdata'] - dark) is possible: copy-on-write
+without ever duplicating the scan matrix. The original stays writeable,
+in place changes to it show through in its copies.
+
+Reduced precision storage (parse_ibsen_file(.., dtype=np.uint16 or np.float32)):
+raw then only holds [wave, data_mean, data_std] in float64 and the scans are
+kept in a separate array of the storage dtype. Raw DN are 16 bit integers,
+uint16 is lossless for [DataRaw] files. float32 is exact for DN and has a
+relative error below 6e-8 (2**-24) for calibrated values. 'mean' and
+'data_sample_std' are always accumulated in float64, the fit inputs are
+therefore identical for uint16 and within 1e-7 (relative) for float32
+(tests/test_ibsen_spectrum.py::test_reduced_precision_accuracy).
+"""
+VIEWS = {'wave': lambda raw, scans: raw[:, 0],
+         'data_mean': lambda raw, scans: raw[:, 1],
+         'data_std': lambda raw, scans: raw[:, 2],
+         'data': lambda raw, scans: scans,
+         'tdata': lambda raw, scans: np.transpose(scans)}
+STATISTICS = {'mean': lambda raw, scans: np.mean(scans, axis=1, dtype=np.float64),
+              'data_sample_std': lambda raw, scans: np.std(scans, axis=1, ddof=1, dtype=np.float64)}
+STORAGE_DTYPES = [np.float64, np.float32, np.uint16]
+
+
+def to_storage(scans, dtype):
+    """ Cast the scan matrix to the storage dtype, uint16 only for integer DN """
+    dtype = np.dtype(dtype)
+    if dtype == np.uint16:
+        if not (np.all(scans >= 0) and np.all(scans <= np.iinfo(np.uint16).max) and np.all(scans == np.round(scans))):
+            raise ValueError('uint16 storage needs raw integer DN, use float32')
+    elif dtype not in [np.dtype(storage) for storage in STORAGE_DTYPES]:
+        raise ValueError('Storage dtype %s not in %s' % (dtype, STORAGE_DTYPES))
+    return scans.astype(dtype)
+
+
+def working_dtype(array):
+    """ float type for corrected scans: float32 for reduced storage, float64 otherwise """
+    return np.float64 if array.dtype == np.float64 else np.float32
+
+
+def read_only(value):
+    if isinstance(value, np.ndarray) and value.flags.writeable:
+        value = value.view()
+        value.flags.writeable = False
+    return value
+
+
+class IbsenSpectrum(object):
+    __slots__ = ('_raw', '_scans', '_items', '_shared')
+
+    def __init__(self, raw, scans=None, **items):
+        self._raw = raw
+        self._scans = raw[:, 3:] if scans is None else scans
+        self._items = items
+        self._shared = False
+
+    @property
+    def raw(self):
+        return read_only(self._raw) if self._shared else self._raw
+
+    @property
+    def scans(self):
+        """ scan matrix shape(channels, scans) in storage dtype """
+        return read_only(self._scans) if self._shared else self._scans
+
+    def separate_scans(self):
+        """ True for reduced precision storage (scans not part of raw) """
+        return not np.may_share_memory(self._raw, self._scans)
+
+    def __getitem__(self, key):
+        try:
+            value = self._items[key]
+        except KeyError:
+            if key in VIEWS:
+                value = VIEWS[key](self._raw, self._scans)
+            elif key in STATISTICS:
+                value = self._items[key] = STATISTICS[key](self._raw, self._scans)
+            else:
+                raise
+        return read_only(value) if self._shared else value
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+
+    def __delitem__(self, key):
+        del self._items[key]
+
+    def __contains__(self, key):
+        return key in self._items or key in VIEWS or key in STATISTICS
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return list(set(self._items.keys()) | set(VIEWS.keys()) | set(STATISTICS.keys()))
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def copy(self):
+        spectrum = IbsenSpectrum(self._raw, self._scans, **self._items)
+        spectrum._shared = True
+        return spectrum
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def __getstate__(self):
+        return self._raw, self._scans, self._items, self._shared
+
+    def __setstate__(self, state):
+        self._raw, self._scans, self._items, self._shared = state
+
+    def __repr__(self):
+        return 'IbsenSpectrum(%s, IntTime=%s, UTCTime=%s, shape=%s)' % (self._items.get('Type'), self._items.get('IntTime'),
+                                                                       self._items.get('UTCTime'), self._scans.shape)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+import logging
+import pandas as pd
+from evaluation import parse_ini_config, create_logger, evaluate_parsed, result_row
+from parser.ibsen_parser import parse_ibsen_file, enable_cache
+from parser.ibsen_index import build_index, group_by_number
+from parser.ibsen_archive import append_spectra
+from calibration.level0to1 import load_kernel, write_to_file
+from calibration.instrument_registry import get_registry
+"""
+Level 0 to retrieval in one process
+
+Raw sets (target, reference, darkcurrent with the same file number) are
+calibrated in memory (CalibrationKernel) and handed to evaluate_parsed as
+arrays, without writing and re-parsing [DataCalibrated] text files. Sets
+already calibrated on disk are used as they are. Persisting the level 1
+spectra is optional: 'text' writes the level0to1 files under calibrated/,
+a file name appends them to an IbsenArchive (binary).
+
+Usage:
+    python pipeline.py -m /path/to/measurements/ -o results.csv [-n nonlinearity_correction.txt -r response.txt] [-l text]
+"""
+FILE_PREFIXES = ['target', 'reference', 'darkcurrent']
+
+
+def calibrate_set(files, kernel=None):
+    """
+    Args:
+        files: {'target': <file>, 'reference': <file>, 'darkcurrent': <file>}, darkcurrent only needed for raw files
+        kernel: CalibrationKernel, None: chosen by the instrument registry
+    Return:
+        {'target': ibsen_dict, 'reference': ibsen_dict} level 1 spectra
+    """
+    spectra = dict()
+    dark_dict = None
+    for key in FILE_PREFIXES[:2]:
+        spectrum = parse_ibsen_file(files[key])
+        if not spectrum['darkcurrent_corrected']:
+            if dark_dict is None:
+                dark_dict = parse_ibsen_file(files[FILE_PREFIXES[2]])
+            spectrum = (kernel or get_registry().kernel_for(files[key])).apply(spectrum, dark_dict)
+        spectra[key] = spectrum
+    return spectra
+
+
+def persist_level1(spectra, files, level1, max_scans=None):
+    for key, spectrum in sorted(spectra.items()):
+        if level1 == 'text':
+            write_to_file(spectrum, files[key])
+        else:
+            append_spectra(level1, [spectrum], [files[key]], max_scans)
+
+
+def run_pipeline(directory, config, logger=logging, output_file='pipeline_results.csv', kernel=None, level1=None):
+    """
+    Args:
+        kernel: CalibrationKernel for all sets, None: chosen per set by the instrument registry
+        level1: None, 'text' or archive file name for the calibrated spectra
+    """
+    index = build_index(directory)
+    max_scans = int(index['NumSamples'].max()) if len(index) else None
+    rows = []
+    for number, files in sorted(group_by_number(directory, index).items()):
+        missing = [key for key in FILE_PREFIXES[:2] if key not in files]
+        if missing:
+            logger.error("Set %s has no %s" % (number, ', '.join(missing)))
+            continue
+        try:
+            spectra = calibrate_set(files, kernel)
+            if level1:
+                persist_level1(spectra, files, level1, max_scans)
+        except Exception as e:
+            logger.error("Set %s not calibrated: %s" % (number, e))
+            continue
+        config['Data'] = {key: files[key] for key in FILE_PREFIXES[:2]}
+        logger.info("Evaluating file: %s \n" % files['target'])
+        try:
+            params, result = evaluate_parsed(spectra['reference'], spectra['target'], config, logger, plot=False)
+            rows.append(result_row(params, config, files['target']))
+        except Exception as e:
+            logger.error("Set %s not evaluated: %s" % (number, e))
+    frame = pd.DataFrame(rows)
+    frame.to_csv(output_file, index=False)
+    return frame
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-c', '--config', default='config.ini', help='Pass ini-file for processing configurations')
+    parser.add_argument('-m', '--measurement_directory', help='Define measurement directory to sweep through')
+    parser.add_argument('-o', '--output_file', default='pipeline_results.csv', help='Write timeline results into output file')
+    parser.add_argument('-n', '--nonlinear', default=None, help='Nonlinear correction file, default chosen per file header')
+    parser.add_argument('-r', '--response', default=None, help='Response file, default chosen per file header')
+    parser.add_argument('-k', '--kernel', default=None, help='Calibration kernel (.npz), created from -n and -r if missing')
+    parser.add_argument('-l', '--level1', default=None, help="Persist level 1 spectra: 'text' or an archive file name")
+    parser.add_argument('--cache', default=None, const='', nargs='?', help='Cache parsed spectra (optional cache directory)')
+    args = parser.parse_args()
+    if args.cache is not None:
+        enable_cache(args.cache or None)
+    config = parse_ini_config(args.config)
+    logger = create_logger(config['Processing'])
+    run_pipeline(args.measurement_directory, config, logger, args.output_file,
+                 load_kernel(args.nonlinear, args.response, args.kernel), args.level1)
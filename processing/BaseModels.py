@@ -1,13 +1,15 @@
 import theano
 import numpy as np
-from math import exp, log
+from math import log
 from theano import tensor as T
 from scipy.constants import atmosphere
 from wasi_reader import get_wasi_parameters, get_wasi
 from atmospheric_mass import get_ozone_path_length, get_atmospheric_path_length
+from collections import OrderedDict
+from utils.wavelength_grid import registry
 
 
-exp_v = np.vectorize(exp)
+GRID_CACHE_SIZE = 8
 
 
 class BaseModelPython:
@@ -18,11 +20,44 @@ class BaseModelPython:
         self.pressure = pressure
         self.p_0 = atmosphere / 100.0
         self.zenith_rad = np.radians(zenith)
+        self.cos_zenith = np.cos(self.zenith_rad)
         self.ray = 0.00877
         self.ray_expo = -4.05
         self.lambda_reference = 550  # [nm] Gege, 1000 nm Greg and Carder + Bringfried
         self.wasi = get_wasi_parameters()  # dict
         self.AM_ozone = get_ozone_path_length(zenith)  # zenith = degrees
+        self._plans = OrderedDict()
+
+    def plan(self, x):
+        """
+        Evaluation plan of the grid x: everything that depends on geometry, pressure and x only,
+        computed once per distinct grid (LRU of GRID_CACHE_SIZE grids). Keyed on the values of x
+        (registry.intern hashes them on every call), a grid changed in place gets a new plan
+            o2, o3, wv, e0: WASI tables on x
+            tau_r, rayleigh_diffuse: (1 - exp(0.95 tau_r)) * 0.5, exp_1_5_tau_r, exp_tau_r: Rayleigh terms
+            log_x_ref: log(x / lambda_reference), Angstroem law exp(-alpha * log_x_ref)
+            o2_transmittance: exp(tau_o2), e0_cos: E0 * cos(zenith)
+        """
+        key = registry.intern(x)
+        try:
+            plan = self._plans.pop(key)
+        except KeyError:
+            plan = dict((name, registry.resampler(x, table['wave'])(table['values'])) for name, table in self.wasi.items())
+            x = np.asarray(x, dtype=float)
+            tau_r = - ( self.AM * self.pressure/self.p_0) / (115.640 * (x/1000) ** 4 - 1.335 * (x/1000)**2)
+            o2_path = plan['o2'] * ( self.AM * self.pressure/self.p_0)
+            plan.update({'tau_r': tau_r,
+                         'rayleigh_diffuse': (1 - np.exp(0.95 * tau_r)) * 0.5,
+                         'exp_1_5_tau_r': np.exp(1.5 * tau_r),
+                         'exp_tau_r': np.exp(tau_r),
+                         'log_x_ref': np.log(x / self.lambda_reference),
+                         'tau_o2': -1.41 * o2_path / (1 + 118.3 * o2_path) ** 0.45,
+                         'e0_cos': plan['e0'] * self.cos_zenith})
+            plan['o2_transmittance'] = np.exp(plan['tau_o2'])
+            if len(self._plans) >= GRID_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        self._plans[key] = plan
+        return plan
 
     def forward_scat(self, alpha):
         """
@@ -36,40 +71,40 @@ class BaseModelPython:
         B_3 = log(1 - cos_theta)
         B_2 = B_3 * (0.0783 + B_3 * (-0.3824 - 0.5874 * B_3))
         B_1 = B_3 * (1.459 + B_3 * (0.1595 + 0.4129 * B_3))
-        F_a = 1 - 0.5 * exp_v((B_1 + B_2 * np.cos(self.zenith_rad)) * np.cos(self.zenith_rad))
+        F_a = 1 - 0.5 * np.exp((B_1 + B_2 * self.cos_zenith) * self.cos_zenith)
         return F_a
 
-    def tau_r(self, x):
-        y = - ( self.AM * self.pressure/self.p_0) / (115.640 * (x/1000) ** 4 - 1.335 * (x/1000)**2)
-        return y
+    # plan: self.plan(x) looked up once by the caller per model evaluation, None looks it up
 
-    def tau_as(self, x, alpha, beta):
-        return - self.ssa * self.AM * beta * (x / self.lambda_reference)  ** (-alpha)
+    def tau_r(self, x, plan=None):
+        return (plan or self.plan(x))['tau_r']
 
-    def tau_aa(self, x, alpha, beta):
-        return - (1 - self.ssa) * self.AM * beta * (x / self.lambda_reference)  ** (-alpha)
+    def tau_as(self, x, alpha, beta, plan=None):
+        return - self.ssa * self.AM * beta * np.exp(-alpha * (plan or self.plan(x))['log_x_ref'])
 
-    def tau_oz(self, x, H_oz):
+    def tau_aa(self, x, alpha, beta, plan=None):
+        return - (1 - self.ssa) * self.AM * beta * np.exp(-alpha * (plan or self.plan(x))['log_x_ref'])
+
+    def tau_oz(self, x, H_oz, plan=None):
         "Ozone Transmittance"
-        oz = np.interp(x, self.wasi['o3']['wave'], self.wasi['o3']['values'])
+        oz = (plan or self.plan(x))['o3']
         return - oz * H_oz * self.AM_ozone
 
-    def tau_o2(self, x):
-        o2 = np.interp(x, self.wasi['o2']['wave'], self.wasi['o2']['values'])
-        term = -1.41 * o2 * ( self.AM * self.pressure/self.p_0)
-        norm = (1 + 118.3 * o2 * ( self.AM * self.pressure/self.p_0)) ** 0.45
-        return term / norm
+    def tau_o2(self, x, plan=None):
+        return (plan or self.plan(x))['tau_o2']
 
-    def tau_wv(self, WV, x):
-        wv = np.interp(x, self.wasi['wv']['wave'], self.wasi['wv']['values'])
+    def tau_wv(self, WV, x, plan=None):
+        wv = (plan or self.plan(x))['wv']
         term = -0.2385 * wv * WV * self.AM
         norm = (1 + 20.07 * wv * WV * self.AM) ** 0.45
         return term / norm
 
     def ratio_sky_radiance(self, x, alpha, beta, g_dsr=1, g_dsa=1, g_dd=1):
-        term = g_dsr * (1 - exp_v(0.95 * self.tau_r(x))) * 0.5 + \
-               g_dsa * exp_v(1.5 * self.tau_r(x)) * (1 - exp_v(self.tau_as(x, alpha, beta))) * self.forward_scat(alpha) +  \
-               g_dd * exp_v(self.tau_as(x, alpha, beta) + self.tau_r(x))
+        plan = self.plan(x)
+        exp_tau_as = np.exp(self.tau_as(x, alpha, beta, plan))
+        term = g_dsr * plan['rayleigh_diffuse'] + \
+               g_dsa * plan['exp_1_5_tau_r'] * (1 - exp_tau_as) * self.forward_scat(alpha) +  \
+               g_dd * exp_tau_as * plan['exp_tau_r']
         return term
 
 
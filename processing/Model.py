@@ -1,12 +1,10 @@
 import theano
 import numpy as np
-from math import exp, log
 from theano import tensor as T
 from BaseModels import BaseModelSym
 
 
 # Python: Composition, Sym: Inheritance
-exp_v = np.vectorize(exp)
 
 
 class WaterVapourTransmittance:
@@ -14,7 +12,7 @@ class WaterVapourTransmittance:
         self.bm = base_model
 
     def func(self, WV, x):
-        return exp_v(self.bm.tau_wv(WV, x))
+        return np.exp(self.bm.tau_wv(WV, x))
 
 
 class OzoneTransmittance:
@@ -22,7 +20,7 @@ class OzoneTransmittance:
         self.bm = base_model
 
     def func(self, x, H_oz):
-        return exp_v(self.bm.tau_oz(x, H_oz))
+        return np.exp(self.bm.tau_oz(x, H_oz))
 
 
 class IrradianceRatio:
@@ -56,10 +54,10 @@ class SkyRadiance:
 
 
     def func(self, x, alpha, beta, l_dsr, l_dsa, H_oz, wv):
-        E0 = np.interp(x, self.bm.wasi['e0']['wave'], self.bm.wasi['e0']['values'])
-        non_aerosol_term = E0 * np.cos(self.bm.zenith_rad) * exp_v(self.bm.tau_oz(x, H_oz)) * exp_v(self.bm.tau_o2(x)) * exp_v(self.bm.tau_wv(wv, x))
-        aerosol_term  = l_dsr * (1 - exp_v(0.95 * self.bm.tau_r(x))) * 0.5 + \
-                        l_dsa * exp_v(1.5 * self.bm.tau_r(x)) * (1 - exp_v(self.bm.tau_as(x, alpha, beta))) * self.bm.forward_scat(alpha)
+        plan = self.bm.plan(x)
+        non_aerosol_term = plan['e0_cos'] * plan['o2_transmittance'] * np.exp(self.bm.tau_oz(x, H_oz, plan) + self.bm.tau_wv(wv, x, plan))
+        aerosol_term  = l_dsr * plan['rayleigh_diffuse'] + \
+                        l_dsa * plan['exp_1_5_tau_r'] * (1 - np.exp(self.bm.tau_as(x, alpha, beta, plan))) * self.bm.forward_scat(alpha)
         return non_aerosol_term * aerosol_term
 
 
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 import numpy as np
-from math import cos, radians
 from numpy.testing import assert_approx_equal
 '''
 This module determines the atmospheric path length or Air mass
 due to Young (1994)
+Scalars and arrays of zenith angles [degrees] are accepted
 '''
 
 
@@ -16,14 +16,14 @@ def get_atmospheric_path_length(zenith):
     aa = 0.149864
     bb = 0.0102963
     cc = 0.000303978
-    theta_rad = np.radians(zenith)
-    AM = (a * cos(theta_rad)**2 + b * cos(theta_rad) + c) / \
-         (cos(theta_rad) ** 3 + aa * cos(theta_rad)**2 + bb * cos(theta_rad) + cc)
+    cos_theta = np.cos(np.radians(zenith))
+    AM = (a * cos_theta**2 + b * cos_theta + c) / \
+         (cos_theta ** 3 + aa * cos_theta**2 + bb * cos_theta + cc)
     return AM
 
 def get_ozone_path_length(zenith):
-    theta_rad = np.radians(zenith)
-    return 1.0035 / np.sqrt(cos(theta_rad) ** 2 + 0.007)
+    cos_theta = np.cos(np.radians(zenith))
+    return 1.0035 / np.sqrt(cos_theta ** 2 + 0.007)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+import os
+import logging
+import zipfile
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from solar_zenith import sun_geometry
+from utils.util import get_cache_directory
+"""
+Per-site daily geometry lookup tables
+
+Solar zenith, air mass and ozone path length (see solar_zenith.sun_geometry) are tabulated once
+per (site, UTC day) on a STEP_SECONDS grid and stored as .npz in the shared cache directory
+(get_cache_directory('geometry')), so evaluation, retrieval and the watch-folder service reuse
+the same tables. Queries interpolate linearly, the zenith error at 60 s steps is below 1e-3 degree.
+The TABLE_CACHE_SIZE most recently used tables stay in memory.
+"""
+SITES = {'LMU': (48.14800, 11.57300, 533.0), 'DLR': (48.08617, 11.27970, 590.0)}
+STEP_SECONDS = 60
+TABLE_KEYS = ['zenith', 'airmass', 'ozone_path']
+TABLE_CACHE_SIZE = 64
+_tables = OrderedDict()
+
+
+def table_file(lat, lon, day, directory=None):
+    name = 'geometry_%.5f_%.5f_%s_%ss.npz' % (lat, lon, day, STEP_SECONDS)
+    return os.path.join(directory or get_cache_directory('geometry'), name)
+
+
+def build_day_table(lat, lon, day):
+    """ day: datetime64[D]. Return: {'seconds', 'zenith', 'airmass', 'ozone_path'} over the whole day """
+    seconds = np.arange(0, 86400 + STEP_SECONDS, STEP_SECONDS)
+    times = np.datetime64(day, 's') + seconds.astype('timedelta64[s]')
+    table = dict((key, np.asarray(value)) for key, value in sun_geometry(times, lat, lon).items() if key in TABLE_KEYS)
+    table['seconds'] = seconds.astype(float)
+    return table
+
+
+def save_day_table(table, filename):
+    directory = os.path.dirname(filename)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_file = '%s.%s.tmp' % (filename, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as fp:
+            np.savez(fp, **table)
+        os.rename(tmp_file, filename)
+    except (IOError, OSError) as e:
+        logging.warning('Could not write geometry table %s: %s' % (filename, e))
+
+
+def get_day_table(lat, lon, day, directory=None):
+    """ Table of (site, day) from memory, the cache directory, or computed and persisted """
+    day = np.datetime64(day, 'D')
+    key = (round(lat, 5), round(lon, 5), str(day), directory)
+    if key in _tables:
+        _tables[key] = _tables.pop(key)
+        return _tables[key]
+    filename = table_file(lat, lon, day, directory)
+    try:
+        with np.load(filename) as npz:
+            table = dict((name, npz[name]) for name in TABLE_KEYS + ['seconds'])
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+        table = build_day_table(lat, lon, day)
+        save_day_table(table, filename)
+    for value in table.values():
+        value.flags.writeable = False
+    if len(_tables) >= TABLE_CACHE_SIZE:
+        _tables.popitem(last=False)
+    _tables[key] = table
+    return table
+
+
+def get_geometry(utc_times, lat, lon, el=0.0, directory=None):
+    """
+    Zenith [degrees], air mass and ozone path length interpolated from the daily tables of the site
+    utc_times: datetime, datetime64 or arrays of them, el is accepted for parity with sun_geometry
+    """
+    times = np.asarray(utc_times, dtype='datetime64[us]')
+    flat = times.ravel()
+    days = flat.astype('datetime64[D]')
+    geometry = dict((key, np.empty(flat.shape)) for key in TABLE_KEYS)
+    for day in np.unique(days):
+        mask = days == day
+        seconds = (flat[mask] - day).astype('int64') * 1e-6
+        table = get_day_table(lat, lon, day, directory)
+        for key in TABLE_KEYS:
+            geometry[key][mask] = np.interp(seconds, table['seconds'], table[key])
+    return dict((key, value.reshape(times.shape)[()]) for key, value in geometry.items())
+
+
+def clear_tables():
+    _tables.clear()
+
+
+def precompute(site, start, days, directory=None):
+    """ Persist the tables of site (name in SITES or (lat, lon, el)) for days starting at start """
+    lat, lon, _ = SITES[site] if site in SITES else site
+    for i in range(days):
+        get_day_table(lat, lon, start + timedelta(days=i), directory)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Precompute daily geometry tables of a site')
+    parser.add_argument('-s', '--site', default='LMU', choices=sorted(SITES.keys()), help='Station')
+    parser.add_argument('-d', '--date', help='First UTC day (YYYY-MM-DD)')
+    parser.add_argument('-n', '--days', type=int, default=1, help='Number of days')
+    parser.add_argument('--cache', default=None, help='Cache directory (default: shared cache)')
+    args = parser.parse_args()
+    precompute(args.site, datetime.strptime(args.date, '%Y-%m-%d'), args.days, args.cache)
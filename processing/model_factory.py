@@ -4,9 +4,8 @@ from scipy.constants import atmosphere
 from math import exp, log
 from lmfit import Model
 import matplotlib.pyplot as plt
-from solar_zenith import get_sun_zenith
+from geometry_lut import get_geometry
 from get_weather_conditions import retrieve_weather_parameters
-from atmospheric_mass import get_atmospheric_path_length
 from get_ssa import get_ssa
 from utils.util import international_barometric_formula
 from Model import IrradianceRatio
@@ -19,9 +18,10 @@ Irradiance model due to Greg and Carder
 class WeatherAtmosphereParameter:
 
     def __init__(self, logger, config, wavelength):
-        self.sun_zenith_tar = get_sun_zenith(config['Processing']['utc_time']['tar'], *config['Processing']['gps_coords'])
-        self.sun_zenith_ref = get_sun_zenith(config['Processing']['utc_time']['ref'], *config['Processing']['gps_coords'])
-        self.atmos_path = get_atmospheric_path_length(self.sun_zenith_tar)
+        utc_time = config['Processing']['utc_time']
+        geometry = get_geometry([utc_time['tar'], utc_time['ref']], *config['Processing']['gps_coords'])
+        self.sun_zenith_tar, self.sun_zenith_ref = geometry['zenith']
+        self.atmos_path, atmos_path_ref = geometry['airmass']
         weather_dict = retrieve_weather_parameters(config['Processing']['params'], config['Processing']['gps_coords'], config['Processing']['utc_time']['tar'])
         humidity = weather_dict['hum']
         self.pressure = international_barometric_formula(config['Processing']['gps_coords'][-1])  # height (magic number)
@@ -29,7 +29,7 @@ class WeatherAtmosphereParameter:
         logger.info(" \n \t Zenith angle tar %s" %  self.sun_zenith_tar)
         logger.info(" \n \t Zenith angle ref %s" %  self.sun_zenith_ref)
         logger.info(" \n \t  Atmospheric path length tar %s" % self.atmos_path)
-        logger.info(" \n \t  Atmospheric path length ref %s" % get_atmospheric_path_length(self.sun_zenith_ref))
+        logger.info(" \n \t  Atmospheric path length ref %s" % atmos_path_ref)
         logger.info(" \n \t  Relative humidity %s" % humidity)
         logger.info(" \n \t  Pressure %s" % self.pressure)
         logger.info(" \n \t  Single scattering albedo %s" % self.ssa)
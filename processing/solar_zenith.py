@@ -1,5 +1,14 @@
 import ephem
 import numpy as np
+from atmospheric_mass import get_atmospheric_path_length, get_ozone_path_length
+"""
+Solar position. get_sun_zenith evaluates a single timestamp with ephem, sun_geometry evaluates
+arrays of UTC times and sites at once with the NOAA solar calculator equations (Meeus),
+accurate to about 0.01 degree for sun elevations above a few degrees.
+"""
+
+UNIX_EPOCH_JD = 2440587.5
+J2000_JD = 2451545.0
 
 
 def get_sun_zenith(utc_time, lat, lon, el=0.0):
@@ -11,3 +20,80 @@ def get_sun_zenith(utc_time, lat, lon, el=0.0):
     sun = ephem.Sun(detect)
     sun.compute(detect)
     return 90 - np.degrees(float(sun.alt ))
+
+
+def julian_day(utc_times):
+    """ Julian day of datetimes or datetime64 values """
+    seconds = np.asarray(utc_times, dtype='datetime64[us]').astype('int64') * 1e-6
+    return UNIX_EPOCH_JD + seconds / 86400.0
+
+
+def refraction_correction(elevation):
+    """ Atmospheric refraction [degrees] of the true elevation [degrees], NOAA approximation """
+    elevation = np.asarray(elevation, dtype=float)
+    tan_e = np.tan(np.radians(np.clip(elevation, -89., 89.)))
+    high = 58.1 / tan_e - 0.07 / tan_e ** 3 + 0.000086 / tan_e ** 5
+    low = 1735 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))
+    below = -20.772 / tan_e
+    arcsec = np.where(elevation > 85, 0.0,
+                      np.where(elevation > 5, high,
+                               np.where(elevation > -0.575, low, below)))
+    return arcsec / 3600.0
+
+
+def sun_position(utc_times, lat, lon, refraction=True):
+    """
+    Solar zenith and azimuth [degrees] for arrays of UTC times and sites, broadcast against each other
+    Azimuth is counted clockwise from north
+    """
+    jd = julian_day(utc_times)
+    jc = (jd - J2000_JD) / 36525.0
+    lat_rad = np.radians(lat)
+
+    mean_long = np.radians((280.46646 + jc * (36000.76983 + jc * 0.0003032)) % 360)
+    mean_anom = np.radians(357.52911 + jc * (35999.05029 - 0.0001537 * jc))
+    ecc = 0.016708634 - jc * (0.000042037 + 0.0000001267 * jc)
+    center = np.sin(mean_anom) * (1.914602 - jc * (0.004817 + 0.000014 * jc)) + \
+             np.sin(2 * mean_anom) * (0.019993 - 0.000101 * jc) + \
+             np.sin(3 * mean_anom) * 0.000289
+    omega = np.radians(125.04 - 1934.136 * jc)
+    apparent_long = np.radians(np.degrees(mean_long) + center - 0.00569 - 0.00478 * np.sin(omega))
+    mean_obliquity = 23 + (26 + (21.448 - jc * (46.815 + jc * (0.00059 - jc * 0.001813))) / 60) / 60
+    obliquity = np.radians(mean_obliquity + 0.00256 * np.cos(omega))
+    declination = np.arcsin(np.sin(obliquity) * np.sin(apparent_long))
+
+    var_y = np.tan(obliquity / 2) ** 2
+    eq_of_time = 4 * np.degrees(var_y * np.sin(2 * mean_long) - 2 * ecc * np.sin(mean_anom) +
+                                4 * ecc * var_y * np.sin(mean_anom) * np.cos(2 * mean_long) -
+                                0.5 * var_y ** 2 * np.sin(4 * mean_long) - 1.25 * ecc ** 2 * np.sin(2 * mean_anom))
+
+    minutes = (jd - 0.5) % 1 * 1440
+    true_solar_time = (minutes + eq_of_time + 4 * np.asarray(lon, dtype=float)) % 1440
+    hour_angle = np.radians(true_solar_time / 4 - 180)
+
+    cos_zenith = np.sin(lat_rad) * np.sin(declination) + \
+                 np.cos(lat_rad) * np.cos(declination) * np.cos(hour_angle)
+    zenith_rad = np.arccos(np.clip(cos_zenith, -1, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_azimuth = (np.sin(lat_rad) * np.cos(zenith_rad) - np.sin(declination)) / \
+                      (np.cos(lat_rad) * np.sin(zenith_rad))
+    azimuth = np.degrees(np.arccos(np.clip(cos_azimuth, -1, 1)))
+    azimuth = np.where(hour_angle > 0, (azimuth + 180) % 360, (540 - azimuth) % 360)
+
+    zenith = np.degrees(zenith_rad)
+    if refraction:
+        zenith = zenith - refraction_correction(90 - zenith)
+    return zenith, azimuth
+
+
+def sun_geometry(utc_times, lat, lon, el=0.0, refraction=True):
+    """
+    Zenith [degrees], azimuth [degrees], air mass (Young 1994) and ozone path length for arrays of
+    UTC times and sites. el is accepted for parity with get_sun_zenith, the parallax at ground level
+    is far below the accuracy of the solution.
+    """
+    zenith, azimuth = sun_position(utc_times, lat, lon, refraction)
+    return {'zenith': zenith,
+            'azimuth': azimuth,
+            'airmass': get_atmospheric_path_length(zenith),
+            'ozone_path': get_ozone_path_length(zenith)}
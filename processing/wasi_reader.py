@@ -1,5 +1,8 @@
 import numpy as np
 import os
+import hashlib
+import logging
+import zipfile
 from matplotlib.font_manager import FontProperties
 from scipy.ndimage.filters import gaussian_filter
 
@@ -10,6 +13,9 @@ hfont = {'family':FONTSTYLE, 'fontsize': FONTSIZE}
 fontP = FontProperties()
 fontP.set_family(FONTSTYLE)
 fontP.set_size('small')
+WASI_DIR = os.path.dirname(os.path.realpath(__file__)) + '/WASI_database/'
+WASI_PACK = WASI_DIR + 'wasi_pack.npz'
+_store = None
 
 
 def wasi_oxygen(filename=os.path.dirname(os.path.realpath(__file__)) + '/WASI_database/O2.A'):
@@ -41,7 +47,7 @@ def wasi_ozone(filename=os.path.dirname(os.path.realpath(__file__)) + '/WASI_dat
     return wave_nm, O3
 
 
-def get_wasi_parameters():
+def read_wasi_text():
     params = {'o2': wasi_oxygen, 'o3': wasi_ozone, 'e0': wasi_e0, 'wv': wasi_wv}
     wasi_dict = dict()
     for key, value in params.items():
@@ -50,15 +56,66 @@ def get_wasi_parameters():
     return wasi_dict
 
 
+def source_digest():
+    """ sha1 over the WASI text files, a pack is only used if it was built from the same files """
+    digest = hashlib.sha1()
+    for name in ['E0_sun.txt', 'O2.A', 'O3.A', 'WV.A']:
+        with open(WASI_DIR + name, 'rb') as fp:
+            digest.update(fp.read())
+    return digest.hexdigest()
+
+
+def build_wasi_pack(pack_file=WASI_PACK):
+    """ Binary pack of the parsed (and for E0 filtered) tables next to the text files """
+    wasi_dict = read_wasi_text()
+    arrays = dict(('%s_%s' % (key, item), values) for key, table in wasi_dict.items() for item, values in table.items())
+    tmp_file = '%s.%s.tmp' % (pack_file, os.getpid())
+    with open(tmp_file, 'wb') as fp:
+        np.savez(fp, digest=np.array(source_digest()), **arrays)
+    os.rename(tmp_file, pack_file)
+    return wasi_dict
+
+
+def load_wasi_pack(pack_file=WASI_PACK):
+    """ Return: wasi_dict or None if the pack is missing, stale or corrupt """
+    try:
+        with np.load(pack_file) as npz:
+            if str(npz['digest']) != source_digest():
+                return None
+            return dict((key, {'wave': npz['%s_wave' % key], 'values': npz['%s_values' % key]}) for key in ['o2', 'o3', 'e0', 'wv'])
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+        return None
+
+
+def get_wasi_store():
+    """ Process wide read-only WASI tables, from the binary pack if it is up to date """
+    global _store
+    if _store is None:
+        wasi_dict = load_wasi_pack()
+        if wasi_dict is None:
+            logging.info('WASI pack missing or stale, reading text tables')
+            try:
+                wasi_dict = build_wasi_pack()
+            except (IOError, OSError):
+                wasi_dict = read_wasi_text()
+        for table in wasi_dict.values():
+            for values in table.values():
+                values.flags.writeable = False
+        _store = wasi_dict
+    return _store
+
+
+def get_wasi_parameters():
+    """ Return: {'o2', 'o3', 'e0', 'wv': {'wave', 'values'}}, arrays shared read-only (get_wasi_store) """
+    return dict((key, dict(table)) for key, table in get_wasi_store().items())
+
+
 def get_wasi(wave):
-    w_oz, oz = wasi_ozone()
-    ozone = np.interp(wave, w_oz, oz)
-    w_o2, o2 = wasi_oxygen()
-    oxygen = np.interp(wave, w_o2, o2)
-    w_wv, wv = wasi_wv()
-    water = np.interp(wave, w_wv, wv)
-    w_eo, eo = wasi_e0()
-    solar = np.interp(wave, w_eo, eo)
+    store = get_wasi_store()
+    ozone = np.interp(wave, store['o3']['wave'], store['o3']['values'])
+    oxygen = np.interp(wave, store['o2']['wave'], store['o2']['values'])
+    water = np.interp(wave, store['wv']['wave'], store['wv']['values'])
+    solar = np.interp(wave, store['e0']['wave'], store['e0']['values'])
     return ozone, oxygen, water, solar
 
 
@@ -94,5 +151,12 @@ def plot():
 
 
 if __name__ == "__main__":
-    plot()
-    get_wasi_parameters()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pack', default=False, action='store_true', help='Rebuild %s from the text tables' % WASI_PACK)
+    args = parser.parse_args()
+    if args.pack:
+        build_wasi_pack()
+    else:
+        plot()
+        get_wasi_parameters()
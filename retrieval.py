@@ -1,7 +1,8 @@
-import glob
 import numpy as np
 import pandas as pd
 from evaluation import parse_ini_config, create_logger, evaluate_spectra
+from parser.ibsen_parser import enable_cache
+from parser.ibsen_index import build_index, pair_files
 
 
 def retrieve(config, directory, output_file, logger):
@@ -10,7 +11,7 @@ def retrieve(config, directory, output_file, logger):
         aided_params[key] = pd.read_csv(aided_file)
 
     file_prefixes = ['target', 'reference']
-    files = [file_ for file_ in glob.iglob(directory + '%s*' % file_prefixes[0])]
+    pairs = pair_files(directory, build_index(directory), file_prefixes[0], file_prefixes[1:])
 
     result_timeline = dict()
     for param in config['Fitting']['params']:
@@ -19,10 +20,13 @@ def retrieve(config, directory, output_file, logger):
     result_timeline['sun_zenith'] = np.array([])
     result_timeline['utc_times'] = np.array([])
 
-    for idx, file_ in enumerate(sorted(files)):
-        for key in file_prefixes:
-            config['Data'][key] = file_.replace(file_prefixes[0], key)
+    for idx, pair in enumerate(pairs):
+        file_ = pair[file_prefixes[0]]
         try:
+            for key in file_prefixes:
+                if pair[key] is None:
+                    raise IOError('No %s for %s' % (key, file_))
+                config['Data'][key] = pair[key]
             logger.info("Evaluating file: %s \n" % file_)
 
             for key, frame in aided_params.items():
@@ -59,7 +63,10 @@ if __name__ == "__main__":
     parser.add_argument('-c', '--config', default='config.ini', help='Pass ini-file for processing configurations')
     parser.add_argument('-m', '--measurement_directory', help='Define measurement directory to sweep through')
     parser.add_argument('-o', '--output_file', help='Write timeline results into output file')
+    parser.add_argument('--cache', default=None, const='', nargs='?', help='Cache parsed spectra (optional cache directory)')
     args = parser.parse_args()
+    if args.cache is not None:
+        enable_cache(args.cache or None)
     config = parse_ini_config(args.config)
     logger = create_logger(config['Processing'])
     retrieve(config, args.measurement_directory, args.output_file, logger)
@@ -0,0 +1,25 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from evaluation.processing.BaseModels import BaseModelPython
+from evaluation.processing.Model import SkyRadiance
+
+
+def test_plan_follows_in_place_grid_change():
+    model = BaseModelPython(45., 1013.25, 0.9)
+    x = np.linspace(400., 800., 50)
+    first = model.ratio_sky_radiance(x, 1.2, 0.1)
+    x += 100
+    second = model.ratio_sky_radiance(x, 1.2, 0.1)
+    assert not np.allclose(first, second)
+    assert_allclose(second, BaseModelPython(45., 1013.25, 0.9).ratio_sky_radiance(x.copy(), 1.2, 0.1))
+    assert_allclose(model.plan(x)['log_x_ref'], np.log(x / 550.))
+
+
+def test_sky_radiance_looks_up_plan_once(monkeypatch):
+    model = BaseModelPython(45., 1013.25, 0.9)
+    x = np.linspace(400., 800., 50)
+    expected = SkyRadiance(model, None).func(x, 1.2, 0.1, 0.5, 0.5, 0.3, 1.5)
+    plan, calls = model.plan, []
+    monkeypatch.setattr(model, 'plan', lambda grid: calls.append(grid) or plan(grid))
+    assert_allclose(SkyRadiance(model, None).func(x, 1.2, 0.1, 0.5, 0.5, 0.3, 1.5), expected)
+    assert len(calls) == 1
@@ -0,0 +1,50 @@
+import os
+import pytest
+import numpy as np
+from tempfile import mkdtemp
+from numpy.testing import assert_allclose, assert_array_equal
+from evaluation.parser.ibsen_parser import parse_ibsen_file
+from evaluation.calibration.calibration_kernel import CalibrationKernel
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+DN = np.arange(1000., 40000., 4.)
+CORRECTION = 1 - 0.05 * np.sin(DN / 9000.)
+
+
+def test_nonlinearity_lookup_matches_interp():
+    kernel = CalibrationKernel(DN, CORRECTION, [300., 900.], [1., 2.])
+    dn = np.random.RandomState(0).uniform(0, 45000, (30, 100))
+    assert_allclose(kernel.nonlinearity(dn), np.interp(dn, DN, CORRECTION), rtol=1e-12)
+
+
+def test_apply_matches_stepwise_calibration():
+    meas = parse_ibsen_file(create_meas_file(DEFAULT_MEAS))
+    dark = parse_ibsen_file(create_meas_file(DEFAULT_MEAS.replace('reference', 'darkcurrent')))
+    dark['tdata'] = dark['tdata'] * 0.1
+    wave, response = np.array([300., 600., 900.]), np.array([2., 3., 5.])
+    kernel = CalibrationKernel(DN, CORRECTION, wave, response)
+    dark_mean = np.mean(dark['tdata'], axis=0)
+    tdata = meas['tdata'] - dark_mean
+    tdata = tdata / np.interp(tdata, DN, CORRECTION) / meas['IntTime'] / np.interp(meas['wave'], wave, response)
+    calibrated = kernel.apply(meas, dark)
+    assert calibrated['darkcurrent_corrected']
+    assert_allclose(calibrated['tdata'], tdata, rtol=1e-12)
+    assert_allclose(calibrated['mean'], np.mean(tdata, axis=0), rtol=1e-12)
+    assert_allclose(calibrated['data_sample_std'], np.std(tdata, axis=0, ddof=1), rtol=1e-10)
+
+
+def test_kernel_save_load():
+    kernel_file = os.path.join(mkdtemp(), 'kernel.npz')
+    kernel = CalibrationKernel(DN, CORRECTION, [300., 900.], [1., 2.], instrument_wave=[400., 500.])
+    kernel.save(kernel_file)
+    loaded = CalibrationKernel.load(kernel_file)
+    assert_array_equal(loaded.lut, kernel.lut)
+    assert_array_equal(loaded.response_on([400., 500.]), kernel.instrument_response)
+    assert (loaded.dn_start, loaded.dn_step) == (kernel.dn_start, kernel.dn_step)
+
+
+def test_rejects_non_increasing_dn():
+    for DN_bad in [[0., 4., 4., 8.], [8., 4., 0.], [1.]]:
+        with pytest.raises(ValueError):
+            CalibrationKernel(DN_bad, np.ones(len(DN_bad)), [300., 900.], [1., 1.])
@@ -0,0 +1,83 @@
+import os
+import logging
+import pytest
+import numpy as np
+from tempfile import mkdtemp
+from numpy.testing import assert_allclose
+from evaluation.calibration.dark_current import fit_dark_current, DarkModel
+
+INT_TIMES = np.array([5., 10., 20., 40., 80., 160.])
+
+
+def synthetic_dark(channels=16, seed=0):
+    random = np.random.RandomState(seed)
+    offset = random.uniform(1900, 2100, channels)
+    rate = random.uniform(0.01, 0.5, channels)
+    return offset + rate * INT_TIMES[:, np.newaxis] + random.normal(0, 2, (len(INT_TIMES), channels))
+
+
+def test_fit_matches_polyfit():
+    dark = synthetic_dark()
+    fit = fit_dark_current(INT_TIMES, dark)
+    for channel in range(dark.shape[1]):
+        coeffs, cov = np.polyfit(INT_TIMES, dark[:, channel], deg=1, cov=True)
+        assert_allclose([fit['rate'][channel], fit['offset'][channel]], coeffs)
+        assert_allclose([fit['rate_std'][channel], fit['offset_std'][channel]], np.sqrt(np.diag(cov)))
+
+
+def test_weighted_and_batched_fit():
+    dark = np.array([synthetic_dark(seed=seed) for seed in range(3)])
+    weights = np.random.RandomState(1).uniform(0.5, 2, (3, len(INT_TIMES)))
+    fit = fit_dark_current(np.tile(INT_TIMES, (3, 1)), dark, weights)
+    assert fit['offset'].shape == (3, 16)
+    for series in range(3):
+        coeffs = np.polyfit(INT_TIMES, dark[series], deg=1, w=np.sqrt(weights[series]))
+        assert_allclose(fit['rate'][series], coeffs[0])
+        assert_allclose(fit['offset'][series], coeffs[1])
+
+
+def test_dark_model_synthesizes_dark():
+    offset, rate = np.linspace(1900, 2100, 16), np.linspace(0.01, 0.5, 16)
+    spectra = [{'IntTime': int_time, 'mean': offset + rate * int_time, 'wave': np.arange(16.)} for int_time in INT_TIMES]
+    model = DarkModel.from_spectra(spectra)
+    assert_allclose(model.dark(33.), offset + rate * 33.)
+    dark_dict = model.dark_dict(33.)
+    assert dark_dict['Type'] == 'darkcurrent'
+    assert_allclose(np.mean(dark_dict['tdata'], axis=0), model.dark(33.))
+
+
+def test_dark_model_temperature_terms_and_save():
+    offset, rate = np.linspace(1900, 2100, 16), np.linspace(0.01, 0.5, 16)
+    spectra, temperatures = [], []
+    for temperature in [-3., 10., 30.]:
+        for int_time in INT_TIMES:
+            mean = offset + 2. * temperature + (rate + 0.01 * temperature) * int_time
+            spectra.append({'IntTime': int_time, 'mean': mean, 'wave': np.arange(16.)})
+            temperatures.append(temperature)
+    model = DarkModel.from_spectra(spectra, temperatures)
+    expected = offset + 2. * 20. + (rate + 0.01 * 20.) * 50.
+    assert_allclose(model.dark(50., temperature=20.), expected)
+    model_file = os.path.join(mkdtemp(), 'dark_model.npz')
+    model.save(model_file)
+    assert_allclose(DarkModel.load(model_file).dark(50., temperature=20.), expected)
+
+
+def test_temperature_model_without_temperature_warns(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(logging, 'warning', warnings.append)
+    offset = np.linspace(1900, 2100, 16)
+    model = DarkModel(offset, np.zeros(16), temperature_offset=np.ones(16), temperature_rate=np.zeros(16),
+                      reference_temperature=10.)
+    assert_allclose(model.dark(50., temperature=20.), offset + 10.)
+    assert not warnings
+    assert_allclose(model.dark(50.), offset)
+    assert len(warnings) == 1
+
+
+def test_dark_model_checks_channels():
+    model = DarkModel(np.zeros(16), np.zeros(16), wave=np.arange(16.))
+    assert model.dark_dict(33., wave=np.arange(16.))['mean'].shape == (16,)
+    with pytest.raises(ValueError):
+        model.dark_dict(33., wave=np.arange(10.))
+    with pytest.raises(ValueError):
+        model.dark_dict(33., wave=np.arange(16.) + 1)
@@ -0,0 +1,36 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from evaluation.calibration.extract_nonlinearity import kernel_smooth, interp_rows
+
+
+def direct_kernel_smooth(x, y, grid, sigma):
+    weights = np.exp(-(x - grid[:, np.newaxis]) ** 2 / (2 * sigma ** 2))
+    return np.sum(weights * y, axis=1) / np.sum(weights, axis=1)
+
+
+def test_kernel_smooth_tolerance():
+    random = np.random.RandomState(0)
+    x = np.sort(random.uniform(0, 20000, 5000))
+    y = 1 + 0.03 * np.sin(x / 3000) + random.normal(0, 0.01, x.size)
+    for sigma in [100, 10, 3]:
+        grid = np.arange(x.min(), x.max(), 4)
+        assert_allclose(kernel_smooth(x, y, grid, sigma)[::25], direct_kernel_smooth(x, y, grid[::25], sigma), rtol=1e-5)
+
+
+def test_kernel_smooth_dn_gap():
+    random = np.random.RandomState(2)
+    x = np.sort(np.concatenate([random.uniform(0, 5000, 2000), random.uniform(8000, 12000, 2000)]))
+    y = 1 + 0.03 * np.sin(x / 3000)
+    grid = np.arange(x.min(), x.max(), 4)
+    result = kernel_smooth(x, y, grid, 100)
+    assert np.all(np.isfinite(result))
+    assert_allclose(result[::25], direct_kernel_smooth(x, y, grid[::25], 100), rtol=1e-5)
+    gap = kernel_smooth(np.array([0., 1., 1000., 1001.]), np.array([1., 1., 2., 2.]), np.array([0., 400., 600., 1000.]), 3)
+    assert_allclose(gap, [1., 1., 2., 2.])
+
+
+def test_interp_rows():
+    xp = np.sort(np.random.RandomState(1).uniform(0, 5000, (20, 7)), axis=1)
+    fp = np.arange(7.) * 10
+    for x in [-1., 2323., 6000.]:
+        assert_allclose(interp_rows(x, xp, fp), [np.interp(x, row, fp) for row in xp])
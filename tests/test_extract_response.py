@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+from tempfile import mkdtemp
+from numpy.testing import assert_allclose
+from evaluation.calibration.extract_response import build_response, stack_sessions, get_halogen_spectra, compile_kernel
+from evaluation.calibration.calibration_kernel import CalibrationKernel
+
+WAVE = np.linspace(340., 860., 200)
+
+
+def create_lamp_file(scale=1., relative_error=0.02):
+    lamp_file = os.path.join(mkdtemp(), 'lamp.txt')
+    wave = np.arange(350., 851., 10.)
+    np.savetxt(lamp_file, np.transpose([wave, scale * (wave - 300.) * 1e6, np.full(wave.shape, relative_error)]), delimiter=',')
+    return lamp_file
+
+
+def synthetic_cal_dict(gain, int_times=(10., 20., 40.)):
+    signal = gain * (WAVE - 300.)
+    return dict((int_time, {'reference': {'wave': WAVE, 'mean': signal * (1 + 0.001 * idx), 'darkcurrent_corrected': True}})
+                for idx, int_time in enumerate(int_times))
+
+
+def test_build_response_single_session_matches_ratio():
+    lamp_file = create_lamp_file()
+    wave, int_times, cube = stack_sessions([synthetic_cal_dict(3.)])
+    response = build_response(wave, cube, lamp_file)
+    assert response['wave'][0] > 350. and response['wave'][-1] < 850.
+    assert_allclose(response['scale_factors'], np.mean(cube[0], axis=0)[(WAVE > 350.) & (WAVE < 850.)][:len(response['wave'])] / (response['wave'] - 300.))
+    assert np.all(response['uncertainty'] >= 0.02 * response['scale_factors'])
+
+
+def test_build_response_multiple_sessions_and_lamps():
+    lamp_files = [create_lamp_file(), create_lamp_file(scale=2.)]
+    wave, int_times, cube = stack_sessions([synthetic_cal_dict(3.), synthetic_cal_dict(6., (10., 80.))])
+    assert cube.shape == (2, 4, len(WAVE))
+    response = build_response(wave, cube, lamp_files)
+    assert_allclose(response['scale_factors'], 3., rtol=2e-3)
+    assert_allclose(response['uncertainty'] / response['scale_factors'], np.sqrt(2) * 0.02 / 2, rtol=0.1)
+    assert get_halogen_spectra(lamp_files[0]) is get_halogen_spectra(lamp_files[0])
+
+
+def test_compile_kernel_matches_written_products():
+    directory = mkdtemp()
+    nonlinear_file, response_file = os.path.join(directory, 'nonlinearity_correction.txt'), os.path.join(directory, 'response.txt')
+    DN = np.arange(0., 4000., 4.)
+    nonlinear_correction_dict = {'DN': DN, 'nonlinear': 1 - 0.05 * np.sin(DN / 900.)}
+    pd.DataFrame(np.transpose([DN, nonlinear_correction_dict['nonlinear']]),
+                 columns=['DN', 'nonlinear_correction']).to_csv(nonlinear_file, index=False)
+    wave, int_times, cube = stack_sessions([synthetic_cal_dict(3.), synthetic_cal_dict(6., (10., 80.))])
+    response_dict = build_response(wave, cube, [create_lamp_file(), create_lamp_file(scale=2.)], response_file)
+    tdata = np.random.RandomState(0).uniform(100, 3500, (5, len(WAVE)))
+    spectra = [kernel.apply({'tdata': tdata, 'wave': WAVE, 'IntTime': 10., 'darkcurrent_corrected': True})
+               for kernel in [compile_kernel(nonlinear_correction_dict, response_dict),
+                              CalibrationKernel.from_files(nonlinear_file, response_file)]]
+    assert_allclose(spectra[0]['tdata'], spectra[1]['tdata'], rtol=1e-10)
+    assert_allclose(spectra[0]['mean'], spectra[1]['mean'], rtol=1e-10)
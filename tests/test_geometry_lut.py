@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from tempfile import mkdtemp
+from datetime import datetime, timedelta
+from numpy.testing import assert_allclose, assert_array_equal
+from evaluation.processing import geometry_lut
+from evaluation.processing.geometry_lut import get_geometry, get_day_table, clear_tables, table_file, precompute, SITES
+from evaluation.processing.solar_zenith import sun_geometry
+
+
+def test_get_geometry_matches_direct_evaluation():
+    directory = mkdtemp()
+    lat, lon, el = SITES['LMU']
+    times = [datetime(2016, 7, 11, 4) + timedelta(seconds=37 * i) for i in range(1000)]
+    geometry = get_geometry(times, lat, lon, el, directory=directory)
+    reference = sun_geometry(times, lat, lon, el)
+    assert_allclose(geometry['zenith'], reference['zenith'], atol=1e-3)
+    assert_allclose(geometry['airmass'], reference['airmass'], rtol=1e-3)
+    assert_allclose(geometry['ozone_path'], reference['ozone_path'], rtol=1e-3)
+
+
+def test_day_table_persisted_and_shared():
+    directory = mkdtemp()
+    lat, lon, el = SITES['DLR']
+    day = datetime(2015, 12, 21)
+    table = get_day_table(lat, lon, day, directory)
+    assert get_day_table(lat, lon, day, directory) is table
+    assert os.path.isfile(table_file(lat, lon, np.datetime64(day, 'D'), directory))
+    clear_tables()
+    assert_array_equal(get_day_table(lat, lon, day, directory)['zenith'], table['zenith'])
+
+
+def test_get_geometry_spans_days_and_scalars():
+    directory = mkdtemp()
+    lat, lon, el = SITES['LMU']
+    times = np.array([datetime(2016, 7, 11, 23, 59, 30), datetime(2016, 7, 12, 0, 0, 30)])
+    geometry = get_geometry(times, lat, lon, el, directory=directory)
+    assert geometry['zenith'].shape == (2,)
+    assert len(os.listdir(directory)) == 2
+    scalar = get_geometry(times[0], lat, lon, el, directory=directory)
+    assert np.ndim(scalar['zenith']) == 0
+    assert_allclose(scalar['zenith'], geometry['zenith'][0])
+
+
+def test_precompute():
+    directory = mkdtemp()
+    precompute('LMU', datetime(2016, 7, 1), 3, directory)
+    assert len([name for name in os.listdir(directory) if name.endswith('.npz')]) == 3
+
+
+def test_corrupt_day_table_rebuilt():
+    directory = mkdtemp()
+    lat, lon, el = SITES['LMU']
+    day = datetime(2016, 3, 20)
+    table = get_day_table(lat, lon, day, directory)
+    filename = table_file(lat, lon, np.datetime64(day, 'D'), directory)
+    with open(filename, 'rb') as fp:
+        head = fp.read(1024)
+    with open(filename, 'wb') as fp:
+        fp.write(head)
+    clear_tables()
+    assert_array_equal(get_day_table(lat, lon, day, directory)['zenith'], table['zenith'])
+    clear_tables()
+    with np.load(filename) as npz:
+        assert_array_equal(npz['zenith'], table['zenith'])
+
+
+def test_tables_bounded(monkeypatch):
+    monkeypatch.setattr(geometry_lut, 'TABLE_CACHE_SIZE', 2)
+    clear_tables()
+    directory = mkdtemp()
+    lat, lon, el = SITES['DLR']
+    first = get_day_table(lat, lon, datetime(2016, 1, 1), directory)
+    second = get_day_table(lat, lon, datetime(2016, 1, 2), directory)
+    assert get_day_table(lat, lon, datetime(2016, 1, 1), directory) is first
+    get_day_table(lat, lon, datetime(2016, 1, 3), directory)
+    assert len(geometry_lut._tables) == 2
+    assert get_day_table(lat, lon, datetime(2016, 1, 1), directory) is first
+    assert get_day_table(lat, lon, datetime(2016, 1, 2), directory) is not second
@@ -0,0 +1,57 @@
+import os
+import pytest
+import numpy as np
+from tempfile import mkdtemp
+from datetime import datetime
+from numpy.testing import assert_array_equal
+from evaluation.parser.ibsen_parser import parse_ibsen_file
+from evaluation.parser.ibsen_archive import IbsenArchive, append_spectra
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def test_archive_roundtrip():
+    archive_file = os.path.join(mkdtemp(), 'test.ibsa')
+    files = [create_meas_file(DEFAULT_MEAS), create_meas_file(DEFAULT_MEAS.replace('11:30:26', '12:30:26'))]
+    spectra = [parse_ibsen_file(file_) for file_ in files]
+    append_spectra(archive_file, spectra[:1], files[:1])
+    append_spectra(archive_file, spectra[1:], files[1:])
+    archive = IbsenArchive(archive_file)
+    assert len(archive) == 2
+    assert_array_equal(archive.wave, spectra[0]['wave'])
+    spectrum = archive[1]
+    assert spectrum['UTCTime'] == datetime(2016, 5, 25, 12, 30, 26)
+    assert spectrum['Type'] == 'reference'
+    assert_array_equal(spectrum['tdata'], spectra[1]['tdata'])
+    assert_array_equal(spectrum['mean'], spectra[1]['mean'])
+    assert isinstance(spectrum['tdata'].base, np.memmap) or np.may_share_memory(spectrum['tdata'], archive.records)
+    assert list(archive.select_time(datetime(2016, 5, 25, 12))) == [1]
+    assert list(archive.get_index()['Type']) == ['reference', 'reference']
+
+
+def test_append_rejects_lossy_data():
+    archive_file = os.path.join(mkdtemp(), 'test.ibsa')
+    filename = create_meas_file(DEFAULT_MEAS)
+    spectrum = parse_ibsen_file(filename)
+    append_spectra(archive_file, [spectrum], [filename], scan_dtype='<u2')
+    calibrated = parse_ibsen_file(filename)
+    calibrated['tdata'] = calibrated['tdata'] * 0.5 - 1000.
+    with pytest.raises(ValueError):
+        append_spectra(archive_file, [calibrated], [filename])
+    with pytest.raises(ValueError):
+        append_spectra(archive_file, [spectrum], ['x' * 65])
+    assert len(IbsenArchive(archive_file)) == 1
+
+
+def test_append_after_torn_record():
+    archive_file = os.path.join(mkdtemp(), 'test.ibsa')
+    files = [create_meas_file(DEFAULT_MEAS), create_meas_file(DEFAULT_MEAS.replace('11:30:26', '12:30:26'))]
+    spectra = [parse_ibsen_file(file_) for file_ in files]
+    append_spectra(archive_file, spectra[:1], files[:1])
+    with open(archive_file, 'ab') as fp:
+        fp.write(b'\0' * 100)  # interrupted append
+    append_spectra(archive_file, spectra[1:], files[1:])
+    archive = IbsenArchive(archive_file)
+    assert len(archive) == 2
+    assert archive[1]['UTCTime'] == datetime(2016, 5, 25, 12, 30, 26)
+    assert_array_equal(archive[1]['tdata'], spectra[1]['tdata'])
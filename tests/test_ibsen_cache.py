@@ -0,0 +1,68 @@
+import os
+import numpy as np
+from tempfile import mkdtemp
+from numpy.testing import assert_array_equal
+from evaluation.parser.ibsen_parser import read_ibsen_file, parse_ibsen_file, enable_cache, disable_cache
+from evaluation.parser.ibsen_cache import SpectraCache
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def test_cache_roundtrip():
+    filename = create_meas_file(DEFAULT_MEAS)
+    cache = SpectraCache(mkdtemp())
+    assert cache.load(filename) is None
+    parsed = read_ibsen_file(filename)
+    cache.store(filename, parsed)
+    cached = cache.load(filename)
+    assert sorted(cached.keys()) == sorted(parsed.keys())
+    for key, value in parsed.items():
+        assert_array_equal(cached[key], value)
+
+
+def test_cache_invalidated_by_modification():
+    filename = create_meas_file(DEFAULT_MEAS)
+    cache = SpectraCache(mkdtemp())
+    cache.store(filename, read_ibsen_file(filename))
+    with open(filename, 'a') as fp:
+        fp.write('\n')
+    assert cache.load(filename) is None
+
+
+def test_cache_lru_eviction():
+    cache = SpectraCache(mkdtemp())
+    files = [create_meas_file(DEFAULT_MEAS) for _ in range(3)]
+    cache.store(files[0], read_ibsen_file(files[0]))
+    entry_size = cache.size()
+    cache.max_bytes = 2 * entry_size
+    cache.store(files[1], read_ibsen_file(files[1]))
+    os.utime(cache.entry(files[1]), (0, 0))
+    cache.load(files[0])
+    cache.store(files[2], read_ibsen_file(files[2]))
+    assert cache.size() <= cache.max_bytes
+    assert cache.load(files[1]) is None
+    assert cache.load(files[0]) is not None
+
+
+def test_cache_reduced_precision():
+    filename = create_meas_file(DEFAULT_MEAS)
+    cache = SpectraCache(mkdtemp())
+    cache.store(filename, read_ibsen_file(filename, dtype=np.float32), np.float32)
+    assert cache.load(filename) is None
+    cached = cache.load(filename, np.float32)
+    assert cached['data'].dtype == np.float32
+    assert_array_equal(cached['data'], read_ibsen_file(filename)['data'])
+
+
+def test_stream_uses_cached_parse():
+    filename = create_meas_file(DEFAULT_MEAS)
+    streamed = parse_ibsen_file(filename, stream=True, keep_every=10)
+    cache = enable_cache(mkdtemp())
+    try:
+        cache.store(filename, read_ibsen_file(filename))
+        cached = parse_ibsen_file(filename, stream=True, keep_every=10)
+    finally:
+        disable_cache()
+    assert cached['scan_step'] == 10
+    for key in ['data', 'wave', 'mean', 'data_sample_std', 'num_of_meas', 'IntTime']:
+        np.testing.assert_allclose(cached[key], streamed[key], rtol=1e-12)
@@ -0,0 +1,66 @@
+import os
+import pytest
+import numpy as np
+from tempfile import mkdtemp
+from datetime import datetime
+from numpy.testing import assert_array_equal
+from evaluation.parser.ibsen_parser import parse_ibsen_file, read_ibsen_file, stream_ibsen_file
+from evaluation.parser.ibsen_dn_archive import DNArchive, pack_files, delta_encode, delta_decode
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def test_delta_encoding_lossless():
+    scans = np.array([[1000., 1003., 998.], [65535., 0., 12.]])
+    blob, dtype = delta_encode(scans)
+    assert np.dtype(dtype).kind == 'i'
+    assert_array_equal(delta_decode(blob, dtype, 2, 3), scans)
+    blob, dtype = delta_encode(scans + 0.5)
+    assert dtype is None
+    assert_array_equal(delta_decode(blob, dtype, 2, 3), scans + 0.5)
+
+
+def test_archive_member_parse():
+    archive_file = os.path.join(mkdtemp(), 'test.ibsz')
+    files = [create_meas_file(DEFAULT_MEAS), create_meas_file(DEFAULT_MEAS.replace('11:30:26', '12:30:26'))]
+    pack_files(files[:1], archive_file, chunk_members=1)
+    pack_files(files[1:], archive_file, chunk_members=1)
+    archive = DNArchive(archive_file)
+    assert len(archive) == 2
+    assert archive.select_time(datetime(2016, 5, 25, 12), datetime(2016, 5, 25, 13)) == [os.path.basename(files[1])]
+    for file_, path in zip(files, archive.paths()):
+        expected = read_ibsen_file(file_)
+        parsed = parse_ibsen_file(path)
+        assert sorted(parsed.keys()) == sorted(expected.keys())
+        for key, value in expected.items():
+            assert_array_equal(parsed[key], value)
+
+
+def test_archive_member_stream():
+    archive_file = os.path.join(mkdtemp(), 'test.ibsz')
+    file_ = create_meas_file(DEFAULT_MEAS)
+    pack_files([file_], archive_file)
+    path = DNArchive(archive_file).paths()[0]
+    for keep_every in [None, 2]:
+        expected = stream_ibsen_file(file_, keep_every=keep_every)
+        parsed = parse_ibsen_file(path, stream=True, keep_every=keep_every)
+        assert parsed['scan_step'] == keep_every
+        assert parsed['data'].shape == expected['data'].shape
+        for key in ['wave', 'data', 'mean', 'data_sample_std']:
+            assert np.allclose(parsed[key], expected[key])
+
+
+def test_failed_append_keeps_archive():
+    archive_file = os.path.join(mkdtemp(), 'test.ibsz')
+    filename = create_meas_file(DEFAULT_MEAS)
+    pack_files([filename], archive_file)
+    size = os.path.getsize(archive_file)
+    with pytest.raises(ValueError):
+        pack_files([filename], archive_file)
+    broken = create_meas_file('[Measurement]\nno data\n')
+    with pytest.raises(ValueError):
+        pack_files([create_meas_file(DEFAULT_MEAS), broken], archive_file)
+    assert os.path.getsize(archive_file) == size
+    archive = DNArchive(archive_file)
+    assert archive.names == [os.path.basename(filename)]
+    assert_array_equal(archive.read(archive.names[0])['tdata'], read_ibsen_file(filename)['tdata'])
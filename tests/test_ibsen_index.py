@@ -0,0 +1,63 @@
+import os
+import re
+import shutil
+from datetime import datetime
+from tempfile import mkdtemp
+from evaluation.parser.ibsen_index import build_index, pair_files, group_by_number, select_time_window, read_index, INDEX_FILE
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def create_directory(names, directory=None):
+    directory = directory or mkdtemp() + '/'
+    for name in names:
+        meas_type = re.split('[0-9]{3,}', name)[0]
+        with open(directory + name, 'w') as fp:
+            fp.write(DEFAULT_MEAS.replace('MeasurementType reference', 'MeasurementType %s' % meas_type))
+    return directory
+
+
+def test_build_index():
+    directory = create_directory(['target000.asc', 'reference000.asc', 'target001.asc'])
+    index = build_index(directory)
+    assert os.path.exists(directory + INDEX_FILE)
+    assert list(index['file']) == ['reference000.asc', 'target000.asc', 'target001.asc']
+    assert list(index['Type']) == ['reference', 'target', 'target']
+    assert (index['IntTime'] == 40.).all()
+    assert (index['NumSamples'] == 30).all()
+    assert index['Model'][0] == 'Freedom VIS FSV-305'
+    assert index['UTCTime'][0] == datetime(2016, 5, 25, 11, 30, 26)
+    assert len(read_index(directory)) == 3
+    shutil.rmtree(directory)
+
+
+def test_incremental_update():
+    directory = create_directory(['target000.asc', 'reference000.asc'])
+    build_index(directory)
+    os.remove(directory + 'reference000.asc')
+    create_directory(['darkcurrent000.asc'], directory)
+    index = build_index(directory)
+    assert list(index['file']) == ['darkcurrent000.asc', 'target000.asc']
+
+
+def test_pair_files():
+    directory = create_directory(['target000.asc', 'reference000.asc', 'target001.asc', 'darkcurrent000.asc'])
+    index = build_index(directory)
+    pairs = pair_files(directory, index, 'target', ['reference'])
+    assert pairs[0] == {'target': directory + 'target000.asc', 'reference': directory + 'reference000.asc'}
+    assert pairs[1] == {'target': directory + 'target001.asc', 'reference': None}
+    groups = group_by_number(directory, index)
+    assert sorted(groups['000'].keys()) == ['darkcurrent', 'reference', 'target']
+    assert len(select_time_window(index, end=datetime(2016, 5, 25))) == 0
+
+
+def test_pair_files_by_file_name():
+    directory = create_directory(['target000.asc', 'reference000.asc', 'target.asc', 'reference.asc'])
+    with open(directory + 'target001.asc', 'w') as fp:
+        fp.write(DEFAULT_MEAS)  # header type reference, file name target
+    create_directory(['reference_001.asc'], directory)
+    index = build_index(directory)
+    pairs = pair_files(directory, index, 'target', ['reference'])
+    assert len(pairs) == 2
+    assert pairs[0] == {'target': directory + 'target000.asc', 'reference': directory + 'reference000.asc'}
+    assert pairs[1] == {'target': directory + 'target001.asc', 'reference': directory + 'reference_001.asc'}
+    assert '' not in group_by_number(directory, index)
@@ -0,0 +1,25 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+from evaluation.parser.ibsen_parser import parse_ibsen_file
+from evaluation.parser.ibsen_loader import load_files, parse_files, select
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def test_load_files():
+    files = [create_meas_file(DEFAULT_MEAS), create_meas_file(DEFAULT_MEAS.replace('reference', 'darkcurrent'))]
+    cube = load_files(files, processes=2)
+    single = parse_ibsen_file(files[0])
+    assert cube['tdata'].shape == (2, 30, 2)
+    assert_array_equal(cube['wave'], single['wave'])
+    assert_array_equal(cube['tdata'][0], single['tdata'])
+    assert_array_equal(cube['mean'][1], single['mean'])
+    assert_array_equal(cube['Type'], ['reference', 'darkcurrent'])
+    assert_array_equal(cube['IntTime'], [40., 40.])
+    dark = select(cube, cube['Type'] == 'darkcurrent')
+    assert dark['tdata'].shape == (1, 30, 2)
+
+
+def test_parse_files_keeps_order():
+    files = [create_meas_file(DEFAULT_MEAS.replace('reference', meas)) for meas in ['target', 'reference', 'darkcurrent']]
+    assert [ibsen_dict['Type'] for ibsen_dict in parse_files(files, processes=3)] == ['target', 'reference', 'darkcurrent']
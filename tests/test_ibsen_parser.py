@@ -1,5 +1,6 @@
-import numpy as np
 import copy
+import pytest
+import numpy as np
 from datetime import datetime
 from numpy.testing import assert_equal, assert_array_equal
 from evaluation.parser.ibsen_parser import parse_ibsen_file, get_mean_column
@@ -46,3 +47,45 @@ def test_parse_ibsen_file():
     assert ibsen_dict['Type'] == 'reference'
     assert ibsen_dict['UTCTime'] == UTCTime
     assert_equal(np.array(sorted(ibsen_dict.keys())), DEFAULT_KEYS)
+
+
+def test_parse_ibsen_file_data_block():
+    filename = create_meas_file(DEFAULT_MEAS)
+    ibsen_dict = parse_ibsen_file(filename)
+    assert ibsen_dict['start_data_index'] == 19
+    assert ibsen_dict['darkcurrent_corrected'] == False
+    assert ibsen_dict['num_of_meas'] == 30
+    assert_array_equal(ibsen_dict['wave'], [313.22, 313.22])
+    assert_array_equal(ibsen_dict['data_mean'], [1641.23, 1641.23])
+    assert ibsen_dict['data'].shape == (2, 30)
+    assert_array_equal(ibsen_dict['tdata'], np.transpose(ibsen_dict['data']))
+    assert_array_equal(ibsen_dict['mean'], np.mean(ibsen_dict['data'], axis=1))
+
+
+def test_stream_ibsen_file():
+    filename = create_meas_file(DEFAULT_MEAS)
+    parsed = parse_ibsen_file(filename)
+    streamed = parse_ibsen_file(filename, stream=True, chunk_size=7, keep_every=10)
+    assert streamed['num_of_meas'] == 30
+    assert streamed['data'].shape == (2, 3)
+    assert_array_equal(streamed['data'], parsed['data'][:, ::10])
+    assert_array_equal(streamed['wave'], parsed['wave'])
+    np.testing.assert_allclose(streamed['mean'], parsed['mean'], rtol=1e-12)
+    np.testing.assert_allclose(streamed['data_sample_std'], parsed['data_sample_std'], rtol=1e-10)
+
+
+def test_stream_ibsen_file_chunks():
+    scans = np.random.RandomState(0).randint(1000, 60000, (100, 1000))
+    rows = ['%s %s %s %s' % (300. + i, np.mean(row), np.std(row), ' '.join(map(str, row))) for i, row in enumerate(scans)]
+    header = DEFAULT_MEAS[:DEFAULT_MEAS.index('[IntTime]')] + '[IntTime]\n' + '40 ' * 1000 + '\n\n[DataRaw]\n'
+    filename = create_meas_file(header + '\n'.join(rows) + '\n')
+    streamed = parse_ibsen_file(filename, stream=True, chunk_size=16, keep_every=7)
+    assert streamed['num_of_meas'] == 1000
+    assert_array_equal(streamed['wave'], 300. + np.arange(100))
+    assert_array_equal(streamed['data'], scans[:, ::7])
+    np.testing.assert_allclose(streamed['mean'], np.mean(scans, axis=1), rtol=1e-12)
+    np.testing.assert_allclose(streamed['data_sample_std'], np.std(scans, axis=1, ddof=1), rtol=1e-10)
+    with open(filename, 'a') as fp:
+        fp.write('400. 1. 1. 2 3\n')
+    with pytest.raises(ValueError):
+        parse_ibsen_file(filename, stream=True, chunk_size=16)
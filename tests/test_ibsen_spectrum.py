@@ -0,0 +1,77 @@
+import copy
+import pickle
+import numpy as np
+from numpy.testing import assert_array_equal
+from evaluation.parser.ibsen_parser import parse_ibsen_file
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def test_views_share_raw():
+    spectrum = parse_ibsen_file(create_meas_file(DEFAULT_MEAS))
+    assert np.shares_memory(spectrum['data'], spectrum.raw)
+    assert np.shares_memory(spectrum['tdata'], spectrum['data'])
+    assert_array_equal(spectrum['tdata'], np.transpose(spectrum['data']))
+    assert_array_equal(spectrum['data_sample_std'], np.std(spectrum['data'], axis=1, ddof=1))
+    assert_array_equal(spectrum['mean'], np.mean(spectrum['tdata'], axis=0))
+
+
+def test_assignment_is_dict_like():
+    spectrum = parse_ibsen_file(create_meas_file(DEFAULT_MEAS))
+    mean = spectrum['mean']
+    spectrum['tdata'] = spectrum['tdata'][:, 1:]
+    assert spectrum['tdata'].shape == (30, 1)
+    assert spectrum['data'].shape == (2, 30)
+    assert_array_equal(spectrum['mean'], mean)
+    spectrum['extra'] = 1
+    assert 'extra' in spectrum.keys()
+
+
+def test_copy_on_write():
+    spectrum = parse_ibsen_file(create_meas_file(DEFAULT_MEAS))
+    tdata = np.array(spectrum['tdata'])
+    duplicate = copy.deepcopy(spectrum)
+    assert np.shares_memory(duplicate.raw, spectrum.raw)
+    duplicate['tdata'] = duplicate['tdata'] - 10
+    assert_array_equal(spectrum['tdata'], tdata)
+    assert_array_equal(duplicate['tdata'], tdata - 10)
+    try:
+        copy.copy(spectrum)['data'][0] -= 10
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Shared scan matrix is writeable')
+    assert spectrum['data'].flags.writeable
+    assert_array_equal(spectrum['tdata'], tdata)
+
+
+def test_pickle():
+    spectrum = parse_ibsen_file(create_meas_file(DEFAULT_MEAS))
+    restored = pickle.loads(pickle.dumps(spectrum, 2))
+    assert restored['Type'] == 'reference'
+    assert_array_equal(restored['data'], spectrum['data'])
+
+
+def test_reduced_precision_accuracy():
+    filename = create_meas_file(DEFAULT_MEAS)
+    reference = parse_ibsen_file(filename)
+    dark_mean = reference['mean'] - 100.
+    for dtype, rtol in [(np.uint16, 0), (np.float32, 1e-7)]:
+        spectrum = parse_ibsen_file(filename, dtype=dtype)
+        assert spectrum['data'].dtype == dtype
+        assert spectrum['wave'].dtype == np.float64
+        assert_array_equal(spectrum['data'], reference['data'])
+        np.testing.assert_allclose(spectrum['mean'], reference['mean'], rtol=rtol)
+        np.testing.assert_allclose(spectrum['data_sample_std'], reference['data_sample_std'], rtol=rtol)
+        corrected = (spectrum['tdata'] - dark_mean).astype(np.float32)
+        np.testing.assert_allclose(corrected, reference['tdata'] - dark_mean, rtol=1e-7)
+
+
+def test_uint16_rejects_calibrated_values():
+    filename = create_meas_file(DEFAULT_MEAS.replace('1636 ', '1636.5 '))
+    try:
+        parse_ibsen_file(filename, dtype=np.uint16)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('uint16 storage of non integer values')
@@ -0,0 +1,75 @@
+import pytest
+from tempfile import mkdtemp
+from evaluation import ingest
+from evaluation.ingest import SetCollector, IngestionService
+from evaluation.parser.ibsen_parser import parse_ibsen_file
+from test_ibsen_parser import DEFAULT_MEAS
+from test_level0to1 import NONLINEAR, RESPONSE
+
+CONFIG = {'Processing': dict(), 'Fitting': {'independent': dict()}}
+
+
+def test_set_collector():
+    collector = SetCollector(['target', 'reference'])
+    collector.add('/tmp/target003.asc')
+    collector.add('/tmp/darkcurrent003.asc')
+    collector.add('/tmp/notes.txt')
+    assert collector.pop_ready(0, ['target', 'reference']) == []
+    collector.add('/tmp/reference003.asc')
+    assert collector.pop_ready(60, ['target', 'reference']) == []
+    ready = collector.pop_ready(0, ['target', 'reference'])
+    assert ready == [('003', {'target': '/tmp/target003.asc', 'reference': '/tmp/reference003.asc'})]
+    collector.add('/tmp/target003.asc')
+    assert collector.pop_ready(0, ['target']) == []
+
+
+def test_set_collector_done_bounded(monkeypatch):
+    monkeypatch.setattr(ingest, 'DONE_SIZE', 3)
+    collector = SetCollector(['target'])
+    for number in range(5):
+        collector.add('/tmp/target%03i.asc' % number)
+    assert len(collector.pop_ready(0, ['target'])) == 5
+    assert list(collector.done.keys()) == ['002', '003', '004']
+
+
+def test_set_collector_drops_stale_sets():
+    collector = SetCollector(['target', 'reference'])
+    collector.add('/tmp/target004.asc')
+    collector.add('/tmp/target005.asc')
+    collector.changed['004'] -= 100
+    assert collector.pop_stale(60) == [('004', {'target': '/tmp/target004.asc'})]
+    assert list(collector.pending.keys()) == ['005']
+
+
+def create_set(meas, names=('target000.asc', 'reference000.asc', 'darkcurrent000.asc')):
+    directory = mkdtemp() + '/'
+    files = dict()
+    for name in names:
+        meas_type = name[:-len('000.asc')]
+        files[meas_type] = directory + name
+        with open(files[meas_type], 'w') as fp:
+            fp.write(meas.replace('MeasurementType reference', 'MeasurementType %s' % meas_type))
+    return directory, files
+
+
+def test_process_parses_dark_once(monkeypatch):
+    directory, files = create_set(DEFAULT_MEAS)
+    parsed = []
+    monkeypatch.setattr(ingest, 'parse_ibsen_file', lambda filename: parsed.append(filename) or parse_ibsen_file(filename))
+    monkeypatch.setattr(ingest, 'evaluate_parsed', lambda ref, tar, config, logger, plot: (ref, tar))
+    monkeypatch.setattr(ingest, 'result_row', lambda params, config, target_file: params)
+    service = IngestionService(directory, CONFIG, directory + 'results.csv', nonlinear_file=NONLINEAR, response_file=RESPONSE)
+    row = service.process(files)
+    assert parsed == [files['darkcurrent']]
+    assert row['darkcurrent_corrected']
+
+
+def test_raw_sets_rejected_without_products():
+    directory, files = create_set(DEFAULT_MEAS)
+    service = IngestionService(directory, CONFIG, directory + 'results.csv')
+    with pytest.raises(ValueError):
+        service.process(files)
+    del files['darkcurrent']
+    service = IngestionService(directory, CONFIG, directory + 'results.csv', nonlinear_file=NONLINEAR, response_file=RESPONSE)
+    with pytest.raises(ValueError):
+        service.process(files)
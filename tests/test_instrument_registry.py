@@ -0,0 +1,42 @@
+import os
+import shutil
+import pytest
+from tempfile import mkdtemp
+from evaluation.calibration.instrument_registry import InstrumentRegistry, CALIBRATION_DIR, DEFAULT_PRODUCTS
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+NO_INSTRUMENT_MEAS = DEFAULT_MEAS.replace('Model   Freedom VIS FSV-305\n', '').replace('Detector    S10420-1006-01\n', '')
+
+
+def test_discover_shipped_products():
+    registry = InstrumentRegistry()
+    assert registry.instruments['Ibsen_0109_5313264_calibration_files']['Serial'] == '5313264'
+    assert registry.instruments['Ibsen_0107_Serialnumber_missing_calibration_files']['nonlinear'].endswith('nonlinearity_correstion.txt')
+    assert registry.identify({'Serial': '5313264'}) == 'Ibsen_0109_5313264_calibration_files'
+
+
+def test_identify_by_model_and_detector():
+    directory = mkdtemp()
+    for name in ['Ibsen_0107_Serialnumber_missing_calibration_files', 'Ibsen_0109_5313264_calibration_files']:
+        shutil.copytree(os.path.join(CALIBRATION_DIR, name), os.path.join(directory, name))
+    with open(os.path.join(directory, 'Ibsen_0107_Serialnumber_missing_calibration_files', 'instrument.ini'), 'w') as fp:
+        fp.write('[Instrument]\nModel = Freedom VIS FSV-305\nDetector = S10420-1006-01\n')
+    registry = InstrumentRegistry(directory)
+    meas_file = create_meas_file(DEFAULT_MEAS)
+    assert registry.identify(meas_file) == 'Ibsen_0107_Serialnumber_missing_calibration_files'
+    assert registry.kernel_for(meas_file) is registry.kernel('Ibsen_0107_Serialnumber_missing_calibration_files')
+    assert registry.identify({'Model': '', 'Detector': ''}) == DEFAULT_PRODUCTS
+    with pytest.raises(ValueError):
+        registry.identify({'Model': 'unknown', 'Detector': ''})
+    with pytest.raises(ValueError):
+        InstrumentRegistry(directory, default=None).identify({'Model': '', 'Detector': ''})
+
+
+def test_default_products_only_without_instrument():
+    registry = InstrumentRegistry()
+    assert registry.identify(create_meas_file(NO_INSTRUMENT_MEAS)) == DEFAULT_PRODUCTS
+    with pytest.raises(ValueError):
+        registry.identify(create_meas_file(DEFAULT_MEAS))
+    with pytest.raises(ValueError):
+        registry.identify({'Serial': '1234567', 'Model': '', 'Detector': ''})
@@ -0,0 +1,57 @@
+import os
+import re
+import pytest
+import numpy as np
+from tempfile import mkdtemp
+from numpy.testing import assert_allclose
+from evaluation.calibration.level0to1 import start_level0to1, calibrate_meas
+from evaluation.calibration.dark_current import DarkModel
+from evaluation.calibration.instrument_registry import CALIBRATION_DIR
+from test_ibsen_parser import DEFAULT_MEAS
+
+PRODUCTS = os.path.join(CALIBRATION_DIR, 'Ibsen_0109_5313264_calibration_files')
+NONLINEAR = os.path.join(PRODUCTS, 'nonlinearity_correction.txt')
+RESPONSE = os.path.join(PRODUCTS, 'response.txt')
+
+
+def create_campaign(names, meas=DEFAULT_MEAS):
+    directory = mkdtemp() + '/'
+    os.mkdir(directory + 'calibrated')
+    for name in names:
+        meas_type = re.split('[0-9]{3,}', name)[0]
+        with open(directory + name, 'w') as fp:
+            fp.write(meas.replace('MeasurementType reference', 'MeasurementType %s' % meas_type))
+    return directory
+
+
+def test_darkcurrent_only_groups_skipped():
+    directory = create_campaign(['darkcurrent000.asc', 'reference000.asc', 'target000.asc', 'darkcurrent001.asc'])
+    done = start_level0to1(directory, NONLINEAR, RESPONSE, processes=1)
+    assert done == [[directory + 'reference000.asc', directory + 'target000.asc']]
+    assert sorted(os.listdir(directory + 'calibrated')) == ['reference000.asc', 'target000.asc']
+
+
+def test_default_products_from_registry():
+    meas = DEFAULT_MEAS.replace('Model   Freedom VIS FSV-305\n', '').replace('Detector    S10420-1006-01\n', '')
+    directory = create_campaign(['darkcurrent000.asc', 'target000.asc'], meas)
+    assert start_level0to1(directory, None, None, processes=1) == [[directory + 'target000.asc']]
+    assert os.listdir(directory + 'calibrated') == ['target000.asc']
+
+
+def test_unknown_instrument_skipped():
+    directory = create_campaign(['darkcurrent000.asc', 'target000.asc'])
+    assert start_level0to1(directory, None, None, processes=1) == [[]]
+    assert os.listdir(directory + 'calibrated') == []
+
+
+def test_dark_model_at_header_temperature():
+    directory = create_campaign([])
+    with open(directory + 'target000.asc', 'w') as fp:
+        fp.write(DEFAULT_MEAS.replace('NumSamples  30', 'NumSamples  30\nTemperature 20.0'))
+    model = DarkModel([100., 100.], [1., 1.], wave=[313.22, 313.22], temperature_offset=[2., 2.],
+                      temperature_rate=[0., 0.], reference_temperature=10.)
+    calibrated = calibrate_meas(directory + 'target000.asc', None, NONLINEAR, RESPONSE, dark_model=model)
+    expected = calibrate_meas(directory + 'target000.asc', None, NONLINEAR, RESPONSE, dark_dict=model.dark_dict(40., 20.))
+    assert_allclose(calibrated['mean'], expected['mean'])
+    with pytest.raises(ValueError):
+        calibrate_meas(directory + 'target000.asc', None, NONLINEAR, RESPONSE, dark_model=DarkModel(np.zeros(3), np.zeros(3)))
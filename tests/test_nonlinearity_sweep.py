@@ -0,0 +1,31 @@
+import numpy as np
+from evaluation.calibration.nonlinearity_sweep import sweep_nonlinearity, best_config, score_config, init_worker
+from evaluation.calibration.extract_nonlinearity import nonlinearity_spread
+
+INT_TIMES = [5., 10., 20., 40., 80., 160.]
+
+
+def synthetic_cal_dict(channels=200):
+    """ Linear signal compressed by a smooth detector nonlinearity """
+    signal = np.linspace(5, 300, channels)
+    cal_dict = dict()
+    for int_time in INT_TIMES:
+        linear = signal * int_time
+        cal_dict[int_time] = {'reference': {'mean': linear * (1 - 0.03 * linear / 50000.)},
+                              'darkcurrent': {'mean': np.zeros(channels)}}
+    return cal_dict
+
+
+def test_sweep_finds_valid_setting():
+    cal_dict = synthetic_cal_dict()
+    noise_dict = {'noise': np.zeros(200)}
+    grid = {'sigma': [100, 400], 'index_start_spline_fit': [100, 10 ** 6], 'gaussian_mean_steps': [20]}
+    frame = sweep_nonlinearity(cal_dict, noise_dict, grid, processes=2)
+    assert len(frame) == 2 * 2 * 4
+    assert list(frame['score']) == sorted(frame['score'])
+    config = best_config(frame)
+    assert isinstance(config['index_start_spline_fit'], int)
+    uncorrected = np.median(np.abs(nonlinearity_spread(cal_dict, {'DN': [0., 1.], 'nonlinear': [1., 1.]})))
+    assert frame['score'][0] < uncorrected
+    init_worker(cal_dict, noise_dict)
+    assert score_config(dict(config, max_lowest_int_time=10 ** 9)) == np.inf
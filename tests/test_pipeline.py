@@ -0,0 +1,60 @@
+import os
+import numpy as np
+from tempfile import mkdtemp
+from numpy.testing import assert_allclose
+from evaluation import pipeline
+from evaluation.pipeline import calibrate_set, run_pipeline
+from evaluation.parser.ibsen_parser import parse_ibsen_file
+from evaluation.calibration.level0to1 import write_to_file
+from evaluation.calibration.calibration_kernel import CalibrationKernel
+from evaluation.utils.util import create_meas_file
+from test_ibsen_parser import DEFAULT_MEAS
+
+
+def test_calibrate_set_in_memory():
+    files = {'reference': create_meas_file(DEFAULT_MEAS),
+             'target': create_meas_file(DEFAULT_MEAS.replace('reference', 'target')),
+             'darkcurrent': create_meas_file(DEFAULT_MEAS.replace('reference', 'darkcurrent'))}
+    kernel = CalibrationKernel(np.arange(0., 4000., 4.), np.ones(1000), [300., 900.], [1., 1.])
+    spectra = calibrate_set(files, kernel)
+    assert sorted(spectra.keys()) == ['reference', 'target']
+    for spectrum in spectra.values():
+        assert spectrum['darkcurrent_corrected']
+        assert_allclose(spectrum['mean'], 0., atol=1e-12)
+
+
+def test_calibrate_set_matches_level1_files():
+    directory = mkdtemp() + '/'
+    os.mkdir(directory + 'calibrated')
+    data = DEFAULT_MEAS[DEFAULT_MEAS.index('[DataRaw]'):]
+    dark_data = '[DataRaw]\n' + ('313.22 100.0 1.0 ' + ' '.join(['100'] * 30) + '\n') * 2
+    files = {'reference': DEFAULT_MEAS,
+             'target': DEFAULT_MEAS.replace('reference', 'target'),
+             'darkcurrent': DEFAULT_MEAS.replace('reference', 'darkcurrent').replace(data, dark_data)}
+    for key, text in files.items():
+        files[key] = directory + key + '000.asc'
+        with open(files[key], 'w') as fp:
+            fp.write(text)
+    kernel = CalibrationKernel(np.arange(0., 4000., 4.), 0.9 * np.ones(1000), [300., 900.], [2., 2.])
+    spectra = calibrate_set(files, kernel)
+    for key, spectrum in spectra.items():
+        write_to_file(spectrum, files[key])
+        level1 = parse_ibsen_file(directory + 'calibrated/' + key + '000.asc')
+        assert_allclose(spectrum['mean'], level1['mean'], rtol=1e-5)
+        assert_allclose(spectrum['data_sample_std'], level1['data_sample_std'], rtol=1e-3)
+
+
+def test_run_pipeline_skips_broken_sets(monkeypatch):
+    directory = mkdtemp() + '/'
+    truncated = DEFAULT_MEAS[:DEFAULT_MEAS.index('[DataRaw]') + len('[DataRaw]\n')]
+    for name, text in [('reference000.asc', DEFAULT_MEAS), ('target000.asc', truncated.replace('reference', 'target')),
+                       ('darkcurrent000.asc', DEFAULT_MEAS.replace('reference', 'darkcurrent')),
+                       ('reference001.asc', DEFAULT_MEAS), ('target001.asc', DEFAULT_MEAS.replace('reference', 'target')),
+                       ('darkcurrent001.asc', DEFAULT_MEAS.replace('reference', 'darkcurrent'))]:
+        with open(directory + name, 'w') as fp:
+            fp.write(text)
+    monkeypatch.setattr(pipeline, 'evaluate_parsed', lambda reference, target, config, logger, plot: ({}, None))
+    monkeypatch.setattr(pipeline, 'result_row', lambda params, config, target_file: {'file': target_file})
+    kernel = CalibrationKernel(np.arange(0., 4000., 4.), np.ones(1000), [300., 900.], [1., 1.])
+    frame = run_pipeline(directory, dict(), output_file=directory + 'results.csv', kernel=kernel)
+    assert list(frame['file']) == [directory + 'target001.asc']
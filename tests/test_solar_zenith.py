@@ -1,7 +1,9 @@
 import ephem
-from datetime import datetime
-from numpy.testing import assert_approx_equal
-from evaluation.processing.solar_zenith import get_sun_zenith
+import numpy as np
+from datetime import datetime, timedelta
+from numpy.testing import assert_approx_equal, assert_allclose
+from evaluation.processing.solar_zenith import get_sun_zenith, sun_geometry, julian_day
+from evaluation.processing.atmospheric_mass import get_atmospheric_path_length, get_ozone_path_length
 
 
 def test_get_sun_zenith():
@@ -13,3 +15,54 @@ def test_get_sun_zenith():
     utc_time = datetime.strptime('2016-07-11 12:55:25', '%Y-%m-%d %H:%M:%S')
     angle = get_sun_zenith(utc_time, obs_lat, obs_lon)
     assert_approx_equal(angle, 90 - 57.76, significant=2)
+
+
+def test_julian_day():
+    assert julian_day(datetime(2000, 1, 1, 12)) == 2451545.0
+    assert_allclose(julian_day(np.datetime64('2016-07-11T00:00')), 2457580.5)
+
+
+def test_sun_geometry_scalar():
+    utc_time = datetime.strptime('2016-07-11 12:55:25', '%Y-%m-%d %H:%M:%S')
+    geometry = sun_geometry(utc_time, 48.085148, 11.2738613)
+    assert_approx_equal(geometry['zenith'], 90 - 57.76, significant=3)
+    assert_allclose(geometry['airmass'], get_atmospheric_path_length(geometry['zenith']))
+    assert_allclose(geometry['ozone_path'], get_ozone_path_length(geometry['zenith']))
+
+
+def test_sun_geometry_against_ephem():
+    sites = [(48.148, 11.573, 533), (48.08617, 11.2797, 590), (-33.9, 18.4, 0)]
+    for day in [datetime(2016, 7, 11), datetime(2015, 12, 21), datetime(2020, 3, 1)]:
+        times = [day + timedelta(minutes=15 * i) for i in range(96)]
+        for lat, lon, el in sites:
+            geometry = sun_geometry(times, lat, lon, el)
+            observer = ephem.Observer()
+            observer.lat, observer.lon, observer.elevation = str(lat), str(lon), el
+            zenith, azimuth = [], []
+            for utc_time in times:
+                observer.date = utc_time
+                sun = ephem.Sun(observer)
+                zenith.append(90 - np.degrees(float(sun.alt)))
+                azimuth.append(np.degrees(float(sun.az)))
+            zenith, azimuth = np.array(zenith), np.array(azimuth)
+            day_light = zenith < 85
+            assert_allclose(geometry['zenith'][day_light], zenith[day_light], atol=0.02)
+            assert_allclose(geometry['azimuth'][day_light], azimuth[day_light], atol=0.05)
+
+
+def test_sun_geometry_broadcasts_sites():
+    utc_time = datetime(2016, 7, 11, 11)
+    lats = np.array([48.148, 48.08617])
+    lons = np.array([11.573, 11.2797])
+    geometry = sun_geometry(utc_time, lats, lons)
+    assert geometry['zenith'].shape == (2,)
+    for i in range(2):
+        assert_allclose(geometry['zenith'][i], sun_geometry(utc_time, lats[i], lons[i])['zenith'])
+
+
+def test_atmospheric_mass_arrays():
+    zenith = np.array([0., 40., 60., 80.])
+    AM = get_atmospheric_path_length(zenith)
+    assert AM.shape == zenith.shape
+    assert_allclose(AM[1], get_atmospheric_path_length(40.))
+    assert np.all(np.diff(AM) > 0)
@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pytest
+from tempfile import mkdtemp
+from numpy.testing import assert_array_equal
+from evaluation.processing.wasi_reader import get_wasi_store, get_wasi_parameters, read_wasi_text, build_wasi_pack, load_wasi_pack
+
+
+def test_wasi_store_matches_text_tables():
+    store = get_wasi_store()
+    text = read_wasi_text()
+    for key, table in text.items():
+        assert_array_equal(store[key]['wave'], table['wave'])
+        assert_array_equal(store[key]['values'], table['values'])
+    assert get_wasi_store() is store
+    assert get_wasi_parameters()['e0']['values'] is store['e0']['values']
+    with pytest.raises(ValueError):
+        store['o3']['values'][0] = 0.
+
+
+def test_wasi_pack_roundtrip():
+    pack_file = os.path.join(mkdtemp(), 'wasi_pack.npz')
+    assert load_wasi_pack(pack_file) is None
+    build_wasi_pack(pack_file)
+    assert_array_equal(load_wasi_pack(pack_file)['wv']['values'], read_wasi_text()['wv']['values'])
+
+
+def test_corrupt_wasi_pack_ignored():
+    pack_file = os.path.join(mkdtemp(), 'wasi_pack.npz')
+    build_wasi_pack(pack_file)
+    with open(pack_file, 'rb') as fp:
+        head = fp.read(4096)
+    with open(pack_file, 'wb') as fp:
+        fp.write(head)
+    assert load_wasi_pack(pack_file) is None
+    build_wasi_pack(pack_file)
+    assert os.listdir(os.path.dirname(pack_file)) == ['wasi_pack.npz']
+    assert_array_equal(load_wasi_pack(pack_file)['o3']['values'], read_wasi_text()['o3']['values'])
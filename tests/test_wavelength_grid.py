@@ -0,0 +1,48 @@
+import numpy as np
+from numpy.testing import assert_allclose
+from evaluation.utils.wavelength_grid import GridRegistry
+
+
+def test_resampler_equals_numpy():
+    registry = GridRegistry()
+    xp = np.linspace(300., 900., 601)
+    fp = np.sin(xp / 30.)
+    x = np.linspace(250., 950., 1024)
+    assert_allclose(registry.resampler(x, xp)(fp), np.interp(x, xp, fp), rtol=0, atol=1e-12)
+    assert_allclose(registry.resampler(xp, xp)(fp), fp, rtol=0, atol=1e-12)
+
+
+def test_grids_are_interned():
+    registry = GridRegistry()
+    xp = np.linspace(300., 900., 601)
+    x = np.linspace(350., 750., 100)
+    assert registry.resampler(x.copy(), xp.copy()) is registry.resampler(x, xp)
+    assert len(registry.grids) == 2
+    assert len(registry.resamplers) == 1
+
+
+def test_bounded():
+    registry = GridRegistry(maxsize=2)
+    xp = np.linspace(300., 900., 601)
+    for stop in [500., 600., 700.]:
+        registry.resampler(np.linspace(350., stop, 10), xp)
+    assert len(registry.resamplers) == 2
+
+
+def test_in_place_change():
+    registry = GridRegistry()
+    xp = np.linspace(0., 10., 11)
+    fp = xp ** 2
+    x = np.linspace(0., 10., 5)
+    resampler = registry.resampler(x, xp)
+    x *= 0.5
+    assert registry.resampler(x, xp) is not resampler
+    assert_allclose(registry.resampler(x, xp)(fp), np.interp(x, xp, fp), rtol=0, atol=1e-12)
+    assert_allclose(resampler(fp), np.interp(x * 2, xp, fp), rtol=0, atol=1e-12)
+
+
+def test_grids_bounded():
+    registry = GridRegistry(maxsize=2)
+    for stop in range(10):
+        registry.intern(np.linspace(0., 100. + stop, 10))
+    assert len(registry.grids) == 4
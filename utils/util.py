@@ -1,3 +1,4 @@
+import os
 import numpy as np
 from scipy.constants import atmosphere
 from tempfile import mkstemp
@@ -22,3 +23,9 @@ def international_barometric_formula(height):
     T = 288.15  # Temperature [K]
     exponent = 5.255
     return p_0 * (1 - (a * height) / T) ** exponent
+
+
+def get_cache_directory(subdirectory=''):
+    """ Shared cache directory, IBSEN_CACHE_DIR or ~/.cache/ibsen_eval """
+    cache_dir = os.environ.get('IBSEN_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'ibsen_eval'))
+    return os.path.join(cache_dir, subdirectory)
@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+"""
+Wavelength grid registry
+
+Static tables (WASI) are resampled onto the same instrument grid over and
+over. The registry interns every distinct grid by a hash of its values and
+keeps the interpolation indices and weights per (source grid, target grid).
+Hashing costs more than a single np.interp: call resampler() once per
+instrument grid, keep the Resampler and apply it to every table on that grid
+(a gather and multiply, same result as np.interp). Tables resampled once per
+file use np.interp directly.
+"""
+
+
+class Resampler(object):
+    """ Linear interpolation from grid xp onto grid x, np.interp boundaries (constant extrapolation) """
+
+    def __init__(self, x, xp):
+        x = np.asarray(x, dtype=float)
+        xp = np.asarray(xp, dtype=float)
+        self.size = len(xp)
+        if self.size == 1:
+            self.index = np.zeros(x.shape, dtype=int)
+            self.weight = np.zeros(x.shape)
+            return
+        index = np.clip(np.searchsorted(xp, x, side='right') - 1, 0, self.size - 2)
+        step = xp[index + 1] - xp[index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(step > 0, (x - xp[index]) / step, 0.)
+        self.index = index
+        self.weight = np.clip(weight, 0., 1.)
+
+    def __call__(self, fp):
+        fp = np.asarray(fp)
+        if self.size == 1:
+            return fp[self.index].astype(float)
+        lower = fp[self.index]
+        return lower + self.weight * (fp[self.index + 1] - lower)
+
+
+class GridRegistry(object):
+    """ LRU bounded registry, shared between threads (ingest workers) """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.grids = OrderedDict()
+        self.resamplers = OrderedDict()
+        self.lock = threading.Lock()
+
+    def intern(self, wave):
+        """ Return: key of the grid (hash of its current values), equal grids share one key """
+        values = np.ascontiguousarray(wave, dtype=float)
+        key = hashlib.sha1(values.tobytes()).hexdigest()
+        with self.lock:
+            if key in self.grids:
+                self.grids[key] = self.grids.pop(key)
+            else:
+                values = values.copy()
+                values.flags.writeable = False
+                self.grids[key] = values
+                if len(self.grids) > 2 * self.maxsize:
+                    self.grids.popitem(last=False)
+        return key
+
+    def resampler(self, x, xp):
+        x = np.array(x, dtype=float)
+        xp = np.array(xp, dtype=float)
+        key = (self.intern(xp), self.intern(x))
+        with self.lock:
+            resampler = self.resamplers.pop(key, None)
+            if resampler is None:
+                resampler = Resampler(x, xp)
+                if len(self.resamplers) >= self.maxsize:
+                    self.resamplers.popitem(last=False)
+            self.resamplers[key] = resampler
+        return resampler
+
+    def clear(self):
+        with self.lock:
+            self.grids.clear()
+            self.resamplers.clear()
+
+
+registry = GridRegistry()